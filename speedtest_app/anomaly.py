@@ -0,0 +1,82 @@
+import math
+from django.conf import settings
+from django.db import transaction
+from .models import SpeedTestBaseline
+
+# Baseline column prefix -> SpeedTestResult field, and whether a higher value is worse
+METRICS = {
+    'download': ('download_speed', False),
+    'upload': ('upload_speed', False),
+    'ping': ('ping', True),
+}
+
+
+def _setting(name, default):
+    return getattr(settings, 'SPEEDTEST_ANOMALY_' + name, default)
+
+
+def is_degraded(baseline, result) -> bool:
+    """
+    Tells whether the result is far worse than the baseline of its server: download or upload
+    at least SPEEDTEST_ANOMALY_THRESHOLD standard deviations (and SPEEDTEST_ANOMALY_MIN_CHANGE
+    of the mean) below the mean, or ping as far above it. Baselines built from fewer than
+    SPEEDTEST_ANOMALY_MIN_SAMPLES results never flag anything.
+    """
+    if baseline.count < _setting('MIN_SAMPLES', 10):
+        return False
+    threshold = _setting('THRESHOLD', 3.0)
+    min_change = _setting('MIN_CHANGE', 0.2)
+    for prefix, (field, higher_is_worse) in METRICS.items():
+        mean = getattr(baseline, prefix + '_mean')
+        std = math.sqrt(getattr(baseline, prefix + '_var'))
+        deviation = getattr(result, field) - mean
+        if not higher_is_worse:
+            deviation = -deviation
+        if deviation > threshold * std and deviation > min_change * abs(mean):
+            return True
+    return False
+
+
+def update_baseline(baseline, result):
+    """
+    Folds one result into the exponentially weighted mean and variance of the baseline in O(1).
+    Until the baseline holds 1 / SPEEDTEST_ANOMALY_ALPHA results, plain averages are used,
+    so that the first results do not leave the mean close to zero.
+    """
+    baseline.count += 1
+    alpha = max(_setting('ALPHA', 0.1), 1 / baseline.count)
+    for prefix, (field, _) in METRICS.items():
+        mean = getattr(baseline, prefix + '_mean')
+        var = getattr(baseline, prefix + '_var')
+        diff = getattr(result, field) - mean
+        increment = alpha * diff
+        setattr(baseline, prefix + '_mean', mean + increment)
+        setattr(baseline, prefix + '_var', (1 - alpha) * (var + diff * increment))
+
+
+def flag_anomalies(results):
+    """
+    Sets is_anomaly on unsaved results by comparing each one with the baseline of its server,
+    then folds the results into the baselines. Results are processed in timestamp order; the
+    baselines of the touched servers are locked for the rest of the transaction, so concurrent
+    writers update them one after another. Costs a few queries per touched server, not per result.
+    Call it in the transaction that inserts the results, so that the baselines only change with them.
+    """
+    if not results:
+        return
+    results = sorted(results, key=lambda r: r.timestamp)
+    with transaction.atomic():
+        servers = {r.server_name for r in results}
+        baselines = {b.server_name: b for b in
+                     SpeedTestBaseline.objects.select_for_update().filter(server_name__in=servers)}
+        for result in results:
+            baseline = baselines.get(result.server_name)
+            if baseline is None:
+                baseline, _ = SpeedTestBaseline.objects.get_or_create(server_name=result.server_name)
+                # Another writer may have created it first; lock it like the others
+                baseline = SpeedTestBaseline.objects.select_for_update().get(pk=baseline.pk)
+                baselines[result.server_name] = baseline
+            result.is_anomaly = is_degraded(baseline, result)
+            update_baseline(baseline, result)
+        for baseline in baselines.values():
+            baseline.save()
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class SpeedtestAppConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "speedtest_app"
+
+    def ready(self):
+        # Registers the model signal handlers
+        from . import signals  # noqa: F401
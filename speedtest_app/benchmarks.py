@@ -0,0 +1,345 @@
+import io
+import json
+import os
+import platform
+import random
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from unittest import mock
+import django
+import speedtest
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from .discovery import server_cache
+from .measurement import perform_speed_test
+from .models import SpeedTestResult
+from .partitions import ensure_partitions_for
+from .utils import BufferedResultWriter, SpeedTestAnalyzer, SpeedTestBatchAnalyzer, SpeedTestLogger, np
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+
+
+def synthetic_records(count, seed=0):
+    # Log entries in the SpeedTestAnalyzer.to_dict() format, one minute apart
+    rng = random.Random(seed)
+    start = timezone.now() - timedelta(minutes=count)
+    for i in range(count):
+        analyzer = SpeedTestAnalyzer(rng.uniform(5, 500), rng.uniform(1, 100), rng.uniform(2, 150))
+        record = analyzer.to_dict()
+        record['timestamp'] = (start + timedelta(minutes=i)).isoformat()
+        yield record
+
+
+def populate_history(size):
+    # Replaces the stored results with size synthetic ones, unless there are already that many
+    if SpeedTestResult.objects.count() == size:
+        return
+    SpeedTestResult.objects.all().delete()
+    ensure_partitions_for(datetime.fromisoformat(r['timestamp']) for r in synthetic_records(size))
+    # bulk_create skips the post_save receivers, so no rollups are built for the history
+    SpeedTestResult.objects.bulk_create(
+        (SpeedTestResult(timestamp=datetime.fromisoformat(r['timestamp']),
+                         download_speed=r['download_speed'], upload_speed=r['upload_speed'],
+                         ping=r['ping'], server_name='Bench', server_country='PL')
+         for r in synthetic_records(size)),
+        batch_size=5000,
+    )
+
+
+class FakeOpener:
+    # Serves every request with a body of size bytes
+    def __init__(self, size):
+        self.size = size
+
+    def open(self, request, *args, **kwargs):
+        return io.BytesIO(b"x" * self.size)
+
+
+class FakeSpeedtest:
+    """
+    Offline stand-in for speedtest.Speedtest with constant, instant results. Subclasses change
+    the servers, their latency() and the measured speeds through the class attributes.
+    """
+    servers = [{'id': 1, 'name': 'Bench', 'country': 'PL', 'url': 'http://bench.test/speedtest/upload.php'}]
+    download_bps = 250_000_000
+    upload_bps = 50_000_000
+    upload_sizes = [250_000]
+    # Requests per download and upload, each reported to the progress callback
+    requests = 4
+    # Body size of every download request
+    response_bytes = 0
+
+    def __init__(self, *args, **kwargs):
+        self.config = {'client': {'ip': '127.0.0.1'}, 'sizes': {'upload': list(self.upload_sizes)},
+                       'counts': {'upload': len(self.upload_sizes)}}
+        self._opener = FakeOpener(self.response_bytes)
+        self._secure = False
+        self._best = {}
+        self.results = speedtest.SpeedtestResults(client=self.config['client'])
+
+    def latency(self, server) -> float:
+        return 12.5
+
+    def get_best_server(self, servers=None):
+        # Like speedtest-cli, sets the latency on the chosen server in place
+        servers = servers or [dict(s) for s in self.servers]
+        best = min(servers, key=self.latency)
+        best['latency'] = self.latency(best)
+        self.results.ping = best['latency']
+        self.results.server = best
+        self._best.update(best)
+        return best
+
+    def download(self, callback=speedtest.do_nothing):
+        for i in range(self.requests):
+            self._opener.open(f"download-{i}").read()
+            callback(i, self.requests, end=True)
+        return self.download_bps
+
+    def upload(self, callback=speedtest.do_nothing):
+        for i in range(self.requests):
+            callback(i, self.requests, end=True)
+        return self.upload_bps
+
+
+class Scenario:
+    """
+    A benchmark scenario. setup() prepares the history for a size outside of the timing,
+    run() performs the measured work and returns the number of operations it did.
+    """
+    name = None
+    uses_db = False
+    sized = True
+
+    def __init__(self, workdir):
+        self.workdir = workdir
+
+    def setup(self, size):
+        pass
+
+    def run(self) -> int:
+        raise NotImplementedError
+
+    def teardown(self):
+        pass
+
+
+class JsonAppendScenario(Scenario):
+    # Cost of one log_to_json() append on an existing JSON array log, which is rewritten every time
+    name = 'log_json_append'
+    appends = 10
+    json_lines = False
+    extension = '.json'
+
+    def setup(self, size):
+        self.path = os.path.join(self.workdir, f'{self.name}{self.extension}')
+        logger = SpeedTestLogger(json_lines=self.json_lines)
+        logger.log_many_to_json(list(synthetic_records(size)), file_path=self.path)
+        self.logger = logger
+        self.record = next(synthetic_records(1, seed=1))
+
+    def run(self):
+        for _ in range(self.appends):
+            self.logger.log_to_json(self.record, file_path=self.path)
+        return self.appends
+
+    def teardown(self):
+        for path in (self.path, self.path + '.lock'):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class JsonLinesAppendScenario(JsonAppendScenario):
+    # The same appends on a JSON Lines log, which only appends one line
+    name = 'log_jsonl_append'
+    appends = 1000
+    json_lines = True
+    extension = '.jsonl'
+
+
+class BufferedWriterScenario(Scenario):
+    # Submitting size results to the background writer and waiting until they are on disk
+    name = 'buffered_writer'
+
+    def setup(self, size):
+        self.records = list(synthetic_records(size))
+        self.json_path = os.path.join(self.workdir, 'buffered.jsonl')
+        self.csv_path = os.path.join(self.workdir, 'buffered.csv')
+
+    def run(self):
+        writer = BufferedResultWriter(SpeedTestLogger(json_lines=True), json_path=self.json_path,
+                                      csv_path=self.csv_path)
+        for record in self.records:
+            writer.submit(record)
+        writer.close()
+        return len(self.records)
+
+    def teardown(self):
+        for path in (self.json_path, self.csv_path, self.json_path + '.lock', self.csv_path + '.lock'):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class ExportScenario(Scenario):
+    # Streaming the whole history through export_results; the history is generated once per size
+    name = 'export_json'
+    format = 'json'
+    uses_db = True
+
+    def setup(self, size):
+        populate_history(size)
+        self.size = size
+        self.client = Client()
+
+    def run(self):
+        response = self.client.get(reverse('speedtest_app:export_results', args=[self.format]))
+        for _ in response.streaming_content:
+            pass
+        return self.size
+
+
+class CsvExportScenario(ExportScenario):
+    name = 'export_csv'
+    format = 'csv'
+
+
+class AnalyzerScenario(Scenario):
+    # Scoring results one by one with SpeedTestAnalyzer
+    name = 'analyzer'
+
+    def setup(self, size):
+        self.records = [(r['download_speed'], r['upload_speed'], r['ping']) for r in synthetic_records(size)]
+
+    def run(self):
+        for download, upload, ping in self.records:
+            SpeedTestAnalyzer(download, upload, ping).summary()
+        return len(self.records)
+
+
+class BatchAnalyzerScenario(AnalyzerScenario):
+    # Scoring the same results as columns with SpeedTestBatchAnalyzer
+    name = 'batch_analyzer'
+
+    def run(self):
+        downloads, uploads, pings = zip(*self.records)
+        analyzer = SpeedTestBatchAnalyzer(downloads, uploads, pings)
+        analyzer.summary_codes()
+        analyzer.statistics()
+        return len(self.records)
+
+
+class MeasurementScenario(Scenario):
+    # End-to-end perform_speed_test() overhead with an instant fake speedtest backend
+    name = 'measurement'
+    uses_db = True
+    sized = False
+    runs = 50
+
+    def run(self):
+        cwd = os.getcwd()
+        os.chdir(self.workdir)
+        try:
+            with mock.patch('speedtest.Speedtest', FakeSpeedtest), \
+                    override_settings(SPEEDTEST_LOG_BUFFERED=False):
+                server_cache.invalidate()
+                for _ in range(self.runs):
+                    perform_speed_test()
+        finally:
+            server_cache.invalidate()
+            os.chdir(cwd)
+        return self.runs
+
+
+SCENARIOS = {scenario.name: scenario for scenario in (
+    JsonAppendScenario, JsonLinesAppendScenario, BufferedWriterScenario, ExportScenario,
+    CsvExportScenario, AnalyzerScenario, BatchAnalyzerScenario, MeasurementScenario,
+)}
+
+
+@contextmanager
+def _traced():
+    tracemalloc.start()
+    try:
+        yield
+    finally:
+        tracemalloc.stop()
+
+
+def run_scenario(scenario, size, repeat=3) -> dict:
+    """
+    Times scenario.run() repeat times for the given history size and keeps the fastest run,
+    then measures the peak memory of one more run under tracemalloc (which slows it down).
+    """
+    scenario.setup(size)
+    try:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            ops = scenario.run()
+            elapsed = time.perf_counter() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        with _traced():
+            scenario.run()
+            peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        scenario.teardown()
+    return {
+        'scenario': scenario.name,
+        'size': size,
+        'ops': ops,
+        'seconds': best,
+        'ops_per_sec': ops / best if best > 0 else None,
+        'peak_memory_bytes': peak,
+    }
+
+
+def environment(connection) -> dict:
+    # Describes where the benchmark ran, stored next to the results
+    return {
+        'timestamp': timezone.now().isoformat(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'numpy': np.__version__ if np is not None else None,
+        'database': connection.vendor,
+        'platform': platform.platform(),
+    }
+
+
+# Report metrics compared by find_regressions(): metric -> whether a higher value is better
+REGRESSION_METRICS = {'ops_per_sec': True, 'peak_memory_bytes': False, 'p99_ms': False}
+
+
+def find_regressions(results, baseline, tolerance=0.2) -> list:
+    """
+    Compares results with the results of a saved baseline run. A scenario regressed when its
+    throughput dropped, or its peak memory or p99 latency grew, by more than the tolerance
+    (a fraction). Scenarios and metrics missing from the baseline are ignored.
+    """
+    previous = {(r['scenario'], r['size']): r for r in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        before = previous.get((result['scenario'], result['size']))
+        if before is None:
+            continue
+        for metric, higher_is_better in REGRESSION_METRICS.items():
+            old, new = before.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            if (new < old * (1 - tolerance)) if higher_is_better else (new > old * (1 + tolerance)):
+                regressions.append({'scenario': result['scenario'], 'size': result['size'], 'metric': metric,
+                                    'baseline': old, 'current': new})
+    return regressions
+
+
+def load_report(path) -> dict:
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_report(path, report):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
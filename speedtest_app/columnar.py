@@ -0,0 +1,204 @@
+import json
+import mmap
+import struct
+import sys
+import tempfile
+from array import array
+from datetime import datetime, timezone
+from .utils import np
+
+MAGIC = b'STCOL\x00\x01\x00'
+# Column data starts at multiples of this many bytes, so every column can be viewed in place
+ALIGNMENT = 8
+SPOOL_CHUNK_ROWS = 10_000
+READ_CHUNK_SIZE = 1024 * 1024
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Exported column -> (array typecode, NumPy dtype); all values are little-endian
+COLUMNS = {
+    'id': ('q', '<i8'),
+    'timestamp': ('q', '<i8'),  # Microseconds since the Unix epoch, UTC
+    'download_speed': ('d', '<f8'),
+    'upload_speed': ('d', '<f8'),
+    'ping': ('d', '<f8'),
+    'server_name': ('i', '<i4'),  # Index into the "server_name" dictionary
+    'server_country': ('i', '<i4'),  # Index into the "server_country" dictionary
+    'is_anomaly': ('B', '|u1'),
+}
+DICTIONARY_COLUMNS = ('server_name', 'server_country')
+# SpeedTestResult fields read for the snapshot, in COLUMNS order
+FIELDS = list(COLUMNS)
+
+
+def _padding(size):
+    return b'\0' * (-size % ALIGNMENT)
+
+
+class SnapshotWriter:
+    """
+    Builds a columnar snapshot of (id, timestamp, download, upload, ping, server name,
+    server country, is_anomaly) rows: add() the rows, then write out the bytes of chunks().
+
+    Layout: MAGIC, a little-endian uint32 header length, a JSON header (row count, column
+    dtypes/offsets and the dictionaries of the text columns) and the columns, each one
+    contiguous and 8-byte aligned. Rows are spooled column by column to temporary files,
+    so memory use does not depend on the number of rows.
+    """
+    def __init__(self):
+        self.count = 0
+        self._spools = {name: tempfile.TemporaryFile() for name in COLUMNS}
+        self._dictionaries = {name: {} for name in DICTIONARY_COLUMNS}
+        self._chunk = {name: array(typecode) for name, (typecode, _) in COLUMNS.items()}
+
+    def add(self, row):
+        values = dict(zip(FIELDS, row))
+        values['timestamp'] = _epoch_microseconds(values['timestamp'])
+        for name in DICTIONARY_COLUMNS:
+            codes = self._dictionaries[name]
+            values[name] = codes.setdefault(values[name], len(codes))
+        for name, column in self._chunk.items():
+            column.append(values[name])
+        self.count += 1
+        if len(self._chunk['id']) >= SPOOL_CHUNK_ROWS:
+            self._spool()
+
+    def _spool(self):
+        for name, column in self._chunk.items():
+            if sys.byteorder == 'big':
+                column.byteswap()
+            column.tofile(self._spools[name])
+            del column[:]
+
+    def chunks(self):
+        # Yields the snapshot as bytes chunks and removes the spooled columns
+        try:
+            self._spool()
+            columns = []
+            offset = 0
+            for name, (typecode, dtype) in COLUMNS.items():
+                length = self.count * array(typecode).itemsize
+                columns.append({'name': name, 'dtype': dtype, 'offset': offset, 'length': length})
+                offset += length + len(_padding(length))
+            header = json.dumps({
+                'rows': self.count,
+                'timestamp_unit': 'us',
+                'columns': columns,
+                'dictionaries': {name: list(codes) for name, codes in self._dictionaries.items()},
+            }, ensure_ascii=False).encode()
+            # The column offsets are relative to the end of the padded header
+            header += b' ' * (-(len(MAGIC) + 4 + len(header)) % ALIGNMENT)
+
+            yield MAGIC + struct.pack('<I', len(header)) + header
+            for name in COLUMNS:
+                spool = self._spools[name]
+                size = spool.tell()
+                spool.seek(0)
+                while True:
+                    data = spool.read(READ_CHUNK_SIZE)
+                    if not data:
+                        break
+                    yield data
+                yield _padding(size)
+        finally:
+            self.close()
+
+    def close(self):
+        for spool in self._spools.values():
+            spool.close()
+
+
+def write_snapshot(rows):
+    # Generates the snapshot of the rows as bytes chunks, for a streaming response or a file
+    writer = SnapshotWriter()
+    try:
+        for row in rows:
+            writer.add(row)
+    except BaseException:
+        writer.close()
+        raise
+    yield from writer.chunks()
+
+
+async def awrite_snapshot(rows):
+    # Async version of write_snapshot() for rows from an async iterator
+    writer = SnapshotWriter()
+    try:
+        async for row in rows:
+            writer.add(row)
+    except BaseException:
+        writer.close()
+        raise
+    for chunk in writer.chunks():
+        yield chunk
+
+
+def _epoch_microseconds(timestamp):
+    # Exact integer arithmetic; datetime.timestamp() would round through a float
+    delta = timestamp - _EPOCH
+    return (delta.days * 86_400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+class ColumnarSnapshot:
+    """
+    Read-only view of a columnar snapshot file. The file is memory-mapped and every column
+    is returned as a view on the mapping without copying: a NumPy array when NumPy is
+    installed and a typed memoryview otherwise. Use as a context manager, or call close()
+    once the columns are no longer used. NumPy columns that are still referenced keep the
+    mapping open until they are garbage collected.
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buffer = memoryview(self._mmap)
+        self._views = []
+        if bytes(self._buffer[:len(MAGIC)]) != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a speed test snapshot")
+        (header_length,) = struct.unpack_from('<I', self._buffer, len(MAGIC))
+        start = len(MAGIC) + 4
+        self.header = json.loads(bytes(self._buffer[start:start + header_length]))
+        self._data_start = start + header_length
+        self._columns = {column['name']: column for column in self.header['columns']}
+        self.dictionaries = self.header['dictionaries']
+
+    def __len__(self):
+        return self.header['rows']
+
+    def column(self, name):
+        spec = self._columns[name]
+        start = self._data_start + spec['offset']
+        if np is not None:
+            view = np.frombuffer(self._buffer, dtype=spec['dtype'], count=len(self), offset=start)
+        else:
+            if sys.byteorder == 'big':
+                raise RuntimeError("Reading snapshots without NumPy needs a little-endian machine")
+            view = self._buffer[start:start + spec['length']].cast(COLUMNS[name][0])
+        self._views.append(view)
+        return view
+
+    def decode(self, name, code):
+        # The text value of a dictionary-encoded column
+        return self.dictionaries[name][code]
+
+    def close(self):
+        # Views must be released before the mapping can be closed
+        for view in self._views:
+            if isinstance(view, memoryview):
+                view.release()
+        self._views = []
+        try:
+            self._buffer.release()
+            self._mmap.close()
+        except BufferError:
+            # NumPy arrays still export the buffer; the mapping is closed once they are gone
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def open_snapshot(path) -> ColumnarSnapshot:
+    return ColumnarSnapshot(path)
@@ -0,0 +1,13 @@
+# Defaults of settings that speedtest_project/settings.py sets and the code falls back to
+# when they are missing, so both agree. Kept free of Django imports so that the settings
+# module can import it.
+
+# Log results to speedtest_results.jsonl (one JSON object per line) instead of a JSON array
+JSON_LINES = True
+# Write the result logs from a background thread in batches
+LOG_BUFFERED = True
+
+# Largest /results/bulk/ request body accepted as sent
+BULK_MAX_UPLOAD_BYTES = 32 * 1024 * 1024
+# Largest body of a gzip-compressed upload (Content-Encoding: gzip) once decompressed
+BULK_MAX_BYTES = 64 * 1024 * 1024
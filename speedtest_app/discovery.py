@@ -0,0 +1,148 @@
+import copy
+import logging
+import threading
+import time
+import speedtest
+from django.conf import settings
+from .metrics import PhaseTimer
+
+logger = logging.getLogger(__name__)
+
+# speedtest-cli counts every failed latency probe as 3600 s, so an average this high
+# means that at least one probe to the server failed
+UNREACHABLE_LATENCY_MS = 600_000
+
+
+class _Discovery:
+    def __init__(self, speedtest_instance, best):
+        self.speedtest = speedtest_instance
+        self.best = dict(best)
+        self.created = time.monotonic()
+
+
+class SpeedtestServerCache:
+    """
+    Process-wide cache of the speedtest.net configuration, server list and best server.
+
+    A fresh cache hit skips the config and server list downloads and probes only the cached
+    best server, which still yields an up-to-date ping. Entries live for
+    SPEEDTEST_SERVER_CACHE_TTL seconds (0 disables the cache) and are refreshed on a background
+    thread once they are older than SPEEDTEST_SERVER_CACHE_REFRESH (a fraction of the TTL).
+    """
+    def __init__(self, factory=None):
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._discover_lock = threading.Lock()
+        self._entry = None
+        self._refreshing = False
+
+    @property
+    def ttl(self) -> float:
+        return getattr(settings, 'SPEEDTEST_SERVER_CACHE_TTL', 3600)
+
+    @property
+    def refresh_after(self) -> float:
+        return getattr(settings, 'SPEEDTEST_SERVER_CACHE_REFRESH', 0.8)
+
+    def invalidate(self):
+        # Forgets the cached discovery, so that the next run starts from scratch
+        with self._lock:
+            self._entry = None
+
+    def prepare(self, timer=None):
+        """
+        Returns a Speedtest instance whose best server is selected and pinged,
+        ready for download() and upload(), together with the best server itself.
+        If given, timer (a metrics.PhaseTimer) receives the "config" and "best_server" phases.
+        """
+        timer = timer or PhaseTimer()
+        if self.ttl > 0:
+            st = self._from_cache(timer)
+            if st is not None:
+                return st, st.results.server
+
+            with self._discover_lock:
+                # Another thread may have finished a discovery while this one was waiting
+                st = self._from_cache(timer)
+                if st is not None:
+                    return st, st.results.server
+                entry = self._discover(timer)
+                with self._lock:
+                    self._entry = entry
+                return self._copy(entry.speedtest), entry.best
+
+        entry = self._discover(timer)
+        return entry.speedtest, entry.best
+
+    @staticmethod
+    def _copy(st):
+        # Per-run copy: the server list and HTTP opener are shared with the cached instance,
+        # while the config gets its own copy because download() adjusts the upload thread count
+        run = copy.copy(st)
+        run.config = copy.deepcopy(st.config)
+        return run
+
+    def _new_speedtest(self):
+        # Resolved on every call, so that the speedtest backend can be swapped out
+        factory = self._factory or speedtest.Speedtest
+        return factory()
+
+    def _discover(self, timer) -> _Discovery:
+        # Downloads the config and server list and probes the closest servers
+        with timer.phase('config'):
+            st = self._new_speedtest()
+        with timer.phase('best_server'):
+            best = st.get_best_server()
+        return _Discovery(st, best)
+
+    def _current(self):
+        # Returns the cached discovery if it has not expired and schedules a refresh when it is getting old
+        with self._lock:
+            entry = self._entry
+            if entry is None:
+                return None
+            age = time.monotonic() - entry.created
+            if age >= self.ttl:
+                self._entry = None
+                return None
+            start_refresh = age >= self.ttl * self.refresh_after and not self._refreshing
+            if start_refresh:
+                self._refreshing = True
+
+        if start_refresh:
+            threading.Thread(target=self._refresh_in_background, name='speedtest-server-refresh',
+                             daemon=True).start()
+        return entry
+
+    def _refresh_in_background(self):
+        try:
+            # Not part of any speed test, so kept out of the phase metrics
+            entry = self._discover(PhaseTimer(observe=False))
+        except Exception as e:
+            logger.warning(f"Speedtest server refresh failed: {str(e)}")
+        else:
+            with self._lock:
+                self._entry = entry
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _from_cache(self, timer):
+        entry = self._current()
+        if entry is None:
+            return None
+
+        # Fresh results and server selection for this run
+        st = self._copy(entry.speedtest)
+        st._best = {}
+        st.results = speedtest.SpeedtestResults(client=st.config['client'], opener=st._opener, secure=st._secure)
+        with timer.phase('best_server'):
+            best = st.get_best_server(servers=[dict(entry.best)])
+        if best['latency'] >= UNREACHABLE_LATENCY_MS:
+            logger.warning(f"Cached speedtest server {best.get('name')} is unreachable, discovering again")
+            self.invalidate()
+            return None
+        return st
+
+
+server_cache = SpeedtestServerCache()
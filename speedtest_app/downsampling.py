@@ -0,0 +1,116 @@
+def _bucket(index, count, buckets):
+    # Bucket of the index-th of count points when they are split into equally sized buckets
+    return min(index * buckets // count, buckets - 1)
+
+
+def _x(timestamp):
+    return timestamp.timestamp()
+
+
+def lttb(rows, count, threshold) -> list:
+    """
+    Downsamples (timestamp, value) points, ordered by timestamp, to at most threshold points
+    with Largest-Triangle-Three-Buckets, which keeps the visual shape of the series, spikes included.
+
+    rows is a callable returning a fresh iterator over the points and count their number.
+    The points are read twice: once for the average of every bucket and once to select
+    the point of each bucket, so memory use depends on threshold only.
+    """
+    if count <= threshold:
+        return list(rows())
+    if threshold < 3:
+        raise ValueError("threshold must be at least 3")
+
+    # The first and the last point are always kept; the others are split into threshold - 2 buckets
+    inner = count - 2
+    buckets = threshold - 2
+    sums = [[0.0, 0.0, 0] for _ in range(buckets)]
+    last = None
+    for index, (timestamp, value) in enumerate(rows()):
+        if index >= count:
+            break
+        last = (timestamp, value)
+        if 0 < index <= inner:
+            total = sums[_bucket(index - 1, inner, buckets)]
+            total[0] += _x(timestamp)
+            total[1] += value
+            total[2] += 1
+    if last is None:
+        # The rows were deleted in the meantime
+        return []
+    averages = [(x / n, y / n) if n else None for x, y, n in sums]
+    last_x, last_y = _x(last[0]), last[1]
+
+    selected = []
+    current = -1
+    best = best_area = None
+    a_x = a_y = next_avg = None
+    for index, point in enumerate(rows()):
+        if index == 0:
+            selected.append(point)
+            a_x, a_y = _x(point[0]), point[1]
+            continue
+        if index > inner:
+            break
+        bucket = _bucket(index - 1, inner, buckets)
+        if bucket != current:
+            if best is not None:
+                selected.append(best)
+                a_x, a_y = _x(best[0]), best[1]
+            current = bucket
+            best = best_area = None
+            # The point of this bucket forms the largest triangle with the previous selection
+            # and the average of the next bucket (the last point for the final bucket)
+            following = averages[bucket + 1] if bucket + 1 < buckets else None
+            next_avg = following or (last_x, last_y)
+        timestamp, value = point
+        x = _x(timestamp)
+        area = abs((a_x - next_avg[0]) * (value - a_y) - (a_x - x) * (next_avg[1] - a_y))
+        if best_area is None or area > best_area:
+            best, best_area = point, area
+    if best is not None:
+        selected.append(best)
+    selected.append(last)
+    return selected
+
+
+def min_max(rows, count, threshold) -> list:
+    """
+    Downsamples (timestamp, value) points, ordered by timestamp, to at most threshold points
+    by keeping the minimum and the maximum of threshold // 2 equally sized buckets, in time order.
+    The points are read once and only the current bucket's extremes are kept in memory.
+    """
+    if count <= threshold:
+        return list(rows())
+    if threshold < 2:
+        raise ValueError("threshold must be at least 2")
+
+    buckets = threshold // 2
+    selected = []
+    current = -1
+    low = high = None
+
+    def flush():
+        if low is not None:
+            selected.extend(sorted({low, high}, key=lambda point: point[0]))
+
+    for index, point in enumerate(rows()):
+        if index >= count:
+            break
+        bucket = _bucket(index, count, buckets)
+        if bucket != current:
+            flush()
+            current = bucket
+            low = high = point
+        elif point[1] < low[1]:
+            low = point
+        elif point[1] > high[1]:
+            high = point
+    flush()
+    return selected
+
+
+ALGORITHMS = {
+    'lttb': lttb,
+    'minmax': min_max,
+}
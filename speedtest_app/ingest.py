@@ -0,0 +1,166 @@
+import json
+import math
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .anomaly import flag_anomalies
+from .models import SpeedTestResult
+from .notify import announce_new_results
+from .page_cache import invalidate_index_page
+from .partitions import ensure_partitions_for, insert_with_partitions
+from .rollups import record_results
+
+REQUIRED_FIELDS = ('probe_id', 'timestamp', 'download_speed', 'upload_speed', 'ping')
+NUMBER_FIELDS = ('download_speed', 'upload_speed', 'ping')
+TEXT_FIELDS = ('server_name', 'server_location', 'server_country')
+DEFAULT_BATCH_SIZE = 1000
+# Probe id given to results imported from the local JSON/CSV logs, so that they are deduplicated too
+LEGACY_PROBE_ID = 'legacy'
+
+
+def build_result(record) -> SpeedTestResult:
+    """
+    Validates one reported measurement and returns an unsaved SpeedTestResult.
+    The record is a dict, or the JSON text of one (a JSON Lines line).
+    Raises ValueError describing the first problem found.
+    """
+    if isinstance(record, (str, bytes)):
+        try:
+            record = json.loads(record)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON: {e.msg}")
+    if not isinstance(record, dict):
+        raise ValueError("Record must be a JSON object")
+
+    missing = [field for field in REQUIRED_FIELDS if record.get(field) in (None, '')]
+    if missing:
+        raise ValueError(f"Missing fields: {', '.join(missing)}")
+
+    values = {}
+    for field in NUMBER_FIELDS:
+        value = record[field]
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value) or value < 0:
+            raise ValueError(f"{field} must be a non-negative number")
+        values[field] = float(value)
+
+    try:
+        timestamp = parse_datetime(str(record['timestamp']))
+    except ValueError:
+        timestamp = None
+    if timestamp is None:
+        raise ValueError("timestamp must be an ISO 8601 datetime")
+    if timezone.is_naive(timestamp):
+        timestamp = timezone.make_aware(timestamp)
+
+    for field in ('probe_id',) + TEXT_FIELDS:
+        value = record.get(field, '')
+        if not isinstance(value, str):
+            raise ValueError(f"{field} must be a string")
+        max_length = SpeedTestResult._meta.get_field(field).max_length
+        if len(value) > max_length:
+            raise ValueError(f"{field} is longer than {max_length} characters")
+        values[field] = value
+
+    return SpeedTestResult(timestamp=timestamp, **values)
+
+
+def _existing_keys(results):
+    # Returns the (probe id, timestamp) pairs of the batch that are already stored, in one query
+    if not results:
+        return set()
+    probe_ids = {r.probe_id for r in results}
+    timestamps = [r.timestamp for r in results]
+    return set(
+        SpeedTestResult.objects
+        .filter(probe_id__in=probe_ids, timestamp__range=(min(timestamps), max(timestamps)))
+        .values_list('probe_id', 'timestamp')
+        .order_by()
+    )
+
+
+def ingest_records(records, batch_size=DEFAULT_BATCH_SIZE) -> dict:
+    """
+    Validates a batch of reported measurements in a single pass, drops duplicates
+    (by probe id and timestamp, within the batch and against the database) and inserts
+    the rest with bulk_create in one transaction. Rollups are updated per bucket.
+    Returns the number of inserted and duplicate rows and the per-row rejects.
+    """
+    results = []
+    rejected = []
+    seen = set()
+    duplicates = 0
+    for index, record in enumerate(records):
+        try:
+            result = build_result(record)
+        except ValueError as e:
+            rejected.append({'index': index, 'error': str(e)})
+            continue
+        key = (result.probe_id, result.timestamp)
+        if key in seen:
+            duplicates += 1
+            continue
+        seen.add(key)
+        results.append(result)
+
+    def store():
+        existing = _existing_keys(results) & seen
+        stored = [r for r in results if (r.probe_id, r.timestamp) not in existing]
+        # bulk_create sends no pre_save/post_save signals, so anomalies, rollups and cached pages are handled here
+        flag_anomalies(stored)
+        ensure_partitions_for(r.timestamp for r in stored)
+        SpeedTestResult.objects.bulk_create(stored, batch_size=batch_size)
+        record_results(stored)
+        if stored:
+            transaction.on_commit(invalidate_index_page)
+            announce_new_results()
+        return stored
+
+    stored = insert_with_partitions(store, [r.timestamp for r in results])
+    duplicates += len(results) - len(stored)
+
+    return {
+        'inserted': len(stored),
+        'duplicates': duplicates,
+        'rejected': rejected,
+    }
+
+
+def legacy_record(record, probe_id=LEGACY_PROBE_ID):
+    """
+    Maps one entry of the speedtest_results.json/.csv logs (SpeedTestAnalyzer.to_dict() format)
+    to an ingest record. CSV values are strings, so the numbers are converted here;
+    anything that is not a valid record is passed on unchanged and rejected by build_result().
+    """
+    if not isinstance(record, dict):
+        return record
+    mapped = {field: record.get(field) for field in ('timestamp',) + NUMBER_FIELDS + TEXT_FIELDS
+              if record.get(field) is not None}
+    for field in NUMBER_FIELDS:
+        if isinstance(mapped.get(field), str):
+            try:
+                mapped[field] = float(mapped[field])
+            except ValueError:
+                pass
+    mapped['probe_id'] = probe_id
+    return mapped
+
+
+def import_records(records, probe_id=LEGACY_PROBE_ID, batch_size=DEFAULT_BATCH_SIZE, start=0):
+    """
+    Imports an iterable of log entries in batches of batch_size, skipping the first start entries.
+    Yields (position, summary) after each batch, where position is the number of entries consumed
+    so far, so that the caller can checkpoint and resume an interrupted import from there.
+    Only one batch is held in memory at a time.
+    """
+    position = 0
+    batch = []
+    for record in records:
+        position += 1
+        if position <= start:
+            continue
+        batch.append(legacy_record(record, probe_id))
+        if len(batch) >= batch_size:
+            yield position, ingest_records(batch, batch_size=batch_size)
+            batch = []
+    if batch:
+        yield position, ingest_records(batch, batch_size=batch_size)
@@ -0,0 +1,201 @@
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+from . import metrics
+from .models import SpeedTestJob
+from .progress import progress_hub
+from .utils import FileLock
+
+logger = logging.getLogger(__name__)
+
+# Key of the PostgreSQL advisory lock that serializes starting speed tests
+SINGLE_FLIGHT_LOCK_ID = 0x5EED7E57
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+class ImmediateExecutor:
+    """
+    Executor that runs submitted callables in the calling thread.
+    Used for tests and debugging, where a background pool is not wanted.
+    """
+    def submit(self, fn, *args, **kwargs) -> Future:
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def shutdown(self, wait=True):
+        pass
+
+
+def _init_process_worker():
+    # Spawned worker processes start from a clean interpreter, so Django has to be set up again
+    import django
+    django.setup()
+
+
+def get_executor():
+    """
+    Returns the process-wide executor configured by SPEEDTEST_JOB_EXECUTOR
+    ("thread", "process" or "sync") and SPEEDTEST_JOB_WORKERS.
+    """
+    kind = getattr(settings, 'SPEEDTEST_JOB_EXECUTOR', 'thread')
+    workers = getattr(settings, 'SPEEDTEST_JOB_WORKERS', 2)
+    key = (kind, workers)
+    with _executors_lock:
+        if key not in _executors:
+            if kind == 'thread':
+                _executors[key] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='speedtest-job')
+            elif kind == 'process':
+                _executors[key] = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_process_worker,
+                )
+            elif kind == 'sync':
+                _executors[key] = ImmediateExecutor()
+            else:
+                raise ValueError(f"Unknown speed test job executor: {kind}")
+        return _executors[key]
+
+
+def run_job(job_id, progress=None):
+    """
+    Runs the speed test for the given job and records its outcome on the job row.
+    Executed inside a pool worker, never on the request path. If given, progress(event, data)
+    receives the measurement progress followed by a final "result" or "failed" event.
+    """
+    from .measurement import perform_speed_test
+
+    SpeedTestJob.objects.filter(pk=job_id).update(
+        status=SpeedTestJob.STATUS_RUNNING, started_at=timezone.now()
+    )
+    try:
+        payload = perform_speed_test(progress=progress)
+    except Exception as e:
+        logger.error(f"Speed test error: {str(e)}")
+        SpeedTestJob.objects.filter(pk=job_id).update(
+            status=SpeedTestJob.STATUS_FAILED, error=str(e), finished_at=timezone.now()
+        )
+        metrics.jobs.inc(status=SpeedTestJob.STATUS_FAILED)
+        if progress is not None:
+            progress('failed', {'success': False, 'error': str(e)})
+    else:
+        SpeedTestJob.objects.filter(pk=job_id).update(
+            status=SpeedTestJob.STATUS_DONE, result=payload, finished_at=timezone.now()
+        )
+        metrics.jobs.inc(status=SpeedTestJob.STATUS_DONE)
+        if progress is not None:
+            progress('result', {'success': True, **payload})
+
+
+def _run_pooled_job(job_id, progress=None):
+    try:
+        run_job(job_id, progress=progress)
+    except Exception:
+        logger.exception("Speed test job %s crashed", job_id)
+    finally:
+        # Pool workers outlive requests, so stale connections have to be released by hand
+        close_old_connections()
+
+
+@contextmanager
+def single_flight_lock():
+    """
+    Serializes the "is a speed test already running?" check across threads, processes
+    and gunicorn workers: a transaction-scoped advisory lock on PostgreSQL, and a file lock
+    (SPEEDTEST_LOCK_FILE) on other databases.
+    """
+    if connection.vendor == 'postgresql':
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(%s)", [SINGLE_FLIGHT_LOCK_ID])
+            yield
+    else:
+        path = getattr(settings, 'SPEEDTEST_LOCK_FILE', os.path.join(tempfile.gettempdir(), 'speedtest_app.lock'))
+        with FileLock(path):
+            yield
+
+
+ACTIVE_STATUSES = (SpeedTestJob.STATUS_QUEUED, SpeedTestJob.STATUS_RUNNING)
+STALE_JOB_ERROR = "The speed test did not finish in time; its worker may have stopped"
+
+
+def _stale_before():
+    return timezone.now() - timedelta(seconds=getattr(settings, 'SPEEDTEST_JOB_STALE_AFTER', 300))
+
+
+def is_stale(job) -> bool:
+    # A queued or running job older than SPEEDTEST_JOB_STALE_AFTER seconds
+    return job.status in ACTIVE_STATUSES and job.created_at < _stale_before()
+
+
+def fail_stale_jobs() -> int:
+    """
+    Marks the stale jobs as failed: their worker died or the server restarted, so they would
+    otherwise stay queued or running forever. Returns the number of jobs marked.
+    """
+    stale = SpeedTestJob.objects.filter(status__in=ACTIVE_STATUSES, created_at__lt=_stale_before())
+    # Checked with a read first: on SQLite even an UPDATE that matches nothing takes the write lock
+    if not stale.exists():
+        return 0
+    count = stale.update(status=SpeedTestJob.STATUS_FAILED, error=STALE_JOB_ERROR, finished_at=timezone.now())
+    if count:
+        metrics.jobs.inc(count, status=SpeedTestJob.STATUS_FAILED)
+    return count
+
+
+def find_shared_job():
+    """
+    Returns the job a new caller should join instead of starting a measurement: one that is
+    still queued or running, or one that finished less than SPEEDTEST_MIN_INTERVAL seconds ago.
+    Stale jobs are marked as failed first, so nobody joins a job whose worker died.
+    """
+    now = timezone.now()
+    fail_stale_jobs()
+    active = SpeedTestJob.objects.filter(status__in=ACTIVE_STATUSES).first()
+    if active is not None:
+        return active
+
+    min_interval = getattr(settings, 'SPEEDTEST_MIN_INTERVAL', 0)
+    if min_interval:
+        return SpeedTestJob.objects.filter(
+            status=SpeedTestJob.STATUS_DONE,
+            finished_at__gte=now - timedelta(seconds=min_interval),
+        ).order_by('-finished_at').first()
+    return None
+
+
+def submit_job():
+    """
+    Hands a speed test to the worker pool and returns immediately with (job, created).
+    While a test is in progress (or a recent result may be reused) the existing job is
+    returned instead, so concurrent callers share one measurement of the uplink.
+    """
+    with single_flight_lock():
+        job = find_shared_job()
+        if job is not None:
+            return job, False
+        job = SpeedTestJob.objects.create()
+
+    executor = get_executor()
+    if isinstance(executor, ImmediateExecutor):
+        executor.submit(run_job, job.pk, progress_hub.publisher(job.pk))
+    elif isinstance(executor, ThreadPoolExecutor):
+        executor.submit(_run_pooled_job, job.pk, progress_hub.publisher(job.pk))
+    else:
+        # Worker processes cannot reach this process' progress hub; clients poll the job row
+        executor.submit(_run_pooled_job, job.pk)
+    return job, True
@@ -0,0 +1,218 @@
+import asyncio
+import os
+import random
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from unittest import mock
+from django.conf import settings
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.test import override_settings
+from django.urls import reverse
+from .benchmarks import FakeSpeedtest
+from .discovery import server_cache
+from .measurement import get_result_writer
+from .models import SpeedTestJob
+from .percentiles import exact_quantile
+
+# Endpoint name -> (HTTP method, URL name, URL arguments)
+ENDPOINTS = {
+    'index': ('GET', 'speedtest_app:index', ()),
+    'check_speed': ('POST', 'speedtest_app:check_speed', ()),
+    'export_results': ('GET', 'speedtest_app:export_results', ('json',)),
+}
+DEFAULT_MIX = 'index=8,check_speed=1,export_results=1'
+SERVERS = ('wsgi', 'asgi')
+
+
+def parse_mix(value) -> dict:
+    # Parses "index=8,check_speed=1" into endpoint weights; raises ValueError for anything else
+    mix = {}
+    for part in value.split(','):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint {name!r} (use {', '.join(ENDPOINTS)})")
+        mix[name] = float(weight or 1)
+        if not mix[name] >= 0:
+            raise ValueError(f"Invalid weight for {name}: {weight}")
+    if not any(mix.values()):
+        raise ValueError("The mix needs at least one endpoint with a positive weight")
+    return {name: weight for name, weight in mix.items() if weight}
+
+
+def slow_speedtest(latency):
+    """
+    Returns a FakeSpeedtest class whose server selection, download and upload each take
+    latency seconds, so speed test jobs hold their workers like a (scaled down) real test.
+    """
+    class SlowSpeedtest(FakeSpeedtest):
+        def get_best_server(self, servers=None):
+            time.sleep(latency)
+            return super().get_best_server(servers)
+
+        def download(self, callback=None):
+            time.sleep(latency)
+            return super().download(callback)
+
+        def upload(self, callback=None):
+            time.sleep(latency)
+            return super().upload(callback)
+
+    return SlowSpeedtest
+
+
+class _QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def serve(kind):
+    """
+    Serves the project from a background thread of this process on a free local port and
+    yields its (host, port): "wsgi" through Django's threaded WSGI server (as runserver does),
+    "asgi" through Uvicorn. Running in-process lets the fake speedtest backend apply to it.
+    """
+    if kind == 'wsgi':
+        from django.core.wsgi import get_wsgi_application
+        server = ThreadedWSGIServer(('127.0.0.1', 0), _QuietRequestHandler, allow_reuse_address=False)
+        server.set_app(get_wsgi_application())
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            yield server.server_address[:2]
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+    elif kind == 'asgi':
+        import uvicorn
+        from django.core.asgi import get_asgi_application
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        server = uvicorn.Server(uvicorn.Config(get_asgi_application(), lifespan='off', log_level='warning',
+                                               access_log=False))
+        thread = threading.Thread(target=server.run, kwargs={'sockets': [sock]}, daemon=True)
+        thread.start()
+        while not server.started and thread.is_alive():
+            time.sleep(0.01)
+        try:
+            yield sock.getsockname()[:2]
+        finally:
+            server.should_exit = True
+            thread.join()
+            sock.close()
+    else:
+        raise ValueError(f"Unknown server: {kind}")
+
+
+async def fetch(host, port, method, path) -> int:
+    # One HTTP/1.1 request on a fresh connection; returns the status once the whole body is read
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nContent-Length: 0\r\n"
+                     f"Connection: close\r\n\r\n".encode('ascii'))
+        await writer.drain()
+        status_line = await reader.readline()
+        while await reader.read(65536):
+            pass
+    finally:
+        writer.close()
+    return int(status_line.split()[1])
+
+
+async def drive(address, mix, concurrency, duration, timeout=30, seed=0):
+    """
+    Sends requests from concurrency simulated users for duration seconds. Every user picks
+    the next endpoint at random by its weight in mix and sends it as soon as the previous
+    response is complete (a closed loop). Returns the statistics per endpoint and the
+    elapsed seconds.
+    """
+    urls = {name: reverse(ENDPOINTS[name][1], args=ENDPOINTS[name][2]) for name in mix}
+    names, weights = list(mix), list(mix.values())
+    stats = {name: {'latencies': [], 'errors': 0, 'statuses': {}} for name in names}
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + duration
+
+    async def user(rng):
+        while loop.time() < deadline:
+            name = rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                status = str(await asyncio.wait_for(fetch(*address, ENDPOINTS[name][0], urls[name]), timeout))
+            except asyncio.TimeoutError:
+                status = 'timeout'
+            except (OSError, ValueError, IndexError):
+                # Refused or reset connections and malformed responses
+                status = 'connection_error'
+            endpoint = stats[name]
+            endpoint['latencies'].append(time.perf_counter() - started)
+            endpoint['statuses'][status] = endpoint['statuses'].get(status, 0) + 1
+            if not status.isdigit() or int(status) >= 400:
+                endpoint['errors'] += 1
+
+    started = loop.time()
+    await asyncio.gather(*(user(random.Random(seed + i)) for i in range(concurrency)))
+    return stats, loop.time() - started
+
+
+def summarize(stats, elapsed) -> dict:
+    latencies = sorted(stats['latencies'])
+    requests = len(latencies)
+    return {
+        'requests': requests,
+        'errors': stats['errors'],
+        'error_rate': stats['errors'] / requests if requests else None,
+        'ops_per_sec': requests / elapsed if elapsed > 0 else None,
+        'p50_ms': exact_quantile(latencies, 0.5) * 1000 if latencies else None,
+        'p99_ms': exact_quantile(latencies, 0.99) * 1000 if latencies else None,
+        'statuses': stats['statuses'],
+    }
+
+
+def wait_for_jobs(timeout=60):
+    # Lets the speed test jobs started by the load finish before the database goes away
+    deadline = time.monotonic() + timeout
+    active = SpeedTestJob.objects.filter(status__in=[SpeedTestJob.STATUS_QUEUED, SpeedTestJob.STATUS_RUNNING])
+    while active.exists() and time.monotonic() < deadline:
+        time.sleep(0.1)
+
+
+def run_load_test(server, mix, concurrency, duration, latency=0.5, timeout=30, seed=0) -> list:
+    """
+    Load-tests one entry point ("wsgi" or "asgi") with the request mix and returns one result
+    per endpoint, in the format of the benchmark reports: the scenario is "<server>:<endpoint>"
+    and the concurrency takes the place of the size. Speed tests run against slow_speedtest(latency)
+    in the thread pool, since worker processes would not see the fake backend.
+    """
+    executor = getattr(settings, 'SPEEDTEST_JOB_EXECUTOR', 'thread')
+    with mock.patch('speedtest.Speedtest', slow_speedtest(latency)), \
+            override_settings(SPEEDTEST_JOB_EXECUTOR='thread' if executor == 'process' else executor), \
+            serve(server) as address, \
+            override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, address[0]]):
+        server_cache.invalidate()
+        try:
+            stats, elapsed = asyncio.run(drive(address, mix, concurrency, duration, timeout, seed))
+            wait_for_jobs()
+            # Buffered log lines have to be written before the caller leaves the working directory
+            get_result_writer().flush()
+        finally:
+            server_cache.invalidate()
+    return [{'scenario': f'{server}:{name}', 'size': concurrency, 'server': server, 'endpoint': name,
+             'concurrency': concurrency, 'seconds': elapsed, **summarize(stats[name], elapsed)}
+            for name in mix]
+
+
+@contextmanager
+def working_directory(path):
+    # Result logs of the speed test jobs are written to the current directory
+    cwd = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(cwd)
@@ -0,0 +1,35 @@
+from django.core.management.base import CommandError
+from speedtest_app.benchmarks import find_regressions, load_report
+
+
+def add_baseline_arguments(parser, regression):
+    # regression describes what counts as a regression in the --tolerance help
+    parser.add_argument("--baseline", help="Results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help=f"Fraction by which {regression} before it is a regression")
+
+
+def read_baseline(options):
+    # Read before the run, so that a wrong path fails before any time is spent
+    if not options["baseline"]:
+        return None
+    try:
+        return load_report(options["baseline"])
+    except (OSError, ValueError) as e:
+        raise CommandError(f"Cannot read baseline {options['baseline']}: {e}")
+
+
+def check_regressions(command, results, baseline, options, size_label="size"):
+    """
+    Reports the results that regressed against the baseline on the command's stderr and
+    fails the command if there are any. size_label names the size column of the results.
+    """
+    if baseline is None:
+        return
+    regressions = find_regressions(results, baseline, options["tolerance"])
+    for r in regressions:
+        command.stderr.write(f"REGRESSION {r['scenario']} ({size_label} {r['size']}): {r['metric']} "
+                             f"{r['baseline']:.6g} -> {r['current']:.6g}")
+    if regressions:
+        raise CommandError(f"{len(regressions)} regressions against {options['baseline']}")
+    command.stdout.write(command.style.SUCCESS(f"No regressions against {options['baseline']}"))
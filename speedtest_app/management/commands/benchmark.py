@@ -0,0 +1,67 @@
+import os
+import tempfile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+from speedtest_app.benchmarks import DEFAULT_SIZES, SCENARIOS, environment, run_scenario, save_report
+from ._baseline import add_baseline_arguments, check_regressions, read_baseline
+
+
+class Command(BaseCommand):
+    help = ("Benchmarks result logging, export and analysis on synthetic histories and reports "
+            "the throughput and peak memory of every scenario. Database scenarios run against a "
+            "throwaway test database, so stored results are never touched.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES),
+                            help="Comma-separated history sizes, e.g. 1000,10000,100000,1000000")
+        parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                            help=f"Comma-separated scenarios out of: {', '.join(SCENARIOS)}")
+        parser.add_argument("--repeat", type=int, default=3, help="Timed runs per scenario; the fastest is kept")
+        parser.add_argument("--output", default="benchmark_results.json")
+        add_baseline_arguments(parser, "throughput may drop or peak memory grow")
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options["sizes"].split(",") if size.strip()]
+        except ValueError:
+            raise CommandError("--sizes must be a comma-separated list of integers")
+        names = [name.strip() for name in options["scenarios"].split(",") if name.strip()]
+        unknown = [name for name in names if name not in SCENARIOS]
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(unknown)}")
+        if not sizes or min(sizes) < 1 or options["repeat"] < 1:
+            raise CommandError("--sizes and --repeat must be positive")
+        baseline = read_baseline(options)
+
+        uses_db = any(SCENARIOS[name].uses_db for name in names)
+        if uses_db:
+            setup_test_environment()
+            old_config = setup_databases(verbosity=0, interactive=False, aliases={"default"})
+        try:
+            with tempfile.TemporaryDirectory() as workdir:
+                results = self.run_scenarios(names, sizes, workdir, options["repeat"])
+            report = {'environment': environment(connection), 'results': results}
+        finally:
+            if uses_db:
+                teardown_databases(old_config, verbosity=0)
+                teardown_test_environment()
+
+        save_report(options["output"], report)
+        self.stdout.write(f"Results written to {os.path.abspath(options['output'])}")
+
+        check_regressions(self, results, baseline, options)
+
+    def run_scenarios(self, names, sizes, workdir, repeat):
+        results = []
+        self.stdout.write(f"{'scenario':<18} {'size':>9} {'ops/s':>14} {'peak memory':>14}")
+        for name in names:
+            scenario = SCENARIOS[name](workdir)
+            # Scenarios whose cost does not depend on the history size run once
+            for size in (sizes if scenario.sized else [None]):
+                result = run_scenario(scenario, size, repeat=repeat)
+                results.append(result)
+                self.stdout.write(f"{name:<18} {size if size is not None else '-':>9} "
+                                  f"{result['ops_per_sec'] or 0:>14,.1f} "
+                                  f"{result['peak_memory_bytes'] / 1024 / 1024:>11,.2f} MB")
+        return results
@@ -0,0 +1,25 @@
+import os
+from django.core.management.base import BaseCommand, CommandError
+from speedtest_app.utils import convert_json_to_jsonl
+
+
+class Command(BaseCommand):
+    help = "Converts the JSON array result log into an append-only JSON Lines log."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--source", default="speedtest_results.json")
+        parser.add_argument("--target", default="speedtest_results.jsonl")
+
+    def handle(self, *args, **options):
+        source = options["source"]
+        target = options["target"]
+        if not os.path.exists(source):
+            raise CommandError(f"{source} does not exist")
+        if os.path.exists(target) and os.path.getsize(target) > 0:
+            raise CommandError(f"{target} already exists and is not empty")
+
+        try:
+            count = convert_json_to_jsonl(source, target)
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"Converted {count} records from {source} to {target}"))
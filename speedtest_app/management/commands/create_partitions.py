@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from speedtest_app.partitions import ensure_future_partitions, is_partitioned
+
+
+class Command(BaseCommand):
+    help = "Creates the monthly SpeedTestResult partitions of the current and the coming months."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--months-ahead", type=int, default=getattr(settings, 'SPEEDTEST_PARTITIONS_AHEAD', 3))
+
+    def handle(self, *args, **options):
+        if not is_partitioned():
+            raise CommandError("The results table is not partitioned; see SPEEDTEST_PARTITIONED")
+        created = ensure_future_partitions(options["months_ahead"])
+        for name in created:
+            self.stdout.write(f"Created {name}")
+        self.stdout.write(self.style.SUCCESS(f"{len(created)} partitions created"))
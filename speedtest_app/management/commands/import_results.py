@@ -0,0 +1,96 @@
+import json
+import os
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from speedtest_app.ingest import LEGACY_PROBE_ID, import_records
+from speedtest_app.utils import iter_csv, iter_json_array, iter_jsonl, write_atomic
+
+# Imported when no paths are given; results are logged to the JSON Lines file, older installs kept a JSON array
+DEFAULT_PATHS = ("speedtest_results.jsonl", "speedtest_results.json", "speedtest_results.csv")
+READERS = {
+    '.json': iter_json_array,
+    '.jsonl': iter_jsonl,
+    '.csv': iter_csv,
+}
+
+
+class Command(BaseCommand):
+    help = ("Imports the speedtest_results.json/.jsonl/.csv logs into SpeedTestResult. "
+            "The files are streamed, progress is checkpointed after every batch and "
+            "results that are already stored are skipped, so an interrupted import can simply be rerun.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="*",
+                            help="Log files to import (default: the speedtest_results.jsonl, .json and .csv found here)")
+        parser.add_argument("--batch-size", type=int,
+                            default=getattr(settings, 'SPEEDTEST_BULK_BATCH_SIZE', 1000))
+        parser.add_argument("--probe-id", default=LEGACY_PROBE_ID,
+                            help="Probe id stored with the imported results; used to detect duplicates")
+        parser.add_argument("--restart", action="store_true",
+                            help="Ignore existing checkpoints and read the files from the beginning")
+
+    def handle(self, *args, **options):
+        paths = options["paths"] or [p for p in DEFAULT_PATHS if os.path.exists(p)]
+        if not paths:
+            raise CommandError("No log files to import")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1")
+        for path in paths:
+            extension = os.path.splitext(path)[1].lower()
+            if extension not in READERS:
+                raise CommandError(f"{path}: unsupported file type, expected .json, .jsonl or .csv")
+            if not os.path.exists(path):
+                raise CommandError(f"{path} does not exist")
+
+        for path in paths:
+            self.import_file(path, **options)
+
+    def import_file(self, path, batch_size, probe_id, restart, **options):
+        checkpoint_path = path + ".import-checkpoint"
+        start = 0 if restart else self.read_checkpoint(checkpoint_path, path, probe_id)
+        if start:
+            self.stdout.write(f"{path}: resuming after {start} records")
+
+        records = READERS[os.path.splitext(path)[1].lower()](path)
+        totals = {'inserted': 0, 'duplicates': 0, 'rejected': 0}
+        previous = start
+        try:
+            for position, summary in import_records(records, probe_id=probe_id, batch_size=batch_size, start=start):
+                totals['inserted'] += summary['inserted']
+                totals['duplicates'] += summary['duplicates']
+                totals['rejected'] += len(summary['rejected'])
+                if options["verbosity"] >= 2:
+                    for reject in summary['rejected']:
+                        self.stderr.write(f"{path}: record {previous + reject['index'] + 1}: {reject['error']}")
+                self.write_checkpoint(checkpoint_path, path, probe_id, position)
+                previous = position
+        except ValueError as e:
+            # A JSON array that is cut short or not an array at all; the checkpoint keeps what was imported
+            raise CommandError(f"{path}: {e}")
+
+        # The whole file has been imported, so a later run starts from the beginning again
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        self.stdout.write(self.style.SUCCESS(
+            f"{path}: imported {totals['inserted']} results, "
+            f"skipped {totals['duplicates']} duplicates and {totals['rejected']} invalid records"
+        ))
+
+    @staticmethod
+    def read_checkpoint(checkpoint_path, path, probe_id) -> int:
+        # Number of records already imported from this file by an interrupted run
+        try:
+            with open(checkpoint_path, "r", encoding="utf-8") as f:
+                checkpoint = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        if checkpoint.get('probe_id') != probe_id or checkpoint.get('size', 0) > os.path.getsize(path):
+            # Imported under another probe id, or the file has been replaced since
+            return 0
+        return int(checkpoint.get('position', 0))
+
+    @staticmethod
+    def write_checkpoint(checkpoint_path, path, probe_id, position):
+        # Written atomically, so a crash never leaves a half-written checkpoint
+        write_atomic(checkpoint_path,
+                     json.dumps({'probe_id': probe_id, 'position': position, 'size': os.path.getsize(path)}))
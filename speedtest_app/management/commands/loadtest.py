@@ -0,0 +1,87 @@
+import importlib.util
+import os
+import tempfile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_databases, teardown_databases
+from speedtest_app.benchmarks import environment, populate_history, save_report
+from speedtest_app.loadtest import DEFAULT_MIX, SERVERS, parse_mix, run_load_test, working_directory
+from ._baseline import add_baseline_arguments, check_regressions, read_baseline
+
+
+class Command(BaseCommand):
+    help = ("Load-tests the web tier: serves the project through the WSGI and/or ASGI entry point "
+            "against a throwaway test database, with a fake speedtest backend of configurable latency, "
+            "and drives a weighted mix of concurrent requests from an asyncio client. Reports the "
+            "throughput, p50/p99 latency and error rate of every endpoint.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--servers", default=",".join(SERVERS),
+                            help="Comma-separated entry points to test: wsgi, asgi (needs uvicorn)")
+        parser.add_argument("--mix", default=DEFAULT_MIX,
+                            help="Comma-separated endpoint=weight pairs (index, check_speed, export_results)")
+        parser.add_argument("--concurrency", default="10",
+                            help="Comma-separated numbers of concurrent users, e.g. 1,10,50")
+        parser.add_argument("--duration", type=float, default=10, help="Seconds of load per server and concurrency")
+        parser.add_argument("--latency", type=float, default=0.5,
+                            help="Seconds the fake backend spends on each of server selection, download and upload")
+        parser.add_argument("--history", type=int, default=1000, help="Stored results the exports have to stream")
+        parser.add_argument("--timeout", type=float, default=30, help="Seconds before a request counts as failed")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", default="loadtest_results.json")
+        add_baseline_arguments(parser, "throughput may drop or p99 latency grow")
+
+    def handle(self, *args, **options):
+        servers = [name.strip() for name in options["servers"].split(",") if name.strip()]
+        unknown = [name for name in servers if name not in SERVERS]
+        if not servers or unknown:
+            raise CommandError(f"--servers must be a comma-separated list out of: {', '.join(SERVERS)}")
+        if "asgi" in servers and importlib.util.find_spec("uvicorn") is None:
+            raise CommandError("Testing the ASGI entry point needs uvicorn (pip install uvicorn)")
+        try:
+            mix = parse_mix(options["mix"])
+        except ValueError as e:
+            raise CommandError(f"Invalid --mix: {e}")
+        try:
+            levels = [int(level) for level in options["concurrency"].split(",") if level.strip()]
+        except ValueError:
+            raise CommandError("--concurrency must be a comma-separated list of integers")
+        if not levels or min(levels) < 1:
+            raise CommandError("--concurrency must be positive")
+        if options["duration"] <= 0 or options["timeout"] <= 0 or options["latency"] < 0 or options["history"] < 0:
+            raise CommandError("--duration and --timeout must be positive, --latency and --history not negative")
+        baseline = read_baseline(options)
+
+        with tempfile.TemporaryDirectory() as workdir:
+            if connection.vendor == "sqlite":
+                # An in-memory test database cannot take concurrent writers from the server threads
+                connection.settings_dict["TEST"]["NAME"] = os.path.join(workdir, "loadtest.sqlite3")
+            old_config = setup_databases(verbosity=0, interactive=False, aliases={"default"})
+            try:
+                populate_history(options["history"])
+                with working_directory(workdir):
+                    results = self.run_levels(servers, mix, levels, options)
+                report = {'environment': environment(connection), 'results': results}
+            finally:
+                connection.close()
+                teardown_databases(old_config, verbosity=0)
+
+        save_report(options["output"], report)
+        self.stdout.write(f"Results written to {os.path.abspath(options['output'])}")
+
+        check_regressions(self, results, baseline, options, size_label="concurrency")
+
+    def run_levels(self, servers, mix, levels, options):
+        results = []
+        self.stdout.write(f"{'server':<6} {'endpoint':<16} {'users':>6} {'requests':>9} {'req/s':>9} "
+                          f"{'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+        for server in servers:
+            for concurrency in levels:
+                for result in run_load_test(server, mix, concurrency, options["duration"], options["latency"],
+                                            options["timeout"], options["seed"]):
+                    results.append(result)
+                    self.stdout.write(f"{server:<6} {result['endpoint']:<16} {concurrency:>6} "
+                                      f"{result['requests']:>9} {result['ops_per_sec'] or 0:>9,.1f} "
+                                      f"{result['p50_ms'] or 0:>9,.1f} {result['p99_ms'] or 0:>9,.1f} "
+                                      f"{(result['error_rate'] or 0):>7.1%}")
+        return results
@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from speedtest_app.models import SpeedTestResult
+from speedtest_app.partitions import add_months, drop_partitions_before, is_partitioned, month_start
+
+
+class Command(BaseCommand):
+    help = ("Deletes the results of the months older than the retention period. On a partitioned "
+            "table whole monthly partitions are dropped; otherwise rows are deleted in batches.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--keep-months", type=int, default=getattr(settings, 'SPEEDTEST_RETENTION_MONTHS', None),
+                            help="Number of months to keep besides the current one (default: SPEEDTEST_RETENTION_MONTHS)")
+        parser.add_argument("--batch-size", type=int, default=10_000)
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        keep = options["keep_months"]
+        if keep is None:
+            raise CommandError("No retention period; set SPEEDTEST_RETENTION_MONTHS or pass --keep-months")
+        if keep < 0 or options["batch_size"] < 1:
+            raise CommandError("--keep-months must not be negative and --batch-size must be positive")
+        cutoff = add_months(month_start(timezone.now()), -keep)
+        old = SpeedTestResult.objects.filter(timestamp__lt=cutoff)
+
+        if options["dry_run"]:
+            self.stdout.write(f"Would delete {old.count()} results older than {cutoff:%Y-%m-%d}")
+            return
+
+        if is_partitioned():
+            dropped = drop_partitions_before(cutoff)
+            for name in dropped:
+                self.stdout.write(f"Dropped {name}")
+            self.stdout.write(self.style.SUCCESS(f"Dropped {len(dropped)} partitions older than {cutoff:%Y-%m-%d}"))
+            return
+
+        # Short batches keep every transaction small, instead of one huge DELETE
+        deleted = 0
+        while True:
+            ids = list(old.order_by().values_list('id', flat=True)[:options["batch_size"]])
+            if not ids:
+                break
+            deleted += SpeedTestResult.objects.filter(id__in=ids).delete()[0]
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} results older than {cutoff:%Y-%m-%d}"))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from speedtest_app.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Recomputes the hourly and daily SpeedTestRollup rows from all stored results."
+
+    def handle(self, *args, **options):
+        written = rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} rollup rows"))
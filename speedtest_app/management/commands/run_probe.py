@@ -0,0 +1,66 @@
+import socket
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from speedtest_app.probe import ProbeAgent, Spool
+
+
+class Command(BaseCommand):
+    help = ("Runs a headless probe: measures on a schedule with jitter, spools the results on disk "
+            "and uploads them in gzip-compressed batches to the /results/bulk/ endpoint of a central "
+            "instance whenever it is reachable. Needs no database.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--central-url", default=getattr(settings, 'SPEEDTEST_PROBE_CENTRAL_URL', ''),
+                            help="Base URL of the central instance (default: SPEEDTEST_PROBE_CENTRAL_URL); "
+                                 "without it results are only spooled")
+        parser.add_argument("--token", default=getattr(settings, 'SPEEDTEST_PROBE_TOKEN', ''),
+                            help="Bearer token of the central instance (its SPEEDTEST_INGEST_TOKEN)")
+        parser.add_argument("--probe-id", default=getattr(settings, 'SPEEDTEST_PROBE_ID', '') or socket.gethostname())
+        parser.add_argument("--spool-dir", default=getattr(settings, 'SPEEDTEST_PROBE_SPOOL_DIR', 'probe_spool'))
+        parser.add_argument("--max-spool-bytes", type=int,
+                            default=getattr(settings, 'SPEEDTEST_PROBE_SPOOL_MAX_BYTES', 16 * 1024 * 1024))
+        parser.add_argument("--batch-size", type=int, default=getattr(settings, 'SPEEDTEST_PROBE_BATCH_SIZE', 500))
+        parser.add_argument("--interval", type=float, default=getattr(settings, 'SPEEDTEST_PROBE_INTERVAL', 3600),
+                            help="Seconds between measurements")
+        parser.add_argument("--jitter", type=float, default=getattr(settings, 'SPEEDTEST_PROBE_JITTER', 300),
+                            help="Random extra delay of up to this many seconds before every measurement")
+        parser.add_argument("--ship-interval", type=float, default=60,
+                            help="Seconds between upload retries while results are waiting in the spool")
+        parser.add_argument("--once", action="store_true", help="Measure and upload once, then exit")
+        parser.add_argument("--ship-only", action="store_true", help="Upload the spooled results, then exit")
+
+    def handle(self, *args, **options):
+        if options["interval"] <= 0 or options["jitter"] < 0 or options["ship_interval"] <= 0:
+            raise CommandError("--interval and --ship-interval must be positive and --jitter must not be negative")
+        if options["batch_size"] < 1 or options["max_spool_bytes"] < 1:
+            raise CommandError("--batch-size and --max-spool-bytes must be positive")
+        if options["ship_only"] and not options["central_url"]:
+            raise CommandError("--ship-only needs --central-url")
+
+        agent = ProbeAgent(
+            Spool(options["spool_dir"], options["max_spool_bytes"]),
+            probe_id=options["probe_id"],
+            central_url=options["central_url"],
+            token=options["token"],
+            batch_size=options["batch_size"],
+        )
+        if options["ship_only"]:
+            self.report(agent, agent.ship())
+            return
+        if options["once"]:
+            if agent.measure_once() is None:
+                raise CommandError("The measurement failed")
+            self.report(agent, agent.ship())
+            return
+
+        self.stdout.write(f"Probe {options['probe_id']} measuring every {options['interval']:g}s "
+                          f"(+ up to {options['jitter']:g}s), spooling to {options['spool_dir']}")
+        try:
+            agent.run(options["interval"], options["jitter"], options["ship_interval"])
+        except KeyboardInterrupt:
+            pass
+
+    def report(self, agent, totals):
+        self.stdout.write(self.style.SUCCESS(
+            f"Uploaded {totals['inserted']} results ({totals['duplicates']} already stored, "
+            f"{totals['rejected']} rejected); {agent.spool.pending_bytes()} bytes waiting in the spool"))
@@ -0,0 +1,135 @@
+import multiprocessing
+import threading
+from django.conf import settings
+from . import defaults
+from .discovery import server_cache
+from .metrics import PhaseTimer
+from .partitions import insert_with_partitions
+from .progress import ThroughputSampler
+from .utils import BufferedResultWriter, SpeedTestAnalyzer, SpeedTestLogger
+from .models import SpeedTestResult
+
+
+def _result_logger() -> SpeedTestLogger:
+    return SpeedTestLogger(
+        json_lines=getattr(settings, 'SPEEDTEST_JSON_LINES', defaults.JSON_LINES),
+        max_bytes=getattr(settings, 'SPEEDTEST_LOG_MAX_BYTES', None),
+        max_age=getattr(settings, 'SPEEDTEST_LOG_MAX_AGE', None),
+    )
+
+
+_result_writer = None
+_result_writer_lock = threading.Lock()
+
+
+def get_result_writer() -> BufferedResultWriter:
+    # Process-wide background writer for the JSON and CSV result logs
+    global _result_writer
+    with _result_writer_lock:
+        if _result_writer is None:
+            _result_writer = BufferedResultWriter(
+                logger=_result_logger(),
+                batch_size=getattr(settings, 'SPEEDTEST_LOG_BATCH_SIZE', 100),
+                flush_interval=getattr(settings, 'SPEEDTEST_LOG_FLUSH_INTERVAL', 1.0),
+            )
+        return _result_writer
+
+
+def _log_buffered() -> bool:
+    # Worker processes of the "process" executor exit without running atexit handlers, so
+    # records still queued in their buffered writer would be lost; they write directly instead
+    buffered = getattr(settings, 'SPEEDTEST_LOG_BUFFERED', defaults.LOG_BUFFERED)
+    return buffered and multiprocessing.parent_process() is None
+
+
+def _run_phase(st, phase, progress):
+    # Runs st.download() or st.upload(), reporting throughput samples while it runs if asked to
+    if progress is None:
+        return getattr(st, phase)()
+    with ThroughputSampler(st, phase, progress) as sampler:
+        bits_per_second = getattr(st, phase)(callback=sampler.callback)
+    progress(phase, {'mbps': round(bits_per_second / 1_000_000, 2), 'progress': 1.0})
+    return bits_per_second
+
+
+def measure(timer=None, progress=None) -> dict:
+    """
+    Runs the speedtest.net measurement alone, without logging or storing it, and returns
+    download_speed and upload_speed (Mbps), ping (ms) and the server_name, server_location
+    and server_country of the server used. Phase durations are collected by timer, if given.
+    """
+    timer = timer or PhaseTimer(observe=False)
+
+    # Takes the config, server list and most optimal (lowest latency) server from the
+    # discovery cache; only the chosen server is pinged when the cache is fresh
+    st, server = server_cache.prepare(timer=timer)
+
+    # Formats the server's name and country for display and storage
+    server_full_location = f"{server['name']}, {server['country']}"
+    if progress is not None:
+        progress('ping', {'ping': round(st.results.ping, 2), 'server_location': server_full_location})
+
+    # Runs download and upload speed tests, converting from bits/sec to Mbps
+    try:
+        with timer.phase('download'):
+            download_speed = _run_phase(st, 'download', progress) / 1_000_000
+        with timer.phase('upload'):
+            upload_speed = _run_phase(st, 'upload', progress) / 1_000_000
+    except Exception:
+        # The cached best server may be gone; the next run discovers servers again
+        server_cache.invalidate()
+        raise
+
+    return {
+        'download_speed': download_speed,
+        'upload_speed': upload_speed,
+        'ping': st.results.ping,
+        'server_name': server['name'],
+        'server_location': server_full_location,
+        'server_country': server['country'],
+    }
+
+
+def perform_speed_test(progress=None) -> dict:
+    """
+    Performs an internet speed test, analyzes the results, stores them in the log files
+    and the database, and returns the measured values together with the analysis summary.
+    If given, progress(event, data) is called with the "ping" and then the "download"
+    and "upload" throughput samples while the test runs, possibly from other threads.
+    The duration of every phase is returned in seconds under "timings".
+    """
+    timer = PhaseTimer()
+    measured = measure(timer, progress)
+
+    # Analyzes results using a custom utility class
+    analyzer = SpeedTestAnalyzer(measured['download_speed'], measured['upload_speed'], measured['ping'],
+                                 **getattr(settings, 'SPEEDTEST_FAST_THRESHOLDS', {}))
+    analysis = analyzer.to_dict()
+
+    # Saves the results to the JSON and CSV files, in the background unless buffering is disabled
+    with timer.phase('log'):
+        if _log_buffered():
+            get_result_writer().submit(analysis)
+        else:
+            logger_instance = _result_logger()
+            logger_instance.log_to_json(analysis)
+            logger_instance.log_to_csv(analysis)
+
+    # Records the speed test results in the database. The pre_save signals fold the result into
+    # its server's baseline, which is rolled back with the insert's transaction if that fails
+    with timer.phase('db'):
+        result = SpeedTestResult(**measured)
+        insert_with_partitions(lambda: result.save(force_insert=True), [result.timestamp])
+
+    # Key metrics and a summary of the analysis, as returned to the client
+    return {
+        'download_speed': analysis['download_speed'],
+        'upload_speed': analysis['upload_speed'],
+        'ping': analysis['ping'],
+        'is_fast': analysis['is_fast'],
+        'summary': analysis['summary'],
+        'server_location': measured['server_location'],
+        # Flagged when the result is far worse than the usual results of this server
+        'is_anomaly': result.is_anomaly,
+        'timings': {name: round(seconds, 4) for name, seconds in timer.timings.items()},
+    }
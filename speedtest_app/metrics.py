@@ -0,0 +1,175 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+from django.utils.deprecation import MiddlewareMixin
+
+# Histogram bucket upper bounds, in seconds
+PHASE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Phases of a speed test request, in the order they run
+PHASES = ('submit', 'config', 'best_server', 'download', 'upload', 'log', 'db')
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    # Monotonic counter per label set
+    type = 'counter'
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name + '_total', key, value
+
+
+class Histogram:
+    # Cumulative bucket counts, sum and count of the observed values per label set
+    type = 'histogram'
+
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets) + (math.inf,)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels):
+        counts, _ = self._values.get(tuple(sorted(labels.items())), ([0], 0.0))
+        return counts[-1]
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        for key, (counts, total) in sorted(values.items()):
+            for bound, count in zip(self.buckets, counts):
+                yield self.name + '_bucket', key + (('le', _format_value(bound)),), count
+            yield self.name + '_sum', key, total
+            yield self.name + '_count', key, counts[-1]
+
+
+class Registry:
+    """
+    In-process metrics of this worker, rendered in the Prometheus text exposition format.
+    Each process keeps its own values; Prometheus sums them up across scraped workers.
+    """
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+phase_seconds = registry.register(Histogram(
+    'speedtest_phase_seconds', 'Duration of the phases of a speed test.', PHASE_BUCKETS))
+jobs = registry.register(Counter(
+    'speedtest_jobs', 'Finished speed test jobs by outcome.'))
+http_requests = registry.register(Counter(
+    'speedtest_http_requests', 'HTTP requests by view and status code.'))
+http_request_errors = registry.register(Counter(
+    'speedtest_http_request_errors', 'HTTP requests by view that failed with a server error.'))
+http_request_seconds = registry.register(Histogram(
+    'speedtest_http_request_seconds', 'Time until the response of a view was returned.', REQUEST_BUCKETS))
+
+
+class PhaseTimer:
+    """
+    Collects the duration of the named phases of one speed test. Unless observe is False,
+    every phase is also observed in the speedtest_phase_seconds histogram.
+    """
+    def __init__(self, observe=True):
+        self.timings = {}
+        self.observe = observe
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+        if self.observe:
+            phase_seconds.observe(seconds, phase=name)
+
+
+def server_timing(timings) -> str:
+    # Formats phase durations (seconds) as a Server-Timing header value, in milliseconds.
+    # Known phases come in PHASES order: timings read back from a jsonb column lose their key order
+    ordered = sorted(timings.items(), key=lambda item: PHASES.index(item[0]) if item[0] in PHASES else len(PHASES))
+    return ', '.join(f'{name};dur={seconds * 1000:.1f}' for name, seconds in ordered)
+
+
+class MetricsMiddleware(MiddlewareMixin):
+    """
+    Counts requests, server errors and response times per view (URL pattern name).
+    Requests that match no URL pattern are not counted. For streaming responses the time
+    until the response is returned is measured, not the time until the stream ends.
+    """
+    def process_request(self, request):
+        request._metrics_start = time.perf_counter()
+
+    def process_response(self, request, response):
+        match = getattr(request, 'resolver_match', None)
+        start = getattr(request, '_metrics_start', None)
+        if match is None or start is None:
+            return response
+        view = match.view_name
+        http_requests.inc(view=view, status=response.status_code)
+        # Unhandled exceptions in the view have already been turned into 500 responses here
+        if response.status_code >= 500:
+            http_request_errors.inc(view=view)
+        http_request_seconds.observe(time.perf_counter() - start, view=view)
+        return response
@@ -0,0 +1,71 @@
+# Generated by Django 5.2 on 2026-10-17 06:10
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+# The results table is already large and written to all the time. On PostgreSQL the indexes
+# are built with CREATE INDEX CONCURRENTLY, which does not block inserts; other databases
+# get a plain AddIndex.
+class AddIndexConcurrentlyOnPostgres(AddIndexConcurrently):
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "postgresql":
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+        else:
+            migrations.AddIndex.database_forwards(self, app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "postgresql":
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+        else:
+            migrations.AddIndex.database_backwards(self, app_label, schema_editor, from_state, to_state)
+
+
+# BRIN index on timestamp for append-mostly tables. It is tiny compared to a B-tree
+# and lets large range scans skip whole blocks. PostgreSQL only, and opt-in via
+# the SPEEDTEST_TIMESTAMP_BRIN_INDEX setting.
+def create_brin_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    if not getattr(settings, "SPEEDTEST_TIMESTAMP_BRIN_INDEX", False):
+        return
+    schema_editor.execute(
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS speedtest_ts_brin_idx "
+        "ON speedtest_app_speedtestresult USING brin (timestamp)"
+    )
+
+
+def drop_brin_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("DROP INDEX CONCURRENTLY IF EXISTS speedtest_ts_brin_idx")
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ("speedtest_app", "0003_speedtestjob"),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyOnPostgres(
+            model_name="speedtestresult",
+            index=models.Index(fields=["-timestamp"], name="speedtest_ts_desc_idx"),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name="speedtestresult",
+            index=models.Index(
+                fields=["server_country", "timestamp"], name="speedtest_country_ts_idx"
+            ),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name="speedtestresult",
+            index=models.Index(
+                fields=["server_name", "timestamp"], name="speedtest_server_ts_idx"
+            ),
+        ),
+        migrations.RunPython(create_brin_index, drop_brin_index),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2 on 2026-10-17 06:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("speedtest_app", "0004_speedtestresult_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SpeedTestRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("bucket_start", models.DateTimeField()),
+                (
+                    "granularity",
+                    models.CharField(
+                        choices=[("hour", "Hour"), ("day", "Day")], max_length=8
+                    ),
+                ),
+                ("server_name", models.CharField(blank=True, max_length=255)),
+                ("count", models.PositiveIntegerField(default=0)),
+                ("download_min", models.FloatField()),
+                ("download_max", models.FloatField()),
+                ("download_sum", models.FloatField(default=0)),
+                ("download_sumsq", models.FloatField(default=0)),
+                ("upload_min", models.FloatField()),
+                ("upload_max", models.FloatField()),
+                ("upload_sum", models.FloatField(default=0)),
+                ("upload_sumsq", models.FloatField(default=0)),
+                ("ping_min", models.FloatField()),
+                ("ping_max", models.FloatField()),
+                ("ping_sum", models.FloatField(default=0)),
+                ("ping_sumsq", models.FloatField(default=0)),
+            ],
+            options={
+                "ordering": ["granularity", "bucket_start", "server_name"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("granularity", "bucket_start", "server_name"),
+                        name="speedtest_rollup_bucket_uniq",
+                    )
+                ],
+            },
+        ),
+    ]
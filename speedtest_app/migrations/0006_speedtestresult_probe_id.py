@@ -0,0 +1,26 @@
+# Generated by Django 5.2 on 2026-10-17 06:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("speedtest_app", "0005_speedtestrollup"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="speedtestresult",
+            name="probe_id",
+            field=models.CharField(blank=True, default="", max_length=64),
+        ),
+        migrations.AddConstraint(
+            model_name="speedtestresult",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("probe_id", ""), _negated=True),
+                fields=("probe_id", "timestamp"),
+                name="speedtest_probe_ts_uniq",
+            ),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2 on 2026-10-17 06:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("speedtest_app", "0006_speedtestresult_probe_id"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SpeedTestBaseline",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "server_name",
+                    models.CharField(blank=True, max_length=255, unique=True),
+                ),
+                ("count", models.PositiveIntegerField(default=0)),
+                ("download_mean", models.FloatField(default=0)),
+                ("download_var", models.FloatField(default=0)),
+                ("upload_mean", models.FloatField(default=0)),
+                ("upload_var", models.FloatField(default=0)),
+                ("ping_mean", models.FloatField(default=0)),
+                ("ping_var", models.FloatField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "ordering": ["server_name"],
+            },
+        ),
+        migrations.AddField(
+            model_name="speedtestresult",
+            name="is_anomaly",
+            field=models.BooleanField(default=False),
+        ),
+    ]
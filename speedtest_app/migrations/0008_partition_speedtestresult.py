@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.db import migrations
+
+
+# Opt-in conversion of the results table into monthly range partitions on timestamp
+# (PostgreSQL only, SPEEDTEST_PARTITIONED). Old months can then be dropped whole by
+# "manage.py prune_results" instead of being deleted row by row. To convert a database
+# later, enable the setting and run "migrate speedtest_app 0007" followed by "migrate".
+def partition_results(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    if not getattr(settings, "SPEEDTEST_PARTITIONED", False):
+        return
+    from speedtest_app.partitions import convert_to_partitioned
+
+    convert_to_partitioned(
+        apps.get_model("speedtest_app", "SpeedTestResult"),
+        schema_editor,
+        months_ahead=getattr(settings, "SPEEDTEST_PARTITIONS_AHEAD", 3),
+    )
+    if getattr(settings, "SPEEDTEST_TIMESTAMP_BRIN_INDEX", False):
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS speedtest_ts_brin_idx "
+            "ON speedtest_app_speedtestresult USING brin (timestamp)"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("speedtest_app", "0007_speedtestbaseline_is_anomaly"),
+    ]
+
+    operations = [
+        # The partitioned table is kept when migrating backwards; the ORM works with both layouts
+        migrations.RunPython(partition_results, migrations.RunPython.noop),
+    ]
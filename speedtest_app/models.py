@@ -1,3 +1,4 @@
+import uuid
 from django.db import models
 from django.utils import timezone
 
@@ -9,6 +10,97 @@ class SpeedTestResult(models.Model):
     server_location = models.CharField(max_length=255, blank=True)
     server_name = models.CharField(max_length=255, blank=True)
     server_country = models.CharField(max_length=100, blank=True)
+    # Identifies the remote probe that reported the result; empty for local measurements
+    probe_id = models.CharField(max_length=64, blank=True, default='')
+    # Set when the result is saved if it is far worse than the usual results of its server
+    is_anomaly = models.BooleanField(default=False)
 
     class Meta:
-        ordering = ['-timestamp']
\ No newline at end of file
+        ordering = ['-timestamp']
+        constraints = [
+            # A probe reports each measurement once; retried uploads are deduplicated on this key
+            models.UniqueConstraint(fields=['probe_id', 'timestamp'], condition=~models.Q(probe_id=''),
+                                    name='speedtest_probe_ts_uniq'),
+        ]
+        indexes = [
+            # Latest results first: the index page and exports sort by -timestamp
+            models.Index(fields=['-timestamp'], name='speedtest_ts_desc_idx'),
+            models.Index(fields=['server_country', 'timestamp'], name='speedtest_country_ts_idx'),
+            models.Index(fields=['server_name', 'timestamp'], name='speedtest_server_ts_idx'),
+        ]
+
+
+class SpeedTestJob(models.Model):
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+
+class SpeedTestRollup(models.Model):
+    GRANULARITY_HOUR = 'hour'
+    GRANULARITY_DAY = 'day'
+    GRANULARITY_CHOICES = [
+        (GRANULARITY_HOUR, 'Hour'),
+        (GRANULARITY_DAY, 'Day'),
+    ]
+
+    bucket_start = models.DateTimeField()
+    granularity = models.CharField(max_length=8, choices=GRANULARITY_CHOICES)
+    server_name = models.CharField(max_length=255, blank=True)
+    count = models.PositiveIntegerField(default=0)
+    download_min = models.FloatField()
+    download_max = models.FloatField()
+    download_sum = models.FloatField(default=0)
+    download_sumsq = models.FloatField(default=0)
+    upload_min = models.FloatField()
+    upload_max = models.FloatField()
+    upload_sum = models.FloatField(default=0)
+    upload_sumsq = models.FloatField(default=0)
+    ping_min = models.FloatField()
+    ping_max = models.FloatField()
+    ping_sum = models.FloatField(default=0)
+    ping_sumsq = models.FloatField(default=0)
+
+    class Meta:
+        ordering = ['granularity', 'bucket_start', 'server_name']
+        constraints = [
+            models.UniqueConstraint(fields=['granularity', 'bucket_start', 'server_name'],
+                                    name='speedtest_rollup_bucket_uniq'),
+        ]
+
+
+class SpeedTestBaseline(models.Model):
+    """
+    Exponentially weighted mean and variance of the results of one server,
+    updated with every new result (see anomaly.py).
+    """
+    server_name = models.CharField(max_length=255, unique=True, blank=True)
+    count = models.PositiveIntegerField(default=0)
+    download_mean = models.FloatField(default=0)
+    download_var = models.FloatField(default=0)
+    upload_mean = models.FloatField(default=0)
+    upload_var = models.FloatField(default=0)
+    ping_mean = models.FloatField(default=0)
+    ping_var = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['server_name']
@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import select
+import threading
+import time
+from django.conf import settings
+from django.db import connection, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+# PostgreSQL notification channel announcing new speed test results
+CHANNEL = 'speedtest_results'
+
+
+class ResultNotifier:
+    """
+    Wakes up the coroutines waiting for new speed test results, such as /results/since/ long-polls.
+    notify() is thread-safe and wakes every waiter of this process; a waiter is an asyncio.Event
+    set on its own event loop, so a waiting request costs no thread. On PostgreSQL a listener
+    thread (started by the first subscriber) turns the NOTIFYs sent by announce_new_results()
+    in other processes, such as job workers, other web workers and bulk uploads, into notify() calls.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters = []
+        self._listener = None
+
+    def subscribe(self) -> asyncio.Event:
+        # Must be called from a coroutine; subscribe before checking for results, so no wake-up is missed
+        self._start_listener()
+        event = asyncio.Event()
+        with self._lock:
+            self._waiters.append((asyncio.get_running_loop(), event))
+        return event
+
+    def unsubscribe(self, event):
+        with self._lock:
+            self._waiters = [(loop, e) for loop, e in self._waiters if e is not event]
+
+    def notify(self):
+        with self._lock:
+            waiters = list(self._waiters)
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # The waiter's event loop is already closed
+                pass
+
+    def _start_listener(self):
+        if self._listener is not None or connection.vendor != 'postgresql':
+            return
+        if not getattr(settings, 'SPEEDTEST_RESULTS_LISTEN', True):
+            return
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name='speedtest-results-listener', daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                self._listen_once()
+            except Exception:
+                logger.exception("LISTEN connection for new results failed; reconnecting")
+            # Results stored while disconnected are found by the waiters once they re-query
+            self.notify()
+            time.sleep(5)
+
+    def _listen_once(self):
+        # A dedicated autocommit connection outside Django's connection handling
+        wrapper = connections['default']
+        raw = wrapper.get_new_connection(wrapper.get_connection_params())
+        try:
+            raw.autocommit = True
+            with raw.cursor() as cursor:
+                cursor.execute(f"LISTEN {CHANNEL}")
+            if hasattr(raw, 'poll'):
+                # psycopg2
+                while True:
+                    if select.select([raw], [], [], 60)[0]:
+                        raw.poll()
+                        if raw.notifies:
+                            raw.notifies.clear()
+                            self.notify()
+            else:
+                # psycopg 3
+                for _ in raw.notifies():
+                    self.notify()
+        finally:
+            raw.close()
+
+
+result_notifier = ResultNotifier()
+
+
+def announce_new_results():
+    """
+    Called inside the transaction that stores new results. The waiters of this process are woken
+    once it commits; on PostgreSQL a NOTIFY, delivered at commit as well, reaches the other processes.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, '')", [CHANNEL])
+    transaction.on_commit(result_notifier.notify)
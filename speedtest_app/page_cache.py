@@ -0,0 +1,84 @@
+import hashlib
+import uuid
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+INDEX_CACHE_KEY = 'speedtest_app:index'
+# Bumped by invalidate_index_page(); pages are stored under the generation read before rendering
+INDEX_GENERATION_KEY = 'speedtest_app:index:generation'
+
+
+def _cache():
+    return caches[getattr(settings, 'SPEEDTEST_PAGE_CACHE', 'default')]
+
+
+def _build_page(content, last_modified=None) -> dict:
+    return {
+        'content': content,
+        'etag': '"%s"' % hashlib.md5(content.encode(), usedforsecurity=False).hexdigest(),
+        # HTTP dates have a resolution of one second
+        'last_modified': (last_modified or timezone.now()).replace(microsecond=0),
+    }
+
+
+def _timeout():
+    return getattr(settings, 'SPEEDTEST_PAGE_CACHE_TIMEOUT', 24 * 3600)
+
+
+def _new_generation():
+    return uuid.uuid4().hex
+
+
+def _page_key(generation):
+    return f'{INDEX_CACHE_KEY}:{generation}'
+
+
+def _generation():
+    cache = _cache()
+    generation = cache.get(INDEX_GENERATION_KEY)
+    if generation is None:
+        cache.add(INDEX_GENERATION_KEY, _new_generation(), None)
+        generation = cache.get(INDEX_GENERATION_KEY)
+    return generation
+
+
+async def _ageneration():
+    cache = _cache()
+    generation = await cache.aget(INDEX_GENERATION_KEY)
+    if generation is None:
+        await cache.aadd(INDEX_GENERATION_KEY, _new_generation(), None)
+        generation = await cache.aget(INDEX_GENERATION_KEY)
+    return generation
+
+
+def get_index_page(render_page) -> dict:
+    """
+    Returns the cached index page as a dict with its 'content', 'etag' and 'last_modified',
+    calling render_page() to build it on a cache miss. render_page returns the content and
+    the timestamp of the newest result shown (None without results).
+    invalidate_index_page() starts a new generation whenever new results are stored, and a
+    page is stored under the generation read before rendering it, so a rendering that was
+    overtaken by an invalidation can never be served afterwards.
+    """
+    generation = _generation()
+    page = _cache().get(_page_key(generation))
+    if page is None:
+        page = _build_page(*render_page())
+        _cache().set(_page_key(generation), page, _timeout())
+    return page
+
+
+async def aget_index_page(render_page) -> dict:
+    # Async version of get_index_page(); render_page is a coroutine function
+    generation = await _ageneration()
+    page = await _cache().aget(_page_key(generation))
+    if page is None:
+        page = _build_page(*(await render_page()))
+        await _cache().aset(_page_key(generation), page, _timeout())
+    return page
+
+
+def invalidate_index_page():
+    # Called when results are added; the next request renders the page again
+    _cache().set(INDEX_GENERATION_KEY, _new_generation(), None)
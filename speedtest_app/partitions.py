@@ -0,0 +1,236 @@
+import re
+from datetime import datetime, timezone as dt_timezone
+from django.db import IntegrityError, connection as default_connection, transaction
+from django.utils import timezone
+from .models import SpeedTestResult
+
+TABLE = SpeedTestResult._meta.db_table
+PARTITION_NAME = re.compile(re.escape(TABLE) + r'_p(\d{4})(\d{2})$')
+# Key of the PostgreSQL advisory lock held while partitions are created
+PARTITION_LOCK_ID = 0x5EED9A27
+
+
+def month_start(timestamp) -> datetime:
+    # Partitions are aligned to UTC months
+    ts = timestamp.astimezone(dt_timezone.utc)
+    return ts.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(month, months) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(month) -> str:
+    return f'{TABLE}_p{month.year:04d}{month.month:02d}'
+
+
+# Database name -> whether its results table is partitioned; the layout only changes in migration 0008
+_partitioned = {}
+
+
+def is_partitioned(connection=default_connection, cached=False) -> bool:
+    # Whether the results table has been converted by migration 0008 (PostgreSQL only)
+    if connection.vendor != 'postgresql':
+        return False
+    key = connection.settings_dict['NAME']
+    if cached and key in _partitioned:
+        return _partitioned[key]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+            "WHERE c.relname = %s AND c.relnamespace = to_regnamespace(current_schema())::oid",
+            [TABLE],
+        )
+        _partitioned[key] = cursor.fetchone() is not None
+    return _partitioned[key]
+
+
+def list_partitions(connection=default_connection) -> dict:
+    # Monthly partitions of the results table as {month start: partition name}
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits i "
+            "JOIN pg_class parent ON parent.oid = i.inhparent "
+            "JOIN pg_class child ON child.oid = i.inhrelid "
+            "WHERE parent.relname = %s AND parent.relnamespace = to_regnamespace(current_schema())::oid",
+            [TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    partitions = {}
+    for name in names:
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions[datetime(int(match[1]), int(match[2]), 1, tzinfo=dt_timezone.utc)] = name
+    return dict(sorted(partitions.items()))
+
+
+def create_partition(month, connection=default_connection) -> str:
+    name = partition_name(month)
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {quote(name)} PARTITION OF {quote(TABLE)} "
+            f"FOR VALUES FROM (%s) TO (%s)",
+            [month, add_months(month, 1)],
+        )
+    return name
+
+
+# Database name -> month starts whose partition is known to exist, so that inserts skip the catalog
+# query. Another process (prune_results run from cron) may drop one of them at any time; the
+# inserts that then fail are retried by insert_with_partitions() after the cache is dropped.
+_existing_months = {}
+
+
+def _remember_months(months, connection):
+    # Remembered once committed: a rolled back CREATE TABLE leaves no partition behind
+    key = connection.settings_dict['NAME']
+    transaction.on_commit(lambda: _existing_months.setdefault(key, set()).update(months), using=connection.alias)
+
+
+def ensure_partitions(months, connection=default_connection) -> list:
+    """
+    Creates the partitions of the given month starts that do not exist yet.
+    Returns the names of the created partitions.
+    """
+    months = set(months)
+    if months <= _existing_months.get(connection.settings_dict['NAME'], set()):
+        return []
+    existing = set(list_partitions(connection))
+    if months <= existing:
+        _remember_months(existing, connection)
+        return []
+    with transaction.atomic(using=connection.alias):
+        # Serializes concurrent writers that need the same new partition
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", [PARTITION_LOCK_ID])
+        existing = set(list_partitions(connection))
+        created = [create_partition(month, connection) for month in sorted(months) if month not in existing]
+        _remember_months(existing | months, connection)
+    return created
+
+
+def forget_partitions(connection=default_connection):
+    # Drops the cached months, so that the next insert looks its partitions up again
+    _existing_months.pop(connection.settings_dict['NAME'], None)
+
+
+def insert_with_partitions(insert, timestamps, connection=default_connection):
+    """
+    Runs insert(), which stores results with the given timestamps, in a transaction and returns
+    its result. If it fails because the partition of a cached month has been dropped by another
+    process, the partitions are looked up and created again and insert() runs once more.
+    """
+    try:
+        with transaction.atomic(using=connection.alias):
+            return insert()
+    except IntegrityError:
+        if not is_partitioned(connection, cached=True):
+            raise
+        forget_partitions(connection)
+        if not ensure_partitions_for(timestamps, connection):
+            # Every partition was there, so the insert failed for another reason
+            raise
+    with transaction.atomic(using=connection.alias):
+        return insert()
+
+
+def ensure_future_partitions(months_ahead=3, connection=default_connection) -> list:
+    # Pre-creates the partitions of the current month and of the next months_ahead months
+    current = month_start(timezone.now())
+    return ensure_partitions([add_months(current, i) for i in range(months_ahead + 1)], connection)
+
+
+def ensure_partitions_for(timestamps, connection=default_connection) -> list:
+    # Makes sure that results with these timestamps can be inserted into a partitioned table
+    timestamps = list(timestamps)
+    if not timestamps or not is_partitioned(connection, cached=True):
+        return []
+    return ensure_partitions({month_start(ts) for ts in timestamps}, connection)
+
+
+def _pending_detach(connection) -> set:
+    # Partitions left half-detached by an interrupted DETACH PARTITION ... CONCURRENTLY
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits i "
+            "JOIN pg_class parent ON parent.oid = i.inhparent "
+            "JOIN pg_class child ON child.oid = i.inhrelid "
+            "WHERE parent.relname = %s AND parent.relnamespace = to_regnamespace(current_schema())::oid "
+            "AND i.inhdetachpending",
+            [TABLE],
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+def drop_partitions_before(cutoff, connection=default_connection) -> list:
+    """
+    Drops the monthly partitions that only hold results older than cutoff. Dropping a partition
+    removes its rows without a DELETE, so the table neither bloats nor needs vacuuming.
+    Each partition is first detached with DETACH PARTITION ... CONCURRENTLY, which lets reads and
+    writes of the results table go on, whereas dropping a live partition locks the whole table
+    (ACCESS EXCLUSIVE). CONCURRENTLY cannot run inside a transaction block; there the partition
+    is detached with the blocking form. Returns the names of the dropped partitions.
+    """
+    partitions = list_partitions(connection)
+    concurrently = not connection.in_atomic_block
+    pending = _pending_detach(connection) if concurrently else set()
+    quote = connection.ops.quote_name
+    known = _existing_months.get(connection.settings_dict['NAME'], set())
+    dropped = []
+    with connection.cursor() as cursor:
+        for month, name in partitions.items():
+            if add_months(month, 1) > cutoff:
+                continue
+            known.discard(month)
+            mode = ' FINALIZE' if name in pending else ' CONCURRENTLY' if concurrently else ''
+            cursor.execute(f"ALTER TABLE {quote(TABLE)} DETACH PARTITION {quote(name)}{mode}")
+            cursor.execute(f"DROP TABLE {quote(name)}")
+            dropped.append(name)
+    return dropped
+
+
+def convert_to_partitioned(model, schema_editor, months_ahead=3):
+    """
+    Rebuilds the results table as a table partitioned by month on timestamp, copying all rows.
+    The primary key becomes (id, timestamp), as PostgreSQL requires the partition key in every
+    unique index; the ORM keeps using id. model is the model state of the calling migration,
+    whose indexes and constraints are recreated on the new table.
+    """
+    connection = schema_editor.connection
+    if is_partitioned(connection):
+        return
+    _partitioned.pop(connection.settings_dict['NAME'], None)
+    forget_partitions(connection)
+    table = connection.ops.quote_name(TABLE)
+    old = connection.ops.quote_name(TABLE + '_unpartitioned')
+    sequence = connection.ops.quote_name(TABLE + '_id_seq')
+    execute = schema_editor.execute
+
+    execute(f"ALTER TABLE {table} RENAME TO {old}")
+    execute(f"CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS) PARTITION BY RANGE (timestamp)")
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT min(timestamp), max(timestamp), max(id) FROM {old}")
+        first, last, last_id = cursor.fetchone()
+    current = month_start(timezone.now())
+    month = month_start(first) if first is not None else current
+    end = max(add_months(current, months_ahead), month_start(last) if last is not None else current)
+    while month <= end:
+        create_partition(month, connection)
+        month = add_months(month, 1)
+
+    execute(f"INSERT INTO {table} SELECT * FROM {old}")
+    # Dropping the old table also drops its identity sequence, so the ids continue from a new one
+    execute(f"DROP TABLE {old}")
+    # Added once the old table and its identically named constraints and indexes are gone
+    execute(f"ALTER TABLE {table} ADD PRIMARY KEY (id, timestamp)")
+    execute(f"CREATE SEQUENCE {sequence} OWNED BY {table}.id")
+    execute(f"SELECT setval('{TABLE}_id_seq', %s, %s)", [last_id or 1, last_id is not None])
+    execute(f"ALTER TABLE {table} ALTER COLUMN id SET DEFAULT nextval('{TABLE}_id_seq')")
+
+    for index in model._meta.indexes:
+        schema_editor.add_index(model, index)
+    for constraint in model._meta.constraints:
+        schema_editor.add_constraint(model, constraint)
@@ -0,0 +1,140 @@
+import re
+from bisect import bisect_right, insort
+from datetime import timedelta
+from django.db.models import Aggregate, Count, FloatField
+
+# Reported percentiles: response key -> fraction
+PERCENTILES = {'p50': 0.5, 'p90': 0.9, 'p95': 0.95, 'p99': 0.99}
+GROUP_BY = ('server_name', 'server_country')
+WINDOW = re.compile(r'^(\d+)([mhdw])$')
+WINDOW_UNITS = {'m': 'minutes', 'h': 'hours', 'd': 'days', 'w': 'weeks'}
+# Name of the SQLite aggregate function registered by register_sqlite_functions()
+SQLITE_FUNCTION = 'speedtest_p2_quantile'
+
+
+def parse_window(value) -> timedelta:
+    # Parses a window such as "30m", "24h", "7d" or "2w"; raises ValueError for anything else
+    match = WINDOW.match(value or '')
+    if not match or not int(match[1]):
+        raise ValueError(f"Invalid window: {value!r} (use e.g. 30m, 24h, 7d or 2w)")
+    return timedelta(**{WINDOW_UNITS[match[2]]: int(match[1])})
+
+
+def exact_quantile(values, p):
+    # Quantile of sorted values with linear interpolation between ranks, like percentile_cont
+    if not values:
+        return None
+    position = p * (len(values) - 1)
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+class P2Quantile:
+    """
+    Streaming estimate of the p-quantile with the P² algorithm (Jain & Chlamtac, 1985):
+    five markers whose heights follow the minimum, the p/2, p and (1+p)/2 quantiles and the
+    maximum, adjusted with piecewise-parabolic interpolation as values arrive. Memory use is
+    constant; up to five values the result is exact.
+    """
+    def __init__(self, p):
+        self.p = p
+        self.count = 0
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, value):
+        self.count += 1
+        q = self.heights
+        if self.count <= 5:
+            insort(q, value)
+            return
+
+        if value < q[0]:
+            q[0] = value
+            cell = 0
+        elif value >= q[4]:
+            q[4] = value
+            cell = 3
+        else:
+            cell = bisect_right(q, value) - 1
+        n = self.positions
+        for i in range(cell + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        for i in (1, 2, 3):
+            offset = self.desired[i] - n[i]
+            if (offset >= 1 and n[i + 1] - n[i] > 1) or (offset <= -1 and n[i - 1] - n[i] < -1):
+                step = 1 if offset > 0 else -1
+                height = self._parabolic(i, step)
+                if not q[i - 1] < height < q[i + 1]:
+                    height = q[i] + step * (q[i + step] - q[i]) / (n[i + step] - n[i])
+                q[i] = height
+                n[i] += step
+
+    def _parabolic(self, i, step):
+        q, n = self.heights, self.positions
+        return q[i] + step / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + step) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - step) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def result(self):
+        if self.count <= 5:
+            return exact_quantile(self.heights, self.p)
+        return self.heights[2]
+
+
+class _SQLiteP2Aggregate:
+    # SQLite aggregate protocol around P2Quantile: speedtest_p2_quantile(value, fraction)
+    def __init__(self):
+        self.sketch = None
+
+    def step(self, value, fraction):
+        if value is None:
+            return
+        if self.sketch is None:
+            self.sketch = P2Quantile(fraction)
+        self.sketch.add(value)
+
+    def finalize(self):
+        return self.sketch.result() if self.sketch is not None else None
+
+
+def register_sqlite_functions(connection):
+    # Called for every new SQLite connection (see signals.py)
+    connection.connection.create_aggregate(SQLITE_FUNCTION, 2, _SQLiteP2Aggregate)
+
+
+class Percentile(Aggregate):
+    """
+    Continuous percentile of an expression. PostgreSQL computes it exactly with percentile_cont;
+    on SQLite it is estimated by the P² aggregate, inside the database as well.
+    """
+    function = 'PERCENTILE_CONT'
+    name = 'Percentile'
+    template = '%(function)s(%(fraction)s) WITHIN GROUP (ORDER BY %(expressions)s)'
+    output_field = FloatField()
+
+    def __init__(self, expression, fraction, **extra):
+        # The fraction is a float, so it can be inlined safely
+        super().__init__(expression, fraction=float(fraction), **extra)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, function=SQLITE_FUNCTION,
+                           template='%(function)s(%(expressions)s, %(fraction)s)', **extra_context)
+
+
+def percentiles(results, metric, group_by) -> list:
+    """
+    Returns the count and the PERCENTILES of metric for every group_by value of the results,
+    computed in one grouped query. Exact on PostgreSQL; P² estimates on SQLite.
+    """
+    annotations = {key: Percentile(metric, fraction) for key, fraction in PERCENTILES.items()}
+    groups = results.order_by().values(group_by).annotate(count=Count('id'), **annotations).order_by(group_by)
+    return [{'group': row[group_by], 'count': row['count'], **{key: row[key] for key in PERCENTILES}}
+            for row in groups]
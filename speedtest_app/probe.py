@@ -0,0 +1,231 @@
+import gzip
+import json
+import logging
+import os
+import random
+import time
+import urllib.error
+import urllib.request
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from .measurement import measure
+from .utils import FileLock, write_atomic
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = '.jsonl'
+OFFSET_FILE = 'offset'
+BULK_PATH = 'results/bulk/'
+
+
+class Spool:
+    """
+    Append-only local queue of measurements, kept as JSON Lines segments in one directory.
+
+    Positions are byte offsets into the concatenation of all segments, and every segment is
+    named after the offset of its first byte. The "offset" file holds the position up to which
+    the central instance has acknowledged the records; it only moves forward, after a
+    successful upload. Disk use stays below max_bytes: beyond that the oldest segments are
+    dropped, whether they were sent or not.
+    """
+    def __init__(self, directory, max_bytes, segment_bytes=None):
+        self.directory = str(directory)
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes or max(max_bytes // 8, 1)
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock_path = os.path.join(self.directory, 'lock')
+
+    def _segments(self) -> list:
+        # (start offset, path, size) of every segment, oldest first
+        segments = []
+        for name in os.listdir(self.directory):
+            start = name[:-len(SEGMENT_SUFFIX)]
+            if name.endswith(SEGMENT_SUFFIX) and start.isdigit():
+                path = os.path.join(self.directory, name)
+                segments.append((int(start), path, os.path.getsize(path)))
+        return sorted(segments)
+
+    def acknowledged(self) -> int:
+        try:
+            with open(os.path.join(self.directory, OFFSET_FILE)) as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _set_acknowledged(self, offset):
+        # Replaced atomically, so a crash leaves either the old or the new offset
+        write_atomic(os.path.join(self.directory, OFFSET_FILE), str(offset))
+
+    def _end(self, segments) -> int:
+        if not segments:
+            return self.acknowledged()
+        start, _, size = segments[-1]
+        return start + size
+
+    def append(self, record):
+        line = (json.dumps(record, cls=DjangoJSONEncoder) + '\n').encode()
+        with FileLock(self._lock_path):
+            segments = self._segments()
+            if segments:
+                self._repair(segments[-1])
+                segments = self._segments()
+            if segments and segments[-1][2] + len(line) <= self.segment_bytes:
+                path = segments[-1][1]
+            else:
+                path = os.path.join(self.directory, f'{self._end(segments):020d}{SEGMENT_SUFFIX}')
+            with open(path, 'ab') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._enforce_limit(self._segments())
+
+    def _repair(self, segment):
+        # Cuts off a line left incomplete by a crash during append(); it was never sent
+        _, path, size = segment
+        if not size:
+            return
+        with open(path, 'r+b') as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) == b'\n':
+                return
+            f.seek(0)
+            data = f.read()
+            f.truncate(data.rfind(b'\n') + 1)
+
+    def _enforce_limit(self, segments):
+        acknowledged = self.acknowledged()
+        total = sum(size for _, _, size in segments)
+        while total > self.max_bytes and len(segments) > 1:
+            start, path, size = segments.pop(0)
+            if start + size > acknowledged:
+                logger.warning("Probe spool is full; dropping unsent results in %s", path)
+                acknowledged = start + size
+                self._set_acknowledged(acknowledged)
+            os.remove(path)
+            total -= size
+
+    def read_batch(self, max_records):
+        """
+        Returns up to max_records unacknowledged lines (bytes) and the offset right after them,
+        to be passed to acknowledge() once the central instance has stored them.
+        """
+        lines = []
+        with FileLock(self._lock_path):
+            position = self.acknowledged()
+            for start, path, size in self._segments():
+                if start + size <= position:
+                    continue
+                position = max(position, start)
+                with open(path, 'rb') as f:
+                    f.seek(position - start)
+                    for line in f:
+                        if not line.endswith(b'\n'):
+                            break
+                        lines.append(line)
+                        position += len(line)
+                        if len(lines) >= max_records:
+                            return lines, position
+        return lines, position
+
+    def acknowledge(self, offset):
+        # Records everything before offset as stored centrally and deletes the fully sent segments
+        with FileLock(self._lock_path):
+            if offset <= self.acknowledged():
+                return
+            self._set_acknowledged(offset)
+            for start, path, size in self._segments():
+                if start + size <= offset:
+                    os.remove(path)
+
+    def pending_bytes(self) -> int:
+        with FileLock(self._lock_path):
+            return self._end(self._segments()) - self.acknowledged()
+
+
+def upload(url, lines, token='', timeout=30) -> dict:
+    """
+    POSTs JSON Lines to a /results/bulk/ endpoint as one gzip-compressed request and returns
+    the decoded summary. Raises urllib.error.HTTPError for error responses and OSError
+    (urllib.error.URLError included) when the endpoint cannot be reached.
+    """
+    headers = {'Content-Type': 'application/x-ndjson', 'Content-Encoding': 'gzip'}
+    if token:
+        headers['Authorization'] = f'Bearer {token}'
+    request = urllib.request.Request(url, data=gzip.compress(b''.join(lines)), headers=headers, method='POST')
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.load(response)
+
+
+class ProbeAgent:
+    """
+    Measures on a schedule, spools every result locally and ships the spool to the central
+    instance in batches. A batch is acknowledged in the spool only after the central instance
+    has answered, and the central instance skips results whose (probe_id, timestamp) it already
+    holds, so a batch that is resent after a crash or a lost response is stored exactly once.
+    """
+    def __init__(self, spool, probe_id, central_url='', token='', batch_size=500, measure=measure):
+        self.spool = spool
+        self.probe_id = probe_id
+        self.url = central_url.rstrip('/') + '/' + BULK_PATH if central_url else ''
+        self.token = token
+        self.batch_size = batch_size
+        self.measure = measure
+
+    def measure_once(self):
+        # Runs one measurement and spools it; failures are logged and skipped
+        timestamp = timezone.now()
+        try:
+            measured = self.measure()
+        except Exception as e:
+            logger.error(f"Probe measurement failed: {e}")
+            return None
+        record = {'probe_id': self.probe_id, 'timestamp': timestamp.isoformat(), **measured}
+        self.spool.append(record)
+        return record
+
+    def ship(self) -> dict:
+        """
+        Uploads the spooled results until the spool is empty or the central instance cannot
+        take more. Returns the totals of the inserted, duplicate and rejected rows.
+        """
+        totals = {'inserted': 0, 'duplicates': 0, 'rejected': 0}
+        if not self.url:
+            return totals
+        batch_size = self.batch_size
+        while True:
+            lines, end = self.spool.read_batch(batch_size)
+            if not lines:
+                return totals
+            try:
+                summary = upload(self.url, lines, self.token)
+            except urllib.error.HTTPError as e:
+                if e.code == 413 and batch_size > 1:
+                    batch_size = max(batch_size // 2, 1)
+                    continue
+                logger.warning(f"Central instance refused the upload: HTTP {e.code}")
+                return totals
+            except OSError as e:
+                logger.info(f"Central instance unreachable, keeping results spooled: {e}")
+                return totals
+            for reject in summary.get('rejected', []):
+                logger.warning(f"Central instance rejected a spooled result: {reject.get('error')}")
+            self.spool.acknowledge(end)
+            totals['inserted'] += summary.get('inserted', 0)
+            totals['duplicates'] += summary.get('duplicates', 0)
+            totals['rejected'] += len(summary.get('rejected', []))
+
+    def run(self, interval, jitter, ship_interval=60):
+        """
+        Measures every interval seconds plus a random delay of up to jitter seconds (also before
+        the first measurement, so probes restarted together do not measure together), shipping
+        after every measurement and retrying a backlog every ship_interval seconds. Runs forever.
+        """
+        next_measurement = time.monotonic() + random.uniform(0, jitter)
+        while True:
+            if time.monotonic() >= next_measurement:
+                self.measure_once()
+                self.ship()
+                next_measurement = time.monotonic() + interval + random.uniform(0, jitter)
+            elif self.spool.pending_bytes():
+                self.ship()
+            time.sleep(max(min(ship_interval, next_measurement - time.monotonic()), 0))
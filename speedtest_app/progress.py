@@ -0,0 +1,140 @@
+import asyncio
+import functools
+import threading
+import time
+from collections import OrderedDict
+
+
+class ProgressHub:
+    """
+    Fans out the progress events of speed test jobs running in this process to any number
+    of asyncio subscribers, such as Server-Sent Events streams.
+    Publishing is thread-safe; every subscriber is an asyncio.Queue fed on its own event loop,
+    so an open stream costs no thread. Events of the most recent jobs are kept, so a late
+    subscriber first receives everything published so far.
+    """
+    def __init__(self, history_size=16):
+        self.history_size = history_size
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._history = OrderedDict()
+
+    def publisher(self, job_id):
+        # Returns a progress(event, data) callable bound to the given job
+        return functools.partial(self.publish, job_id)
+
+    def publish(self, job_id, event, data):
+        with self._lock:
+            history = self._history.setdefault(job_id, [])
+            self._history.move_to_end(job_id)
+            history.append((event, data))
+            while len(self._history) > self.history_size:
+                self._history.popitem(last=False)
+            subscribers = list(self._subscribers.get(job_id, ()))
+
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, (event, data))
+            except RuntimeError:
+                # The subscriber's event loop is already closed
+                pass
+
+    def subscribe(self, job_id) -> asyncio.Queue:
+        # Must be called from a coroutine; the queue is fed on the running event loop
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        with self._lock:
+            for item in self._history.get(job_id, ()):
+                queue.put_nowait(item)
+            self._subscribers.setdefault(job_id, []).append((loop, queue))
+        return queue
+
+    def unsubscribe(self, job_id, queue):
+        with self._lock:
+            subscribers = self._subscribers.get(job_id, [])
+            subscribers[:] = [(loop, q) for loop, q in subscribers if q is not queue]
+            if not subscribers:
+                self._subscribers.pop(job_id, None)
+
+
+progress_hub = ProgressHub()
+
+
+class _CountingResponse:
+    # Delegates to the wrapped HTTP response and counts the bytes read from it
+    def __init__(self, response, sampler):
+        self._response = response
+        self._sampler = sampler
+
+    def read(self, *args, **kwargs):
+        data = self._response.read(*args, **kwargs)
+        self._sampler.add_bytes(len(data))
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+
+class _CountingOpener:
+    # Delegates to the speedtest HTTP opener and wraps its responses in _CountingResponse
+    def __init__(self, opener, sampler):
+        self._opener = opener
+        self._sampler = sampler
+
+    def open(self, *args, **kwargs):
+        return _CountingResponse(self._opener.open(*args, **kwargs), self._sampler)
+
+    def __getattr__(self, name):
+        return getattr(self._opener, name)
+
+
+class ThroughputSampler:
+    """
+    Turns the speedtest-cli download()/upload() progress callbacks into throughput samples,
+    reported as progress(phase, {'mbps': ..., 'progress': ...}) each time a request completes.
+    Download bytes are counted on the HTTP responses while the sampler is active (used as a
+    context manager); upload bytes are taken from the sizes of the completed upload requests.
+    """
+    def __init__(self, st, phase, progress):
+        self.st = st
+        self.phase = phase
+        self.progress = progress
+        self.bytes = 0
+        self.completed = 0
+        self.start = time.monotonic()
+        self._lock = threading.Lock()
+        self._opener = None
+        self._upload_sizes = []
+        if phase == 'upload':
+            # Same request order as Speedtest.upload()
+            self._upload_sizes = [size for size in st.config['sizes']['upload']
+                                  for _ in range(st.config['counts']['upload'])]
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        if self.phase == 'download':
+            self._opener = self.st._opener
+            self.st._opener = _CountingOpener(self._opener, self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._opener is not None:
+            self.st._opener = self._opener
+            self._opener = None
+
+    def add_bytes(self, count):
+        with self._lock:
+            self.bytes += count
+
+    def callback(self, i, request_count, start=False, end=False):
+        # Called by speedtest-cli from its worker threads when a request starts or ends
+        if not end:
+            return
+        with self._lock:
+            self.completed += 1
+            if i < len(self._upload_sizes):
+                self.bytes += self._upload_sizes[i]
+            elapsed = time.monotonic() - self.start
+            mbps = self.bytes * 8 / elapsed / 1_000_000 if elapsed > 0 else 0.0
+            done = min(self.completed / request_count, 1.0) if request_count else 1.0
+        self.progress(self.phase, {'mbps': round(mbps, 2), 'progress': round(done, 3)})
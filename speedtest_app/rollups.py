@@ -0,0 +1,133 @@
+import math
+from datetime import timezone as dt_timezone
+from itertools import islice
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Sum, Value
+from django.db.models.functions import Greatest, Least, TruncDay, TruncHour
+from .models import SpeedTestResult, SpeedTestRollup
+
+# Rollup column prefix -> SpeedTestResult field
+METRICS = {
+    'download': 'download_speed',
+    'upload': 'upload_speed',
+    'ping': 'ping',
+}
+
+# Buckets are aligned to UTC so that they never overlap or repeat around DST changes
+TRUNCATE = {
+    SpeedTestRollup.GRANULARITY_HOUR: TruncHour,
+    SpeedTestRollup.GRANULARITY_DAY: TruncDay,
+}
+
+
+def bucket_start(timestamp, granularity):
+    # Returns the start of the UTC hour or day that contains the timestamp
+    ts = timestamp.astimezone(dt_timezone.utc)
+    if granularity == SpeedTestRollup.GRANULARITY_HOUR:
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def record_results(results):
+    """
+    Folds new speed test results into their hourly and daily rollups.
+    Results are first combined per bucket, so a batch costs one update per touched bucket.
+    """
+    buckets = {}
+    for result in results:
+        for granularity in TRUNCATE:
+            key = (bucket_start(result.timestamp, granularity), granularity, result.server_name)
+            agg = buckets.setdefault(key, {'count': 0})
+            agg['count'] += 1
+            for prefix, field in METRICS.items():
+                value = getattr(result, field)
+                if prefix + '_min' not in agg:
+                    agg.update({prefix + '_min': value, prefix + '_max': value,
+                                prefix + '_sum': 0.0, prefix + '_sumsq': 0.0})
+                agg[prefix + '_min'] = min(agg[prefix + '_min'], value)
+                agg[prefix + '_max'] = max(agg[prefix + '_max'], value)
+                agg[prefix + '_sum'] += value
+                agg[prefix + '_sumsq'] += value * value
+
+    with transaction.atomic():
+        for (start, granularity, server_name), agg in buckets.items():
+            _apply_bucket(start, granularity, server_name, agg)
+
+
+def _apply_bucket(start, granularity, server_name, agg):
+    defaults = {'count': 0}
+    updates = {'count': F('count') + agg['count']}
+    for prefix in METRICS:
+        defaults[prefix + '_min'] = agg[prefix + '_min']
+        defaults[prefix + '_max'] = agg[prefix + '_max']
+        updates[prefix + '_min'] = Least(F(prefix + '_min'), Value(agg[prefix + '_min']))
+        updates[prefix + '_max'] = Greatest(F(prefix + '_max'), Value(agg[prefix + '_max']))
+        updates[prefix + '_sum'] = F(prefix + '_sum') + agg[prefix + '_sum']
+        updates[prefix + '_sumsq'] = F(prefix + '_sumsq') + agg[prefix + '_sumsq']
+
+    rollup, _ = SpeedTestRollup.objects.get_or_create(
+        bucket_start=start, granularity=granularity, server_name=server_name, defaults=defaults
+    )
+    # The increment happens in the database, so concurrent writers never lose updates
+    SpeedTestRollup.objects.filter(pk=rollup.pk).update(**updates)
+
+
+def rebuild_rollups(batch_size=1000) -> int:
+    """
+    Recomputes every rollup from the raw results, with the aggregation done in the database.
+    Returns the number of rollup rows written.
+    """
+    written = 0
+    with transaction.atomic():
+        SpeedTestRollup.objects.all().delete()
+        for granularity, trunc in TRUNCATE.items():
+            aggregates = {'count': Count('id')}
+            for prefix, field in METRICS.items():
+                aggregates[prefix + '_min'] = Min(field)
+                aggregates[prefix + '_max'] = Max(field)
+                aggregates[prefix + '_sum'] = Sum(field)
+                aggregates[prefix + '_sumsq'] = Sum(F(field) * F(field))
+            rows = (
+                SpeedTestResult.objects
+                .annotate(bucket=trunc('timestamp', tzinfo=dt_timezone.utc))
+                .values('bucket', 'server_name')
+                .annotate(**aggregates)
+                .order_by()
+                .iterator()
+            )
+            rollups = (SpeedTestRollup(bucket_start=row.pop('bucket'), granularity=granularity, **row) for row in rows)
+            while True:
+                batch = list(islice(rollups, batch_size))
+                if not batch:
+                    break
+                SpeedTestRollup.objects.bulk_create(batch)
+                written += len(batch)
+    return written
+
+
+def summarize_buckets(rollups):
+    """
+    Merges rollups that share a bucket start (one per server) and turns the running sums
+    into count, min, max, mean and standard deviation per metric.
+    """
+    aggregates = {'total_count': Sum('count')}
+    for prefix in METRICS:
+        aggregates[prefix + '_lo'] = Min(prefix + '_min')
+        aggregates[prefix + '_hi'] = Max(prefix + '_max')
+        aggregates[prefix + '_total'] = Sum(prefix + '_sum')
+        aggregates[prefix + '_total_sq'] = Sum(prefix + '_sumsq')
+
+    rows = rollups.values('bucket_start').annotate(**aggregates).order_by('bucket_start')
+    for row in rows:
+        count = row['total_count']
+        bucket = {'bucket_start': row['bucket_start'], 'count': count}
+        for prefix in METRICS:
+            mean = row[prefix + '_total'] / count
+            variance = max(row[prefix + '_total_sq'] / count - mean * mean, 0.0)
+            bucket[prefix] = {
+                'min': row[prefix + '_lo'],
+                'max': row[prefix + '_hi'],
+                'mean': round(mean, 2),
+                'stddev': round(math.sqrt(variance), 2),
+            }
+        yield bucket
@@ -0,0 +1,53 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, pre_save
+from django.dispatch import receiver
+from .anomaly import flag_anomalies
+from .models import SpeedTestResult
+from .notify import announce_new_results
+from .page_cache import invalidate_index_page
+from .partitions import ensure_partitions_for
+from .percentiles import register_sqlite_functions
+from .rollups import record_results
+
+
+@receiver(pre_save, sender=SpeedTestResult)
+def flag_anomaly_on_save(sender, instance, raw=False, **kwargs):
+    # New results are compared with (and then folded into) the baseline of their server;
+    # save them inside transaction.atomic(), so that a failed insert leaves the baseline as it was
+    if instance._state.adding and not raw:
+        flag_anomalies([instance])
+
+
+@receiver(pre_save, sender=SpeedTestResult)
+def ensure_partition_on_save(sender, instance, raw=False, **kwargs):
+    # A partitioned table rejects rows of months without a partition (see partitions.py)
+    if instance._state.adding:
+        ensure_partitions_for([instance.timestamp])
+
+
+@receiver(post_save, sender=SpeedTestResult)
+def update_rollups_on_save(sender, instance, created, raw=False, **kwargs):
+    # Keeps the hourly/daily rollups in step with every newly saved result
+    if created and not raw:
+        record_results([instance])
+
+
+@receiver(post_save, sender=SpeedTestResult)
+def invalidate_pages_on_save(sender, instance, **kwargs):
+    # Once the result is committed, the cached index page no longer shows the latest results
+    transaction.on_commit(invalidate_index_page)
+
+
+@receiver(post_save, sender=SpeedTestResult)
+def announce_result_on_save(sender, instance, created, raw=False, **kwargs):
+    # Wakes up the /results/since/ long-polls once the new result is committed
+    if created and not raw:
+        announce_new_results()
+
+
+@receiver(connection_created)
+def register_database_functions(sender, connection, **kwargs):
+    # SQLite has no percentile_cont, so the percentiles are estimated by an aggregate of our own
+    if connection.vendor == 'sqlite':
+        register_sqlite_functions(connection)
@@ -6,7 +6,84 @@ function setProgress(elementId, value, maxValue) {
     });
 }
 
+const jobPollInterval = 1000;
+// Give up on a job that has not finished after this many status polls
+const jobPollMaxAttempts = 300;
+const latestResultsShown = 5;
+const longPollWait = 25;
+const longPollMaxRetryDelay = 60000;
+const serverIcon = '<svg class="w-4 h-4 mr-2" fill="none" stroke="currentColor" viewBox="0 0 24 24">' +
+    '<path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M17.657 16.657L13.414 20.9a1.998 1.998 0 01-2.827 0l-4.244-4.243a8 8 0 1111.314 0z"/>' +
+    '<path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M15 11a3 3 0 11-6 0 3 3 0 016 0z"/></svg>';
+
+// Builds a card of the latest results list from one row of /results/since/
+function resultCard(result) {
+    function line(label, value) {
+        return $('<p class="flex items-center">').append(
+            $('<span class="w-24">').text(label), ' ', $('<span class="font-semibold">').text(value));
+    }
+    const timestamp = new Date(result.timestamp).toLocaleString(undefined, {
+        month: 'short', day: 'numeric', year: 'numeric', hour: 'numeric', minute: '2-digit'
+    });
+    return $('<div class="glass-effect result-box p-4 rounded-xl transform hover:scale-102 transition-transform duration-200">').attr('data-timestamp', result.timestamp).append(
+        $('<div class="flex justify-between items-start">').append(
+            $('<div>').append(
+                line('Download:', `${result.download_speed.toFixed(2)} Mbps`),
+                line('Upload:', `${result.upload_speed.toFixed(2)} Mbps`),
+                line('Ping:', `${result.ping.toFixed(2)} ms`),
+                $('<p class="flex items-center mt-2 text-sm text-blue-400">').append(
+                    serverIcon, document.createTextNode(`Server: ${result.server_name}, ${result.server_country}`))
+            ),
+            $('<p class="text-sm text-gray-400">').text(timestamp)
+        )
+    );
+}
+
+// Inserts a card below the shown results that are at least as recent, so that late arrivals with old
+// timestamps (probe backlogs, imported logs) do not jump to the top of the latest results
+function insertResultCard(list, result) {
+    const time = Date.parse(result.timestamp);
+    const newer = list.children().filter(function() { return Date.parse($(this).attr('data-timestamp')) >= time; });
+    if (newer.length) {
+        resultCard(result).insertAfter(newer.last());
+    } else {
+        list.prepend(resultCard(result));
+    }
+}
+
+// Polls /results/since/ and adds new results to the list in timestamp order. With resultsLongPoll (ASGI only)
+// the server holds each request open while nothing changes, so an idle screen costs one request
+// every longPollWait seconds; otherwise the page asks every resultsPollInterval milliseconds.
+function followResults(lastId, retryDelay) {
+    $.ajax({
+        url: resultsSinceUrl.replace(/0\/$/, `${lastId}/`),
+        data: {wait: resultsLongPoll ? longPollWait : 0},
+        method: 'GET',
+        success: function(response) {
+            const list = $('#latest-results');
+            response.results.forEach(function(row) {
+                const result = {};
+                response.fields.forEach(function(field, i) { result[field] = row[i]; });
+                insertResultCard(list, result);
+            });
+            list.children().slice(latestResultsShown).remove();
+            if (resultsLongPoll) {
+                followResults(response.last_id, 1000);
+            } else {
+                setTimeout(function() { followResults(response.last_id, 1000); }, resultsPollInterval);
+            }
+        },
+        error: function() {
+            setTimeout(function() {
+                followResults(lastId, Math.min(retryDelay * 2, longPollMaxRetryDelay));
+            }, retryDelay);
+        }
+    });
+}
+
 $(document).ready(function() {
+    setTimeout(function() { followResults(latestResultId, 1000); }, resultsLongPoll ? 0 : resultsPollInterval);
+
     $('#check-speed').click(function() {
         const button = $(this);
         const buttonText = $('#button-text');
@@ -23,31 +100,105 @@ $(document).ready(function() {
         $('#upload-speed').text('-- Mbps');
         $('#ping-value').text('-- ms');
 
+        function resetButton() {
+            button.prop('disabled', false);
+            buttonText.html('Start Speed Test');
+        }
+
+        function showResults(response) {
+            $('#download-speed').text(`${response.download_speed} Mbps`);
+            $('#upload-speed').text(`${response.upload_speed} Mbps`);
+            $('#ping-value').text(`${response.ping} ms`);
+
+            setProgress('download-progress', response.download_speed, 100);
+            setProgress('upload-progress', response.upload_speed, 100);
+            setProgress('ping-progress', response.ping, 100);
+            $('#is-fast-text').text(response.is_fast ? 'Так' : 'Ні');
+            $('#summary-text').text(response.summary);
+            $('#internet-quality').removeClass('hidden');
+        }
+
+        // Polls the job status endpoint until the speed test has finished or jobPollMaxAttempts is reached
+        function pollJob(statusUrl, attempt = 1) {
+            $.ajax({
+                url: statusUrl,
+                method: 'GET',
+                success: function(response) {
+                    if (response.status === 'done') {
+                        showResults(response);
+                        resetButton();
+                    } else if (response.status === 'failed') {
+                        alert('Error performing speed test: ' + response.error);
+                        resetButton();
+                    } else if (attempt >= jobPollMaxAttempts) {
+                        alert('The speed test is taking too long, please try again later');
+                        resetButton();
+                    } else {
+                        setTimeout(function() { pollJob(statusUrl, attempt + 1); }, jobPollInterval);
+                    }
+                },
+                error: function() {
+                    alert('Error connecting to server');
+                    resetButton();
+                }
+            });
+        }
+
+        // Streams live progress over Server-Sent Events when the server supports it
+        function streamJob() {
+            const source = new EventSource(speedTestEventsUrl);
+
+            source.addEventListener('ping', function(e) {
+                const data = JSON.parse(e.data);
+                $('#ping-value').text(`${data.ping} ms`);
+                setProgress('ping-progress', data.ping, 100);
+            });
+            source.addEventListener('download', function(e) {
+                const data = JSON.parse(e.data);
+                $('#download-speed').text(`${data.mbps} Mbps`);
+                setProgress('download-progress', data.mbps, 100);
+            });
+            source.addEventListener('upload', function(e) {
+                const data = JSON.parse(e.data);
+                $('#upload-speed').text(`${data.mbps} Mbps`);
+                setProgress('upload-progress', data.mbps, 100);
+            });
+            source.addEventListener('result', function(e) {
+                source.close();
+                showResults(JSON.parse(e.data));
+                resetButton();
+            });
+            source.addEventListener('failed', function(e) {
+                source.close();
+                alert('Error performing speed test: ' + JSON.parse(e.data).error);
+                resetButton();
+            });
+            source.onerror = function() {
+                source.close();
+                alert('Error connecting to server');
+                resetButton();
+            };
+        }
+
+        if (speedTestEventsUrl && window.EventSource) {
+            streamJob();
+            return;
+        }
+
         $.ajax({
             url: speedTestUrl,
-            method: 'GET',
+            method: 'POST',
             success: function(response) {
                 if (response.success) {
-                    $('#download-speed').text(`${response.download_speed} Mbps`);
-                    $('#upload-speed').text(`${response.upload_speed} Mbps`);
-                    $('#ping-value').text(`${response.ping} ms`);
-
-                    setProgress('download-progress', response.download_speed, 100);
-                    setProgress('upload-progress', response.upload_speed, 100);
-                    setProgress('ping-progress', response.ping, 100);
-                    $('#is-fast-text').text(response.is_fast ? 'Так' : 'Ні');
-                    $('#summary-text').text(response.summary);
-                    $('#internet-quality').removeClass('hidden');
+                    pollJob(response.status_url);
                 } else {
                     alert('Error performing speed test: ' + response.error);
+                    resetButton();
                 }
             },
             error: function() {
                 alert('Error connecting to server');
-            },
-            complete: function() {
-                button.prop('disabled', false);
-                buttonText.html('Start Speed Test');
+                resetButton();
             }
         });
     });
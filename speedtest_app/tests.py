@@ -1,12 +1,35 @@
+import asyncio
+import gzip
+import importlib.util
+import io
 import json
 import os
+import re
 import tempfile
-from django.test import TestCase as DjangoTestCase, Client
+import threading
+import time
+import urllib.error
+import uuid
+from django.test import SimpleTestCase, TestCase as DjangoTestCase, TransactionTestCase, Client, override_settings
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from unittest import mock, TestCase
+from unittest import mock, skipUnless, TestCase
+import speedtest
 from datetime import datetime, timedelta, timezone
-from .models import SpeedTestResult
-from .utils import SpeedTestAnalyzer, SpeedTestLogger
+from .benchmarks import find_regressions
+from .discovery import SpeedtestServerCache, server_cache
+from .measurement import perform_speed_test
+from .progress import ProgressHub, ThroughputSampler
+from .ingest import ingest_records
+from .anomaly import update_baseline
+from .notify import CHANNEL, ResultNotifier, result_notifier
+from .models import SpeedTestBaseline, SpeedTestResult, SpeedTestJob, SpeedTestRollup
+from .page_cache import get_index_page, invalidate_index_page
+from .partitions import is_partitioned
+from . import benchmarks, columnar, downsampling, loadtest, metrics, partitions, percentiles, probe, utils
+from .utils import BufferedResultWriter, FileLock, SpeedTestAnalyzer, SpeedTestBatchAnalyzer, SpeedTestLogger, iter_jsonl, iter_json_array, convert_json_to_jsonl
 
 class SpeedTestAnalyzerTests(TestCase):
     def setUp(self):
@@ -69,6 +92,56 @@ class SpeedTestAnalyzerTests(TestCase):
         self.assertTrue(result['is_fast'])
         self.assertEqual(result['summary'], "Інтернет-з'єднання хороше.")
 
+    def test_is_fast_connection_custom_thresholds(self):
+        # Thresholds can be configured per analyzer
+        analyzer = SpeedTestAnalyzer(download_speed=100, upload_speed=30, ping=10, min_download=200)
+        self.assertFalse(analyzer.is_fast_connection())
+        analyzer = SpeedTestAnalyzer(download_speed=40, upload_speed=30, ping=10, min_download=30)
+        self.assertTrue(analyzer.is_fast_connection())
+
+
+class SpeedTestBatchAnalyzerTests(TestCase):
+    def setUp(self):
+        self.downloads = [100, 40, 100, 100, 50]
+        self.uploads = [30, 30, 15, 30, 20]
+        self.pings = [10, 10, 10, 60, 50]
+
+    def check_matches_scalar_analyzer(self):
+        # The batch results agree with the scalar analyzer, record by record
+        batch = SpeedTestBatchAnalyzer(self.downloads, self.uploads, self.pings)
+        expected = [SpeedTestAnalyzer(d, u, p).is_fast_connection()
+                    for d, u, p in zip(self.downloads, self.uploads, self.pings)]
+        self.assertEqual([bool(x) for x in batch.is_fast_mask()], expected)
+        self.assertEqual([SpeedTestBatchAnalyzer.SUMMARIES[c] for c in batch.summary_codes()],
+                         [SpeedTestAnalyzer(d, u, p).summary()
+                          for d, u, p in zip(self.downloads, self.uploads, self.pings)])
+
+        stats = batch.statistics(percentiles=(50, 90))
+        self.assertEqual(stats['count'], 5)
+        self.assertAlmostEqual(stats['fraction_fast'], 0.4)
+        self.assertAlmostEqual(stats['download_speed']['mean'], 78)
+        self.assertAlmostEqual(stats['download_speed']['p50'], 100)
+        self.assertAlmostEqual(stats['ping']['p90'], 56)
+        self.assertEqual(stats['upload_speed']['min'], 15)
+
+    def test_numpy_path(self):
+        if utils.np is None:
+            self.skipTest("NumPy is not installed")
+        self.check_matches_scalar_analyzer()
+
+    def test_array_fallback_path(self):
+        with mock.patch('speedtest_app.utils.np', None):
+            self.check_matches_scalar_analyzer()
+
+    def test_custom_thresholds(self):
+        # Thresholds are parameters of the batch analyzer as well
+        batch = SpeedTestBatchAnalyzer(self.downloads, self.uploads, self.pings, max_ping=5)
+        self.assertEqual(batch.statistics()['fraction_fast'], 0)
+
+    def test_mismatched_columns(self):
+        with self.assertRaises(ValueError):
+            SpeedTestBatchAnalyzer([1, 2], [1], [1, 2])
+
 
 class SpeedTestLoggerTests(TestCase):
     def setUp(self):
@@ -83,6 +156,7 @@ class SpeedTestLoggerTests(TestCase):
         }
         self.json_file = "test_results.json"
         self.csv_file = "test_results.csv"
+        self.jsonl_file = "test_results.jsonl"
 
     def tearDown(self):
         # Clean up test files
@@ -90,6 +164,11 @@ class SpeedTestLoggerTests(TestCase):
             os.remove(self.json_file)
         if os.path.exists(self.csv_file):
             os.remove(self.csv_file)
+        if os.path.exists(self.jsonl_file):
+            os.remove(self.jsonl_file)
+        for path in (self.json_file, self.csv_file, self.jsonl_file):
+            if os.path.exists(path + ".lock"):
+                os.remove(path + ".lock")
 
     def test_log_to_json_creates_file(self):
         # Test that log_to_json creates a JSON file with correct data
@@ -165,10 +244,172 @@ class SpeedTestLoggerTests(TestCase):
         self.assertNotIn("download_speed", lines[1]) # Header is not duplicated in data row 1
         self.assertNotIn("download_speed", lines[2]) # Header is not duplicated in data row 2
 
+    def test_log_to_json_lines_mode_appends_one_line_per_result(self):
+        # In JSON Lines mode each result is appended as its own line
+        jsonl_logger = SpeedTestLogger(json_lines=True)
+        jsonl_logger.log_to_json(self.test_data, file_path=self.jsonl_file)
+        jsonl_logger.log_to_json(self.test_data, file_path=self.jsonl_file)
+
+        with open(self.jsonl_file, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(json.loads(lines[1]), self.test_data)
+
+    def test_iter_jsonl_skips_truncated_line(self):
+        # A line cut short by a crash is skipped instead of breaking the whole log
+        self.logger.log_to_jsonl(self.test_data, file_path=self.jsonl_file)
+        with open(self.jsonl_file, "a", encoding="utf-8") as f:
+            f.write('{"timestamp": "2023-01-01T13:00')
+        records = list(iter_jsonl(self.jsonl_file))
+        self.assertEqual(records, [self.test_data])
+
+    def test_iter_json_array_streams_small_chunks(self):
+        # Elements are decoded correctly even when they straddle chunk boundaries
+        for i in range(5):
+            self.logger.log_to_json(dict(self.test_data, ping=i), file_path=self.json_file)
+        records = list(iter_json_array(self.json_file, chunk_size=7))
+        self.assertEqual([r['ping'] for r in records], [0, 1, 2, 3, 4])
+
+    def test_convert_json_to_jsonl(self):
+        # The converter turns an existing JSON array log into JSON Lines
+        self.logger.log_to_json(self.test_data, file_path=self.json_file)
+        self.logger.log_to_json(self.test_data, file_path=self.json_file)
+        count = convert_json_to_jsonl(self.json_file, self.jsonl_file)
+        self.assertEqual(count, 2)
+        self.assertEqual(list(iter_jsonl(self.jsonl_file)), [self.test_data, self.test_data])
+
+
+    def test_log_many_to_json_and_csv(self):
+        # A batch is appended with a single rewrite/append
+        records = [dict(self.test_data, ping=i) for i in range(3)]
+        self.logger.log_to_json(self.test_data, file_path=self.json_file)
+        self.logger.log_many_to_json(records, file_path=self.json_file)
+        self.logger.log_many_to_csv(records, file_path=self.csv_file)
+        with open(self.json_file, "r", encoding="utf-8") as f:
+            self.assertEqual(len(json.load(f)), 4)
+        with open(self.csv_file, "r", encoding="utf-8") as f:
+            self.assertEqual(len(f.readlines()), 4) # Header + 3 data rows
+
+    def test_concurrent_array_writes_lose_nothing(self):
+        # The file lock keeps concurrent read-modify-write cycles from losing records
+        threads = [threading.Thread(target=self.logger.log_to_json, args=(dict(self.test_data, ping=i), self.json_file))
+                   for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        with open(self.json_file, "r", encoding="utf-8") as f:
+            self.assertEqual(sorted(r['ping'] for r in json.load(f)), list(range(20)))
+
+
+class LogRotationTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = tmp.name
+
+    def records(self, days):
+        return [{'timestamp': datetime(2025, 6, day, 12).isoformat(), 'download_speed': float(day),
+                 'upload_speed': 1.0, 'ping': 1.0} for day in days]
+
+    def test_size_rotation_compresses_segments_and_fills_the_manifest(self):
+        path = os.path.join(self.directory, "results.csv")
+        logger = SpeedTestLogger(max_bytes=120)
+        for day in range(1, 11):
+            logger.log_to_csv(self.records([day])[0], file_path=path)
+
+        manifest = utils.read_manifest(path)
+        segments = manifest['segments']
+        self.assertGreater(len(segments), 1)
+        for segment in segments:
+            self.assertTrue(segment['file'].endswith('.csv.gz'))
+            with gzip.open(os.path.join(self.directory, segment['file']), 'rt') as f:
+                self.assertTrue(f.readline().startswith('timestamp,'))  # Every segment has its header
+        self.assertEqual(segments[0]['first'], '2025-06-01T12:00:00')
+        self.assertEqual(sum(segment['rows'] for segment in segments) + len(list(utils.iter_csv(path))), 10)
+        self.assertEqual([float(r['download_speed']) for r in utils.iter_log_range(path)],
+                         [float(day) for day in range(1, 11)])
+
+    def test_age_rotation(self):
+        path = os.path.join(self.directory, "results.jsonl")
+        logger = SpeedTestLogger(json_lines=True, max_age=3600)
+        logger.log_many_to_jsonl(self.records([1, 2]), file_path=path)
+        logger.log_to_jsonl(self.records([3])[0], file_path=path)
+        self.assertEqual(utils.read_manifest(path)['segments'], [])
+        with mock.patch("speedtest_app.utils.time.time", return_value=time.time() + 3601):
+            logger.log_to_jsonl(self.records([4])[0], file_path=path)
+        segment, = utils.read_manifest(path)['segments']
+        self.assertEqual((segment['rows'], segment['last']), (3, '2025-06-03T12:00:00'))
+        self.assertEqual([r['download_speed'] for r in utils.iter_jsonl(path)], [4.0])
+
+    def test_range_reads_open_only_overlapping_segments(self):
+        path = os.path.join(self.directory, "results.json")
+        logger = SpeedTestLogger(max_bytes=1)  # One segment per write
+        for days in ([1, 2], [5, 6], [9]):
+            logger.log_many_to_json(self.records(days), file_path=path)
+        self.assertEqual(len(utils.read_manifest(path)['segments']), 2)
+
+        opened = []
+        iter_log = utils.iter_log
+        with mock.patch("speedtest_app.utils.iter_log", side_effect=lambda p: opened.append(p) or iter_log(p)):
+            records = list(utils.iter_log_range(path, since=datetime(2025, 6, 5), until=datetime(2025, 6, 6)))
+        self.assertEqual([r['download_speed'] for r in records], [5.0])
+        # The first segment ends before the range and is skipped; the current file is always read
+        self.assertEqual([os.path.basename(p) for p in opened],
+                         [utils.read_manifest(path)['segments'][1]['file'], "results.json"])
+
+    def test_rotation_is_off_by_default(self):
+        path = os.path.join(self.directory, "results.csv")
+        SpeedTestLogger().log_many_to_csv(self.records(range(1, 30)), file_path=path)
+        self.assertFalse(os.path.exists(path + utils.MANIFEST_SUFFIX))
+
+
+class BufferedResultWriterTests(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.jsonl_file = os.path.join(self.dir, "results.jsonl")
+        self.csv_file = os.path.join(self.dir, "results.csv")
+
+    def make_writer(self, **kwargs):
+        writer = BufferedResultWriter(logger=SpeedTestLogger(json_lines=True), json_path=self.jsonl_file,
+                                      csv_path=self.csv_file, **kwargs)
+        self.addCleanup(writer.close)
+        return writer
+
+    def test_records_are_written_in_batches(self):
+        # Submitted records are batched and written by the background thread
+        writer = self.make_writer(batch_size=10, flush_interval=5)
+        with mock.patch.object(writer.logger, 'log_many_to_jsonl', wraps=writer.logger.log_many_to_jsonl) as write:
+            for i in range(25):
+                writer.submit({'ping': i})
+            writer.close()
+        self.assertEqual([r['ping'] for r in iter_jsonl(self.jsonl_file)], list(range(25)))
+        self.assertLessEqual(write.call_count, 3)
+        with open(self.csv_file, "r", encoding="utf-8") as f:
+            self.assertEqual(len(f.readlines()), 26)
+
+    def test_flush_waits_for_pending_records(self):
+        # flush() returns once the time threshold has written everything
+        writer = self.make_writer(batch_size=100, flush_interval=0.05)
+        writer.submit({'ping': 1})
+        writer.flush()
+        self.assertEqual(list(iter_jsonl(self.jsonl_file)), [{'ping': 1}])
+
+    def test_submit_after_close_fails(self):
+        writer = self.make_writer()
+        writer.close()
+        with self.assertRaises(RuntimeError):
+            writer.submit({'ping': 1})
+
 
 class ViewsTestCase(DjangoTestCase):
     def setUp(self):
         self.client = Client()
+        # Every test starts without a cached (possibly mocked) speedtest backend or page
+        server_cache.invalidate()
+        self.addCleanup(server_cache.invalidate)
+        invalidate_index_page()
+        self.addCleanup(invalidate_index_page)
 
     def test_index_view(self):
         # Test that the index view renders successfully and contains some expected content
@@ -181,20 +422,75 @@ class ViewsTestCase(DjangoTestCase):
         self.assertIn('latest_results', response.context)
         self.assertEqual(len(response.context['latest_results']), 0) # Initially no results
 
-        # Add a result and check again
-        SpeedTestResult.objects.create(download_speed=10, upload_speed=5, ping=20,
-                                       server_name="Test", server_location="Loc", server_country="C")
+        # Add a result and check again; the cached page is dropped once the result is committed
+        with self.captureOnCommitCallbacks(execute=True):
+            SpeedTestResult.objects.create(download_speed=10, upload_speed=5, ping=20,
+                                           server_name="Test", server_location="Loc", server_country="C")
         response = self.client.get(reverse('speedtest_app:index'))
         self.assertEqual(len(response.context['latest_results']), 1)
 
+    def test_index_page_is_cached_until_a_result_is_saved(self):
+        self.client.get(reverse('speedtest_app:index'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('speedtest_app:index'))
+        self.assertContains(response, "Internet Speed Test")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            SpeedTestResult.objects.create(download_speed=12.5, upload_speed=5, ping=20, server_name="New")
+        self.assertContains(self.client.get(reverse('speedtest_app:index')), "12.50 Mbps")
+
+    def test_index_page_conditional_requests(self):
+        # Unchanged pages are answered with 304 Not Modified
+        response = self.client.get(reverse('speedtest_app:index'))
+        self.assertIn('no-cache', response['Cache-Control'])
+        etag = response['ETag']
+        response = self.client.get(reverse('speedtest_app:index'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(reverse('speedtest_app:index'), HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+        # A new result changes the ETag
+        with self.captureOnCommitCallbacks(execute=True):
+            SpeedTestResult.objects.create(download_speed=10, upload_speed=5, ping=20)
+        response = self.client.get(reverse('speedtest_app:index'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_index_page_last_modified_is_newest_result(self):
+        timestamp = datetime(2024, 5, 1, 12, 30, 15, 500, tzinfo=timezone.utc)
+        SpeedTestResult.objects.create(download_speed=10, upload_speed=5, ping=20, timestamp=timestamp)
+        response = self.client.get(reverse('speedtest_app:index'))
+        self.assertEqual(response['Last-Modified'], 'Wed, 01 May 2024 12:30:15 GMT')
+        # The page script places late-arriving older results by this timestamp
+        shown = re.search(r'data-timestamp="([^"]+)"', response.content.decode())[1]
+        self.assertEqual(datetime.fromisoformat(shown), timestamp)
+
+    def test_invalidation_during_rendering_is_not_lost(self):
+        # A page rendered before a result was committed must not be served after it
+        def render_stale():
+            invalidate_index_page()
+            return "stale", None
+
+        self.assertEqual(get_index_page(render_stale)['content'], "stale")
+        self.assertEqual(get_index_page(lambda: ("fresh", None))['content'], "fresh")
+        self.assertEqual(get_index_page(lambda: ("unused", None))['content'], "fresh")
+
+    def test_bulk_ingest_invalidates_index_page(self):
+        self.client.get(reverse('speedtest_app:index'))
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_records([{'probe_id': 'p1', 'timestamp': '2025-06-11T10:00:00+00:00',
+                             'download_speed': 77.7, 'upload_speed': 1, 'ping': 1}])
+        self.assertContains(self.client.get(reverse('speedtest_app:index')), "77.70 Mbps")
+
 
     # Fix: Corrected patch path for SpeedTestLogger
-    @mock.patch("speedtest_app.views.SpeedTestLogger") # Patch SpeedTestLogger in views.py
-    @mock.patch("speedtest.Speedtest")                 # Patch speedtest.Speedtest class
+    @override_settings(SPEEDTEST_JOB_EXECUTOR='sync', SPEEDTEST_LOG_BUFFERED=False)
+    @mock.patch("speedtest_app.measurement.SpeedTestLogger") # Patch SpeedTestLogger in measurement.py
+    @mock.patch("speedtest.Speedtest")                       # Patch speedtest.Speedtest class
     def test_check_speed_mocked_success(self, mock_st_cls, mock_speedtest_logger_cls):
         # Arguments order: `mock_st_cls` comes from the last decorator, `mock_speedtest_logger_cls` from the first
         # So `mock_st_cls` is for speedtest.Speedtest
-        # `mock_speedtest_logger_cls` is for speedtest_app.views.SpeedTestLogger
+        # `mock_speedtest_logger_cls` is for speedtest_app.measurement.SpeedTestLogger
 
         # Configure the mock Speedtest instance
         mock_st_instance = mock_st_cls.return_value
@@ -214,10 +510,18 @@ class ViewsTestCase(DjangoTestCase):
         # Ensure no SpeedTestResult objects exist before the test
         self.assertEqual(SpeedTestResult.objects.count(), 0)
 
-        # Use GET request as per the current views.py
+        # Starting a test only queues a job and returns its id
         response = self.client.get(reverse("speedtest_app:check_speed"))
+        self.assertEqual(response.status_code, 202)
+        job = response.json()
+        self.assertTrue(job["success"])
+        self.assertIn("job_id", job)
+
+        # The job status endpoint carries the measured values once the job is done
+        response = self.client.get(job["status_url"])
         self.assertEqual(response.status_code, 200)
         data = response.json()
+        self.assertEqual(data["status"], "done")
         self.assertTrue(data["success"])
         self.assertAlmostEqual(data["download_speed"], 100.0, places=2)
         self.assertAlmostEqual(data["upload_speed"], 50.0, places=2)
@@ -243,17 +547,58 @@ class ViewsTestCase(DjangoTestCase):
         # For example: mock_speedtest_logger_instance.log_to_json.assert_called_once_with(mock.ANY, file_path="speedtest_results.json")
 
 
+    @override_settings(SPEEDTEST_JOB_EXECUTOR='sync', SPEEDTEST_LOG_BUFFERED=True)
+    @mock.patch("speedtest_app.measurement.get_result_writer")
+    def test_check_speed_logs_through_buffered_writer(self, mock_get_writer):
+        # With buffering enabled the job only queues the result for the background writer
+        with mock.patch("speedtest.Speedtest", FakeSpeedtest):
+            self.client.post(reverse("speedtest_app:check_speed"))
+        mock_get_writer.return_value.submit.assert_called_once()
+        self.assertEqual(mock_get_writer.return_value.submit.call_args[0][0]['download_speed'], 100.0)
+
+    @override_settings(SPEEDTEST_JOB_EXECUTOR='sync', SPEEDTEST_LOG_BUFFERED=True)
+    @mock.patch("speedtest_app.measurement.SpeedTestLogger")
+    @mock.patch("speedtest_app.measurement.get_result_writer")
+    def test_process_workers_log_unbuffered(self, mock_get_writer, mock_logger):
+        # Worker processes skip atexit, so their results are written before the job ends
+        with mock.patch("speedtest.Speedtest", FakeSpeedtest), \
+                mock.patch("multiprocessing.parent_process", return_value=mock.Mock()):
+            self.client.post(reverse("speedtest_app:check_speed"))
+        mock_get_writer.assert_not_called()
+        mock_logger.return_value.log_to_json.assert_called_once()
+        mock_logger.return_value.log_to_csv.assert_called_once()
+
+    @override_settings(SPEEDTEST_JOB_EXECUTOR='sync')
     @mock.patch("speedtest.Speedtest", side_effect=Exception("Mocked speedtest error"))
     def test_check_speed_handles_error(self, mock_speedtest):
-        # Simulate a failure during speed test and ensure proper error response is returned
-        response = self.client.get(reverse("speedtest_app:check_speed")) # Use GET
-        self.assertEqual(response.status_code, 500)
+        # Simulate a failure during speed test and ensure the job reports the error
+        response = self.client.post(reverse("speedtest_app:check_speed"))
+        self.assertEqual(response.status_code, 202)
+        response = self.client.get(response.json()["status_url"])
         data = response.json()
+        self.assertEqual(data["status"], "failed")
         self.assertFalse(data["success"])
         self.assertIn("error", data)
         self.assertEqual(data["error"], "Mocked speedtest error")
         self.assertEqual(SpeedTestResult.objects.count(), 0) # No DB entry on error
 
+    def test_check_speed_status_reports_queued_job(self):
+        # A job that has not been picked up by a worker yet is reported as queued
+        job = SpeedTestJob.objects.create()
+        response = self.client.get(reverse("speedtest_app:check_speed_status", args=[job.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], "queued")
+
+    def test_check_speed_status_unknown_job(self):
+        # Unknown job ids return 404
+        response = self.client.get(reverse("speedtest_app:check_speed_status", args=[uuid.uuid4()]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_check_speed_method_not_allowed(self):
+        # Only GET and POST start a speed test
+        response = self.client.put(reverse("speedtest_app:check_speed"))
+        self.assertEqual(response.status_code, 405)
+
     def test_export_results_json(self):
         # Create some test data with distinct timestamps for reliable ordering
         SpeedTestResult.objects.create(
@@ -276,9 +621,10 @@ class ViewsTestCase(DjangoTestCase):
         )
         response = self.client.get(reverse("speedtest_app:export_results", args=["json"]))
         self.assertEqual(response.status_code, 200)
-        data = response.json()
+        self.assertTrue(response.streaming)
+        data = json.loads(b''.join(response.streaming_content))
         self.assertIsInstance(data, list)
-        self.assertEqual(len(data), 2) # Check if all records are exported (up to 100)
+        self.assertEqual(len(data), 2) # Check if all records are exported
         self.assertEqual(data[0]['download_speed'], 200.0) # Check ordering (latest first)
         self.assertEqual(data[1]['download_speed'], 100.0)
 
@@ -297,15 +643,1337 @@ class ViewsTestCase(DjangoTestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn("text/csv", response["Content-Type"])
         self.assertIn('attachment; filename="speedtest_results.csv"', response["Content-Disposition"])
-        decoded_content = response.content.decode('utf-8')
+        decoded_content = b''.join(response.streaming_content).decode('utf-8')
         lines = decoded_content.strip().split('\n')
         self.assertEqual(len(lines), 2) # Header + 1 data row
         self.assertIn("Download (Mbps)", lines[0]) # Check header
         self.assertIn("100.0", lines[1]) # Check data - corrected to 100.0
 
 
+    def test_export_results_is_not_capped(self):
+        # Every matching row is exported, not just the latest 100
+        SpeedTestResult.objects.bulk_create([
+            SpeedTestResult(download_speed=i, upload_speed=1, ping=1) for i in range(150)
+        ])
+        response = self.client.get(reverse("speedtest_app:export_results", args=["json"]))
+        self.assertEqual(len(json.loads(b''.join(response.streaming_content))), 150)
+
+    def test_export_results_filters(self):
+        # since/until bound the time range and server selects a single server
+        now = datetime.now(timezone.utc)
+        SpeedTestResult.objects.create(download_speed=1, upload_speed=1, ping=1, server_name="A",
+                                       timestamp=now - timedelta(days=10))
+        SpeedTestResult.objects.create(download_speed=2, upload_speed=1, ping=1, server_name="A",
+                                       timestamp=now - timedelta(days=1))
+        SpeedTestResult.objects.create(download_speed=3, upload_speed=1, ping=1, server_name="B",
+                                       timestamp=now - timedelta(days=1))
+        url = reverse("speedtest_app:export_results", args=["json"])
+        since = (now - timedelta(days=2)).date().isoformat()
+
+        response = self.client.get(url, {"since": since, "server": "A"})
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([r['download_speed'] for r in data], [2.0])
+
+        response = self.client.get(url, {"until": since})
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([r['download_speed'] for r in data], [1.0])
+
+    def test_export_results_columnar(self):
+        # The binary snapshot holds the filtered rows oldest first, with dictionary-encoded servers
+        now = datetime.now(timezone.utc).replace(microsecond=123456)
+        SpeedTestResult.objects.create(download_speed=200, upload_speed=80, ping=5, server_name="B",
+                                       server_country="PL", timestamp=now)
+        older = SpeedTestResult.objects.create(download_speed=100.5, upload_speed=50, ping=10, server_name="A",
+                                               server_country="PL", timestamp=now - timedelta(seconds=1))
+        SpeedTestResult.objects.filter(pk=older.pk).update(is_anomaly=True)
+        response = self.client.get(reverse("speedtest_app:export_results", args=["columnar"]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/octet-stream")
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "results.stcol")
+            with open(path, "wb") as f:
+                f.writelines(response.streaming_content)
+            with columnar.open_snapshot(path) as snapshot:
+                self.assertEqual(len(snapshot), 2)
+                self.assertEqual(list(snapshot.column("download_speed")), [100.5, 200.0])
+                self.assertEqual(list(snapshot.column("is_anomaly")), [1, 0])
+                timestamps = list(snapshot.column("timestamp"))
+                self.assertEqual(timestamps[1], int(now.timestamp()) * 1_000_000 + 123456)
+                self.assertEqual([snapshot.decode("server_name", c) for c in snapshot.column("server_name")],
+                                 ["A", "B"])
+                self.assertEqual(list(snapshot.column("server_country")), [0, 0])
+
+    def test_export_results_invalid_filter(self):
+        # Malformed dates are rejected with 400 Bad Request
+        response = self.client.get(reverse("speedtest_app:export_results", args=["csv"]), {"since": "yesterday"})
+        self.assertEqual(response.status_code, 400)
+
     def test_export_results_invalid_format(self):
         # Test that an unsupported export format returns a 400 Bad Request response
         response = self.client.get(reverse("speedtest_app:export_results", args=["xml"]))
         self.assertEqual(response.status_code, 400)
-        self.assertEqual(response.content.decode('utf-8'), "Invalid format")
\ No newline at end of file
+        self.assertEqual(response.content.decode('utf-8'), "Invalid format")
+
+
+class AsyncViewsTests(DjangoTestCase):
+    # Requests through the async client are ASGI requests, as under Uvicorn
+    def setUp(self):
+        invalidate_index_page()
+        self.addCleanup(invalidate_index_page)
+
+    async def read(self, response):
+        self.assertTrue(response.is_async)
+        return b"".join([chunk async for chunk in response.streaming_content])
+
+    async def test_export_streams_rows_from_the_async_orm(self):
+        now = datetime.now(timezone.utc)
+        await SpeedTestResult.objects.acreate(download_speed=1, upload_speed=1, ping=1, server_name="A",
+                                              timestamp=now - timedelta(days=1))
+        await SpeedTestResult.objects.acreate(download_speed=2, upload_speed=1, ping=1, server_name="B",
+                                              timestamp=now)
+        url = reverse("speedtest_app:export_results", args=["json"])
+        with mock.patch("speedtest_app.views.EXPORT_CHUNK_SIZE", 1):
+            data = json.loads(await self.read(await self.async_client.get(url)))
+        self.assertEqual([r["download_speed"] for r in data], [2.0, 1.0])
+
+        data = json.loads(await self.read(await self.async_client.get(url, {"server": "A"})))
+        self.assertEqual([r["server_name"] for r in data], ["A"])
+
+        response = await self.async_client.get(reverse("speedtest_app:export_results", args=["csv"]))
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="speedtest_results.csv"')
+        self.assertEqual(len((await self.read(response)).decode().strip().split("\n")), 3)
+
+        body = await self.read(await self.async_client.get(reverse("speedtest_app:export_results",
+                                                                   args=["columnar"])))
+        self.assertTrue(body.startswith(columnar.MAGIC))
+        self.assertEqual(len(body) % columnar.ALIGNMENT, 0)
+
+    async def test_index_and_job_status(self):
+        await SpeedTestResult.objects.acreate(download_speed=33.3, upload_speed=1, ping=1)
+        response = await self.async_client.get(reverse("speedtest_app:index"))
+        self.assertContains(response, "33.30 Mbps")
+        response = await self.async_client.get(reverse("speedtest_app:index"), headers={"If-None-Match": response["ETag"]})
+        self.assertEqual(response.status_code, 304)
+
+        job = await SpeedTestJob.objects.acreate()
+        response = await self.async_client.get(reverse("speedtest_app:check_speed_status", args=[job.pk]))
+        self.assertEqual(response.json()["status"], "queued")
+        response = await self.async_client.get(reverse("speedtest_app:check_speed_status", args=[uuid.uuid4()]))
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(SPEEDTEST_JOB_EXECUTOR='sync', SPEEDTEST_LOG_BUFFERED=False)
+    async def test_check_speed_submits_the_job(self):
+        server_cache.invalidate()
+        self.addCleanup(server_cache.invalidate)
+        with mock.patch("speedtest.Speedtest", side_effect=Exception("offline")):
+            response = await self.async_client.post(reverse("speedtest_app:check_speed"))
+        self.assertEqual(response.status_code, 202)
+        job = await SpeedTestJob.objects.aget(pk=response.json()["job_id"])
+        self.assertEqual(job.status, SpeedTestJob.STATUS_FAILED)
+
+
+# The listener thread would keep a connection to the test database open; it is tested on its own
+@override_settings(SPEEDTEST_RESULTS_LISTEN=False)
+class ResultsSinceTests(DjangoTestCase):
+    def url(self, last_id):
+        return reverse("speedtest_app:results_since", args=[last_id])
+
+    async def test_returns_newer_results_as_rows(self):
+        first = await SpeedTestResult.objects.acreate(download_speed=1, upload_speed=1, ping=1)
+        second = await SpeedTestResult.objects.acreate(download_speed=2, upload_speed=1, ping=1, server_name="A")
+        third = await SpeedTestResult.objects.acreate(download_speed=3, upload_speed=1, ping=1)
+
+        response = await self.async_client.get(self.url(first.pk))
+        data = response.json()
+        self.assertEqual(response["Cache-Control"], "no-cache")
+        self.assertEqual(data["last_id"], third.pk)
+        self.assertEqual([row[0] for row in data["results"]], [second.pk, third.pk])
+        row = dict(zip(data["fields"], data["results"][0]))
+        self.assertEqual((row["download_speed"], row["server_name"]), (2.0, "A"))
+
+        data = (await self.async_client.get(self.url(first.pk), {"limit": 1})).json()
+        self.assertEqual((data["last_id"], len(data["results"])), (second.pk, 1))
+        data = (await self.async_client.get(self.url(third.pk))).json()
+        self.assertEqual((data["last_id"], data["results"]), (third.pk, []))
+
+        for params in ({"limit": 0}, {"limit": "x"}, {"wait": -1}, {"wait": "nan"}):
+            response = await self.async_client.get(self.url(0), params)
+            self.assertEqual(response.status_code, 400)
+
+    @override_settings(SPEEDTEST_LONG_POLL_MAX_WAIT=0.2)
+    async def test_long_poll_times_out_empty(self):
+        started = time.monotonic()
+        data = (await self.async_client.get(self.url(0), {"wait": 60})).json()
+        self.assertEqual((data["last_id"], data["results"]), (0, []))
+        self.assertTrue(0.2 <= time.monotonic() - started < 5)
+
+    def test_wsgi_requests_do_not_wait(self):
+        # A waiting request would hold a WSGI worker thread, so ?wait= is ignored there
+        started = time.monotonic()
+        with mock.patch.object(result_notifier, "subscribe") as subscribe:
+            data = self.client.get(self.url(0), {"wait": 30}).json()
+        self.assertEqual(data["results"], [])
+        self.assertLess(time.monotonic() - started, 5)
+        subscribe.assert_not_called()
+
+    async def test_long_poll_is_woken_by_a_new_result(self):
+        started = time.monotonic()
+        request = asyncio.ensure_future(self.async_client.get(self.url(0), {"wait": 10}))
+        await asyncio.sleep(0.2)
+        self.assertFalse(request.done())
+        result = await SpeedTestResult.objects.acreate(download_speed=5, upload_speed=1, ping=1)
+        # Stands in for the on_commit callback, which never runs inside a test case
+        result_notifier.notify()
+        data = (await request).json()
+        self.assertEqual([row[0] for row in data["results"]], [result.pk])
+        self.assertLess(time.monotonic() - started, 5)
+
+    def test_new_results_notify_on_commit(self):
+        with mock.patch.object(result_notifier, "notify") as notify:
+            with self.captureOnCommitCallbacks(execute=True):
+                SpeedTestResult.objects.create(download_speed=1, upload_speed=1, ping=1)
+            self.assertEqual(notify.call_count, 1)
+            with self.captureOnCommitCallbacks(execute=True):
+                ingest_records([{"probe_id": "p", "timestamp": "2024-01-01T00:00:00Z",
+                                 "download_speed": 1, "upload_speed": 1, "ping": 1}])
+            self.assertEqual(notify.call_count, 2)
+
+    @skipUnless(connection.vendor == "postgresql", "LISTEN/NOTIFY needs PostgreSQL")
+    def test_listener_wakes_up_on_notify(self):
+        notifier = ResultNotifier()
+
+        class Woken(Exception):
+            pass
+
+        def listen():
+            try:
+                notifier._listen_once()
+            except Woken:
+                pass
+
+        with mock.patch.object(notifier, "notify", side_effect=Woken):
+            thread = threading.Thread(target=listen, daemon=True)
+            thread.start()
+            # A separate autocommit connection, as a job worker in another process would send it
+            raw = connection.get_new_connection(connection.get_connection_params())
+            raw.autocommit = True
+            try:
+                for _ in range(50):
+                    with raw.cursor() as cursor:
+                        cursor.execute("SELECT pg_notify(%s, '')", [CHANNEL])
+                    thread.join(0.1)
+                    if not thread.is_alive():
+                        break
+            finally:
+                raw.close()
+        self.assertFalse(thread.is_alive())
+
+
+class SingleFlightTests(DjangoTestCase):
+    def setUp(self):
+        self.url = reverse("speedtest_app:check_speed")
+
+    def test_concurrent_request_joins_running_job(self):
+        # While a test is running, another caller gets the same job instead of a new test
+        job = SpeedTestJob.objects.create(status=SpeedTestJob.STATUS_RUNNING)
+        with mock.patch("speedtest_app.jobs.get_executor") as get_executor:
+            data = self.client.post(self.url).json()
+        self.assertEqual(data["job_id"], str(job.pk))
+        self.assertTrue(data["shared"])
+        self.assertFalse(get_executor.called)
+        self.assertEqual(SpeedTestJob.objects.count(), 1)
+
+    @override_settings(SPEEDTEST_JOB_STALE_AFTER=60)
+    def test_stale_job_is_not_joined(self):
+        # A job whose worker apparently died does not block new tests forever
+        SpeedTestJob.objects.create(status=SpeedTestJob.STATUS_RUNNING,
+                                    created_at=datetime.now(timezone.utc) - timedelta(minutes=5))
+        with mock.patch("speedtest_app.jobs.get_executor"):
+            data = self.client.post(self.url).json()
+        self.assertFalse(data["shared"])
+        self.assertEqual(SpeedTestJob.objects.count(), 2)
+        # ... and it is marked as failed instead of staying active forever
+        self.assertEqual(SpeedTestJob.objects.filter(status=SpeedTestJob.STATUS_FAILED).count(), 1)
+
+    @override_settings(SPEEDTEST_JOB_STALE_AFTER=60)
+    def test_stale_job_is_reported_as_failed(self):
+        job = SpeedTestJob.objects.create(status=SpeedTestJob.STATUS_QUEUED)
+        SpeedTestJob.objects.filter(pk=job.pk).update(created_at=datetime.now(timezone.utc) - timedelta(minutes=5))
+        data = self.client.get(reverse("speedtest_app:check_speed_status", args=[job.pk])).json()
+        self.assertEqual((data["status"], data["success"]), ("failed", False))
+        job.refresh_from_db()
+        self.assertEqual(job.status, SpeedTestJob.STATUS_FAILED)
+        self.assertIsNotNone(job.finished_at)
+
+    @override_settings(SPEEDTEST_MIN_INTERVAL=60)
+    def test_recent_result_is_reused_within_min_interval(self):
+        # A result finished within the minimum interval is served instead of a new test
+        job = SpeedTestJob.objects.create(status=SpeedTestJob.STATUS_DONE, result={'ping': 5},
+                                          finished_at=datetime.now(timezone.utc) - timedelta(seconds=30))
+        with mock.patch("speedtest_app.jobs.get_executor"):
+            data = self.client.post(self.url).json()
+        self.assertEqual(data["job_id"], str(job.pk))
+        self.assertEqual(data["status"], "done")
+
+    def test_recent_result_is_not_reused_by_default(self):
+        SpeedTestJob.objects.create(status=SpeedTestJob.STATUS_DONE, result={'ping': 5},
+                                    finished_at=datetime.now(timezone.utc))
+        with mock.patch("speedtest_app.jobs.get_executor"):
+            data = self.client.post(self.url).json()
+        self.assertFalse(data["shared"])
+
+
+class FileLockTests(TestCase):
+    def test_lock_is_exclusive(self):
+        # A second holder waits until the first one releases the lock
+        path = os.path.join(tempfile.mkdtemp(), "test.lock")
+        events = []
+        first = FileLock(path)
+        first.acquire()
+
+        def contender():
+            with FileLock(path):
+                events.append("second")
+
+        thread = threading.Thread(target=contender)
+        thread.start()
+        thread.join(0.2)
+        events.append("first released")
+        first.release()
+        thread.join(5)
+        self.assertEqual(events, ["first released", "second"])
+
+
+@override_settings(SPEEDTEST_INGEST_TOKEN='secret')
+class BulkResultsTests(DjangoTestCase):
+    def setUp(self):
+        self.url = reverse("speedtest_app:bulk_results")
+        self.client = Client(HTTP_AUTHORIZATION="Bearer secret")
+        self.record = {
+            'probe_id': 'krakow-1',
+            'timestamp': '2025-06-11T10:00:00+00:00',
+            'download_speed': 120.5,
+            'upload_speed': 30.1,
+            'ping': 12.0,
+            'server_name': 'Server1',
+            'server_country': 'Poland',
+        }
+
+    def post_json(self, data):
+        return self.client.post(self.url, json.dumps(data), content_type="application/json")
+
+    def test_bulk_insert_json(self):
+        # Valid rows are inserted and the rollups follow
+        second = dict(self.record, timestamp='2025-06-11T10:05:00+00:00')
+        response = self.post_json([self.record, second])
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data['inserted'], data['duplicates'], data['rejected']), (2, 0, []))
+        self.assertEqual(SpeedTestResult.objects.filter(probe_id='krakow-1').count(), 2)
+        self.assertEqual(SpeedTestRollup.objects.get(granularity='hour').count, 2)
+
+    def test_bulk_insert_jsonl_with_rejects(self):
+        # JSON Lines batches report invalid lines and rows individually
+        lines = [json.dumps(self.record), "not json", json.dumps(dict(self.record, ping=-1,
+                                                                      timestamp='2025-06-11T11:00:00Z'))]
+        response = self.client.post(self.url, "\n".join(lines), content_type="application/x-ndjson")
+        data = response.json()
+        self.assertEqual(data['inserted'], 1)
+        self.assertEqual([r['index'] for r in data['rejected']], [1, 2])
+        self.assertIn("ping", data['rejected'][1]['error'])
+
+    def test_duplicates_are_skipped(self):
+        # Duplicates within the batch and against stored rows are not inserted again
+        self.post_json([self.record])
+        response = self.post_json([self.record, dict(self.record, timestamp='2025-06-11T12:00:00+02:00'),
+                                   dict(self.record, timestamp='2025-06-11T10:30:00+00:00')])
+        data = response.json()
+        self.assertEqual((data['inserted'], data['duplicates']), (1, 2))
+        self.assertEqual(SpeedTestResult.objects.count(), 2)
+
+    def test_missing_fields_are_rejected(self):
+        record = dict(self.record)
+        del record['probe_id']
+        data = self.post_json({'results': [record]}).json()
+        self.assertEqual(data['inserted'], 0)
+        self.assertIn("probe_id", data['rejected'][0]['error'])
+
+    def test_invalid_body(self):
+        response = self.client.post(self.url, "{", content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_gzip_body(self):
+        # Probes send their batches gzip-compressed
+        body = gzip.compress(json.dumps(self.record).encode())
+        response = self.client.post(self.url, body, content_type="application/x-ndjson", HTTP_CONTENT_ENCODING="gzip")
+        self.assertEqual(response.json()['inserted'], 1)
+        response = self.client.post(self.url, body[:-8], content_type="application/x-ndjson",
+                                    HTTP_CONTENT_ENCODING="gzip")
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(self.url, body, content_type="application/x-ndjson", HTTP_CONTENT_ENCODING="br")
+        self.assertEqual(response.status_code, 415)
+
+    @override_settings(SPEEDTEST_BULK_MAX_BYTES=1000)
+    def test_gzip_body_size_is_limited(self):
+        # The limit applies to the decompressed size, however well the body compresses
+        body = gzip.compress(b" " * 100_000 + json.dumps([self.record]).encode())
+        response = self.client.post(self.url, body, content_type="application/json", HTTP_CONTENT_ENCODING="gzip")
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(SpeedTestResult.objects.count(), 0)
+
+    def test_token_is_required(self):
+        response = Client().post(self.url, json.dumps([self.record]), content_type="application/json")
+        self.assertEqual(response.status_code, 401)
+        response = Client().post(self.url, json.dumps([self.record]), content_type="application/json",
+                                 HTTP_AUTHORIZATION="Bearer wrong")
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.post_json([self.record]).status_code, 200)
+
+    @override_settings(SPEEDTEST_INGEST_TOKEN='')
+    def test_disabled_without_token(self):
+        self.assertEqual(self.post_json([self.record]).status_code, 403)
+        self.assertEqual(SpeedTestResult.objects.count(), 0)
+
+    @override_settings(SPEEDTEST_BULK_MAX_UPLOAD_BYTES=1000, DATA_UPLOAD_MAX_MEMORY_SIZE=100)
+    def test_upload_size_has_its_own_limit(self):
+        # The endpoint accepts bodies beyond DATA_UPLOAD_MAX_MEMORY_SIZE, up to its own limit
+        self.assertEqual(self.post_json([self.record]).status_code, 200)
+        record = dict(self.record, server_name="x" * 2000)
+        self.assertEqual(self.post_json([record]).status_code, 413)
+
+
+class SpeedTestResultIndexTests(DjangoTestCase):
+    def setUp(self):
+        now = datetime.now(timezone.utc)
+        SpeedTestResult.objects.bulk_create([
+            SpeedTestResult(download_speed=i, upload_speed=1, ping=1,
+                            server_name=f"Server{i % 3}", server_country=f"Country{i % 2}",
+                            timestamp=now - timedelta(minutes=i))
+            for i in range(50)
+        ])
+
+    def plan(self, queryset):
+        # Returns the query plan; on PostgreSQL sequential scans are disabled because
+        # the planner would prefer them for a table this small
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+        return queryset.explain()
+
+    def assertUsesIndex(self, index_name, plan):
+        # On a partitioned table the plan names the partitions' copies of the index
+        names = [index_name]
+        if is_partitioned():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                               "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = %s", [index_name])
+                names = [row[0] for row in cursor.fetchall()]
+        self.assertTrue(any(name in plan for name in names), plan)
+
+    def test_index_page_query_uses_timestamp_index(self):
+        # The latest results query on the index page is served by the timestamp index
+        plan = self.plan(SpeedTestResult.objects.all()[:5])
+        self.assertUsesIndex('speedtest_ts_desc_idx', plan)
+
+    def test_server_export_query_uses_server_index(self):
+        # Exports filtered by server use the (server_name, timestamp) index
+        plan = self.plan(SpeedTestResult.objects.filter(server_name="Server1").order_by('-timestamp'))
+        self.assertUsesIndex('speedtest_server_ts_idx', plan)
+
+    def test_country_query_uses_country_index(self):
+        # Per-country queries over a time range use the (server_country, timestamp) index
+        since = datetime.now(timezone.utc) - timedelta(minutes=10)
+        plan = self.plan(SpeedTestResult.objects.filter(server_country="Country1", timestamp__gte=since))
+        self.assertUsesIndex('speedtest_country_ts_idx', plan)
+
+
+
+class PartitionTests(DjangoTestCase):
+    def test_month_arithmetic(self):
+        month = partitions.month_start(datetime(2025, 12, 31, 23, 30, tzinfo=timezone(timedelta(hours=-2))))
+        self.assertEqual(month, datetime(2026, 1, 1, tzinfo=timezone.utc))
+        self.assertEqual(partitions.add_months(month, -13), datetime(2024, 12, 1, tzinfo=timezone.utc))
+        self.assertEqual(partitions.partition_name(month), 'speedtest_app_speedtestresult_p202601')
+
+    def test_prune_results_deletes_old_months(self):
+        now = datetime.now(timezone.utc)
+        for days in (0, 40, 100, 400):
+            SpeedTestResult.objects.create(download_speed=1, upload_speed=1, ping=1,
+                                           timestamp=now - timedelta(days=days))
+        call_command('prune_results', '--keep-months', '6', stdout=io.StringIO())
+        self.assertEqual(SpeedTestResult.objects.count(), 3)
+        call_command('prune_results', '--keep-months', '1', '--dry-run', stdout=io.StringIO())
+        self.assertEqual(SpeedTestResult.objects.count(), 3)
+
+    def test_prune_results_requires_retention(self):
+        with self.assertRaises(CommandError):
+            call_command('prune_results', stdout=io.StringIO())
+
+    @skipUnless(connection.vendor == 'postgresql', "Partitioning needs PostgreSQL")
+    def test_partitioned_table_keeps_orm_working(self):
+        # Converts the (empty) test table unless migration 0008 already did; the conversion
+        # is rolled back with the test transaction, so the cached table layout is dropped too
+        self.addCleanup(partitions._partitioned.clear)
+        with connection.schema_editor() as schema_editor:
+            partitions.convert_to_partitioned(SpeedTestResult, schema_editor)
+        self.assertTrue(partitions.is_partitioned())
+
+        old = datetime(2020, 5, 17, tzinfo=timezone.utc)
+        SpeedTestResult.objects.create(download_speed=1, upload_speed=1, ping=1, timestamp=old)
+        SpeedTestResult.objects.create(download_speed=2, upload_speed=1, ping=1)
+        self.assertIn(datetime(2020, 5, 1, tzinfo=timezone.utc), partitions.list_partitions())
+        self.assertEqual(SpeedTestResult.objects.latest('timestamp').download_speed, 2)
+
+        # A query on one month only reads that month's partition
+        this_month = partitions.month_start(datetime.now(timezone.utc))
+        plan = SpeedTestResult.objects.filter(
+            timestamp__gte=this_month, timestamp__lt=partitions.add_months(this_month, 1)).explain()
+        self.assertIn(partitions.partition_name(this_month), plan)
+        self.assertEqual(set(re.findall(r'speedtest_app_speedtestresult_p\d{6}\b', plan)),
+                         {partitions.partition_name(this_month)})
+
+        out = io.StringIO()
+        call_command('create_partitions', '--months-ahead', '1', stdout=out)
+        call_command('prune_results', '--keep-months', '12', stdout=out)
+        self.assertIn('Dropped speedtest_app_speedtestresult_p202005', out.getvalue())
+        self.assertEqual(SpeedTestResult.objects.count(), 1)
+
+
+@skipUnless(connection.vendor == 'postgresql', "Partitioning needs PostgreSQL")
+class PartitionMaintenanceTests(TransactionTestCase):
+    # Outside a test transaction, so partitions are created and dropped for real
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Unlike in PartitionTests the conversion is committed; the rest of the suite works on either layout
+        with connection.schema_editor() as schema_editor:
+            partitions.convert_to_partitioned(SpeedTestResult, schema_editor)
+
+    def setUp(self):
+        self.old = datetime(2020, 5, 17, tzinfo=timezone.utc)
+        self.addCleanup(partitions.drop_partitions_before, datetime(2020, 6, 1, tzinfo=timezone.utc))
+
+    def test_known_partitions_skip_the_catalog(self):
+        SpeedTestResult.objects.create(download_speed=1, upload_speed=1, ping=1, timestamp=self.old)
+        with mock.patch.object(partitions, 'list_partitions', side_effect=AssertionError):
+            SpeedTestResult.objects.create(download_speed=2, upload_speed=1, ping=1, timestamp=self.old)
+        self.assertEqual(SpeedTestResult.objects.count(), 2)
+
+    def test_old_partitions_are_detached_and_dropped(self):
+        SpeedTestResult.objects.create(download_speed=1, upload_speed=1, ping=1, timestamp=self.old)
+        SpeedTestResult.objects.create(download_speed=2, upload_speed=1, ping=1)
+        with CaptureQueriesContext(connection) as queries:
+            dropped = partitions.drop_partitions_before(datetime(2020, 6, 1, tzinfo=timezone.utc))
+        self.assertEqual(dropped, ['speedtest_app_speedtestresult_p202005'])
+        self.assertTrue(any('DETACH PARTITION' in q['sql'] and q['sql'].endswith('CONCURRENTLY')
+                            for q in queries.captured_queries))
+        self.assertEqual(SpeedTestResult.objects.count(), 1)
+        # A dropped month is created again by the next insert
+        SpeedTestResult.objects.create(download_speed=3, upload_speed=1, ping=1, timestamp=self.old)
+        self.assertEqual(SpeedTestResult.objects.count(), 2)
+
+    def drop_elsewhere(self, name):
+        # Drops the partition as prune_results run in another process would, leaving this process' cache as it is
+        with connection.cursor() as cursor:
+            cursor.execute(f'ALTER TABLE "{partitions.TABLE}" DETACH PARTITION "{name}"')
+            cursor.execute(f'DROP TABLE "{name}"')
+
+    @override_settings(SPEEDTEST_JOB_EXECUTOR='sync', SPEEDTEST_LOG_BUFFERED=False)
+    def test_partition_dropped_by_another_process_is_recreated(self):
+        SpeedTestResult.objects.create(download_speed=1, upload_speed=1, ping=1, timestamp=self.old)
+        self.drop_elsewhere('speedtest_app_speedtestresult_p202005')
+        summary = ingest_records([{'probe_id': 'p1', 'timestamp': self.old.isoformat(),
+                                   'download_speed': 1, 'upload_speed': 1, 'ping': 1}])
+        self.assertEqual(summary['inserted'], 1)
+
+        this_month = partitions.month_start(datetime.now(timezone.utc))
+        with mock.patch("speedtest.Speedtest", FakeSpeedtest), \
+                mock.patch("speedtest_app.measurement.SpeedTestLogger"):
+            perform_speed_test()
+            self.drop_elsewhere(partitions.partition_name(this_month))
+            perform_speed_test()
+        self.assertEqual(SpeedTestResult.objects.filter(timestamp__gte=this_month).count(), 1)
+        self.assertEqual(SpeedTestResult.objects.count(), 2)
+
+
+class SpeedTestRollupTests(DjangoTestCase):
+    def setUp(self):
+        self.hour = datetime(2025, 6, 11, 10, 0, 0, tzinfo=timezone.utc)
+        SpeedTestResult.objects.create(download_speed=100, upload_speed=20, ping=10, server_name="A",
+                                       timestamp=self.hour + timedelta(minutes=5))
+        SpeedTestResult.objects.create(download_speed=50, upload_speed=40, ping=30, server_name="A",
+                                       timestamp=self.hour + timedelta(minutes=50))
+        SpeedTestResult.objects.create(download_speed=150, upload_speed=30, ping=20, server_name="B",
+                                       timestamp=self.hour + timedelta(hours=2))
+
+    def test_rollups_updated_on_save(self):
+        # Each saved result is folded into its hourly and daily bucket
+        rollup = SpeedTestRollup.objects.get(granularity='hour', bucket_start=self.hour, server_name="A")
+        self.assertEqual(rollup.count, 2)
+        self.assertEqual(rollup.download_min, 50)
+        self.assertEqual(rollup.download_max, 100)
+        self.assertEqual(rollup.download_sum, 150)
+        self.assertEqual(rollup.download_sumsq, 100 ** 2 + 50 ** 2)
+        self.assertEqual(SpeedTestRollup.objects.filter(granularity='day').count(), 2) # One per server
+
+    def test_rebuild_matches_incremental_rollups(self):
+        # Rebuilding from raw rows gives the same rollups as the incremental updates
+        fields = ('granularity', 'bucket_start', 'server_name', 'count', 'download_min', 'download_max',
+                  'download_sum', 'download_sumsq', 'ping_sum', 'upload_max')
+        incremental = list(SpeedTestRollup.objects.values_list(*fields))
+        call_command('rebuild_rollups', stdout=io.StringIO())
+        self.assertEqual(list(SpeedTestRollup.objects.values_list(*fields)), incremental)
+
+    def test_stats_endpoint_merges_servers(self):
+        # Daily stats combine the buckets of all servers
+        response = self.client.get(reverse("speedtest_app:stats"), {"granularity": "day"})
+        self.assertEqual(response.status_code, 200)
+        buckets = response.json()['buckets']
+        self.assertEqual(len(buckets), 1)
+        self.assertEqual(buckets[0]['count'], 3)
+        self.assertEqual(buckets[0]['download']['min'], 50)
+        self.assertEqual(buckets[0]['download']['max'], 150)
+        self.assertEqual(buckets[0]['download']['mean'], 100)
+        self.assertAlmostEqual(buckets[0]['download']['stddev'], 40.82, places=2)
+
+    def test_stats_endpoint_hourly_with_server_filter(self):
+        # Hourly stats can be narrowed down to one server
+        response = self.client.get(reverse("speedtest_app:stats"), {"granularity": "hour", "server": "A"})
+        buckets = response.json()['buckets']
+        self.assertEqual([b['count'] for b in buckets], [2])
+        self.assertEqual(buckets[0]['ping']['mean'], 20)
+
+    def test_stats_endpoint_invalid_granularity(self):
+        # Only hour and day granularities are supported
+        response = self.client.get(reverse("speedtest_app:stats"), {"granularity": "week"})
+        self.assertEqual(response.status_code, 400)
+
+
+
+class ColumnarSnapshotTests(TestCase):
+    def setUp(self):
+        start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        self.rows = [(i, start + timedelta(minutes=i), i * 1.5, i / 4, 10.0 + i % 3, f"S{i % 5}", "PL", i % 7 == 0)
+                     for i in range(2500)]
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "results.stcol")
+
+    def write(self, rows):
+        with open(self.path, "wb") as f:
+            f.writelines(columnar.write_snapshot(rows))
+
+    @mock.patch.object(columnar, "SPOOL_CHUNK_ROWS", 1000)
+    def test_round_trip_across_spool_chunks(self):
+        self.write(self.rows)
+        with columnar.open_snapshot(self.path) as snapshot:
+            self.assertEqual(len(snapshot), 2500)
+            self.assertEqual(snapshot.dictionaries["server_name"], ["S0", "S1", "S2", "S3", "S4"])
+            self.assertEqual(list(snapshot.column("id")), list(range(2500)))
+            self.assertEqual(list(snapshot.column("upload_speed")), [i / 4 for i in range(2500)])
+            self.assertEqual(snapshot.column("timestamp")[1] - snapshot.column("timestamp")[0], 60_000_000)
+
+    def test_columns_are_views_on_the_mapping(self):
+        # Without NumPy the columns are typed memoryviews over the mapped file, with nothing copied
+        self.write(self.rows)
+        with mock.patch.object(columnar, "np", None), columnar.open_snapshot(self.path) as snapshot:
+            column = snapshot.column("download_speed")
+            self.assertIsInstance(column, memoryview)
+            self.assertEqual(column.format, "d")
+            self.assertEqual(column[2499], 2499 * 1.5)
+            self.assertIs(column.obj, snapshot._mmap)
+
+    def test_empty_snapshot(self):
+        self.write([])
+        with columnar.open_snapshot(self.path) as snapshot:
+            self.assertEqual(len(snapshot), 0)
+            self.assertEqual(len(snapshot.column("ping")), 0)
+
+    def test_rejects_other_files(self):
+        with open(self.path, "wb") as f:
+            f.write(b"[]" * 8)
+        with self.assertRaises(ValueError):
+            columnar.open_snapshot(self.path)
+
+
+class DownsamplingTests(TestCase):
+    def setUp(self):
+        start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        self.points = [(start + timedelta(minutes=i), 100.0 + (i % 7)) for i in range(10_000)]
+        self.points[4321] = (self.points[4321][0], 900.0) # Spike
+        self.points[7000] = (self.points[7000][0], 1.0) # Dip
+
+    def rows(self):
+        return iter(self.points)
+
+    def test_lttb_keeps_ends_and_spikes(self):
+        sampled = downsampling.lttb(self.rows, len(self.points), 100)
+        self.assertEqual(len(sampled), 100)
+        self.assertEqual(sampled[0], self.points[0])
+        self.assertEqual(sampled[-1], self.points[-1])
+        self.assertIn(self.points[4321], sampled)
+        self.assertIn(self.points[7000], sampled)
+        self.assertEqual(sampled, sorted(sampled))
+
+    def test_min_max_keeps_extremes(self):
+        sampled = downsampling.min_max(self.rows, len(self.points), 100)
+        self.assertLessEqual(len(sampled), 100)
+        self.assertIn(self.points[4321], sampled)
+        self.assertIn(self.points[7000], sampled)
+        self.assertEqual(sampled, sorted(sampled))
+
+    def test_short_series_is_returned_unchanged(self):
+        self.assertEqual(downsampling.lttb(lambda: iter(self.points[:50]), 50, 100), self.points[:50])
+
+
+class HistoryViewTests(DjangoTestCase):
+    def setUp(self):
+        start = datetime(2025, 6, 1, tzinfo=timezone.utc)
+        partitions.ensure_partitions_for([start])
+        SpeedTestResult.objects.bulk_create(
+            SpeedTestResult(timestamp=start + timedelta(minutes=i), download_speed=50 + i % 5,
+                            upload_speed=10, ping=500 if i == 123 else 20, server_name="A" if i % 2 else "B")
+            for i in range(1000)
+        )
+
+    def test_history_downsamples_metric(self):
+        response = self.client.get(reverse("speedtest_app:history"), {"metric": "ping", "points": 50})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['total'], 1000)
+        self.assertEqual(len(data['points']), 50)
+        self.assertIn(500, [value for _, value in data['points']]) # The spike survives
+
+    def test_history_filters_and_minmax(self):
+        response = self.client.get(reverse("speedtest_app:history"), {
+            "metric": "download_speed", "algorithm": "minmax", "points": 10, "server": "A",
+            "since": "2025-06-01T01:00:00+00:00",
+        })
+        data = response.json()
+        self.assertEqual(data['total'], 470)
+        self.assertLessEqual(len(data['points']), 10)
+        self.assertEqual({value for _, value in data['points']} - {50, 51, 52, 53, 54}, set())
+
+    def test_history_rejects_bad_parameters(self):
+        for params in ({"metric": "id"}, {"points": "2"}, {"points": "x"}, {"algorithm": "avg"}, {"since": "nope"}):
+            response = self.client.get(reverse("speedtest_app:history"), params)
+            self.assertEqual(response.status_code, 400, params)
+
+
+class PercentileTests(DjangoTestCase):
+    def setUp(self):
+        self.url = reverse("speedtest_app:percentiles")
+        now = datetime.now(timezone.utc)
+        partitions.ensure_partitions_for([now - timedelta(days=30)])
+        rows = [("Warsaw", "PL", ping) for ping in (10, 20, 30, 40)]
+        rows += [("Berlin", "DE", ping) for ping in range(1, 201)]
+        SpeedTestResult.objects.bulk_create(
+            [SpeedTestResult(download_speed=100, upload_speed=10, ping=ping, server_name=name, server_country=country,
+                             timestamp=now - timedelta(hours=1)) for name, country, ping in rows]
+            # Outside the default window of 7 days
+            + [SpeedTestResult(download_speed=1, upload_speed=1, ping=999, server_name="Warsaw", server_country="PL",
+                               timestamp=now - timedelta(days=30))]
+        )
+
+    def test_percentiles_per_server(self):
+        data = self.client.get(self.url, {"metric": "ping"}).json()
+        self.assertEqual(data["window"], "7d")
+        groups = {g["group"]: g for g in data["groups"]}
+        self.assertEqual([g["group"] for g in data["groups"]], ["Berlin", "Warsaw"])
+        # Up to five values per group the sketch is exact as well
+        self.assertEqual(groups["Warsaw"]["count"], 4)
+        self.assertAlmostEqual(groups["Warsaw"]["p50"], 25.0)
+        self.assertAlmostEqual(groups["Warsaw"]["p90"], 37.0)
+        # percentile_cont of 1..200; the P² estimates on SQLite stay close
+        tolerance = 0 if data["exact"] else 3
+        for key, expected in (("p50", 100.5), ("p90", 180.1), ("p95", 190.05), ("p99", 198.01)):
+            self.assertAlmostEqual(groups["Berlin"][key], expected, delta=tolerance + 1e-6)
+
+    def test_group_by_country_and_window(self):
+        data = self.client.get(self.url, {"metric": "download_speed", "group_by": "server_country",
+                                          "window": "60d"}).json()
+        groups = {g["group"]: g for g in data["groups"]}
+        self.assertEqual(groups["PL"]["count"], 5)
+        self.assertEqual(groups["DE"]["p99"], 100.0)
+
+    def test_invalid_parameters(self):
+        for params in ({"metric": "id"}, {"group_by": "probe_id"}, {"window": "7"}, {"window": "0d"}):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 400, params)
+
+
+class P2QuantileTests(TestCase):
+    def test_estimates_follow_the_distribution(self):
+        values = [(i * 7919) % 10001 for i in range(10001)]  # 0..10000 in scrambled order
+        for p in (0.5, 0.9, 0.99):
+            sketch = percentiles.P2Quantile(p)
+            for value in values:
+                sketch.add(value)
+            self.assertAlmostEqual(sketch.result(), p * 10000, delta=100)
+
+    def test_few_values_are_exact(self):
+        sketch = percentiles.P2Quantile(0.9)
+        for value in (5, 1, 3):
+            sketch.add(value)
+        self.assertAlmostEqual(sketch.result(), percentiles.exact_quantile([1, 3, 5], 0.9))
+        self.assertIsNone(percentiles.P2Quantile(0.5).result())
+
+    def test_parse_window(self):
+        self.assertEqual(percentiles.parse_window("36h"), timedelta(hours=36))
+        self.assertEqual(percentiles.parse_window("2w"), timedelta(weeks=2))
+        with self.assertRaises(ValueError):
+            percentiles.parse_window("1y")
+
+
+class AnomalyDetectionTests(DjangoTestCase):
+    def setUp(self):
+        self.start = datetime(2025, 6, 1, tzinfo=timezone.utc)
+        # A server that usually gives about 300 Mbps down, 50 up and 10 ms ping
+        for i in range(30):
+            self.save(300 + (i % 5) * 4, 50 + i % 3, 10 + i % 2, minutes=i)
+
+    def save(self, download, upload, ping, minutes, server="Fast"):
+        return SpeedTestResult.objects.create(download_speed=download, upload_speed=upload, ping=ping,
+                                              server_name=server, timestamp=self.start + timedelta(minutes=minutes))
+
+    def test_baseline_tracks_server(self):
+        baseline = SpeedTestBaseline.objects.get(server_name="Fast")
+        self.assertEqual(baseline.count, 30)
+        self.assertAlmostEqual(baseline.download_mean, 308, delta=5)
+        self.assertFalse(SpeedTestResult.objects.filter(is_anomaly=True).exists())
+
+    def test_degradation_is_flagged_against_own_baseline(self):
+        # 80 Mbps is an anomaly for this server, although a new server at 80 Mbps is not judged
+        self.assertTrue(self.save(80, 50, 10, minutes=100).is_anomaly)
+        self.assertTrue(self.save(300, 50, 90, minutes=101).is_anomaly)
+        self.assertFalse(self.save(80, 50, 10, minutes=102, server="Slow").is_anomaly)
+        self.assertFalse(self.save(310, 51, 10, minutes=103).is_anomaly)
+
+    def test_bulk_ingest_flags_anomalies_and_exports_them(self):
+        summary = ingest_records([
+            {'probe_id': 'p1', 'timestamp': '2025-06-02T00:00:00+00:00', 'server_name': 'Fast',
+             'download_speed': 60, 'upload_speed': 50, 'ping': 10},
+        ])
+        self.assertEqual(summary['inserted'], 1)
+        self.assertEqual(SpeedTestBaseline.objects.get(server_name="Fast").count, 31)
+
+        rows = json.loads(b"".join(self.client.get(reverse("speedtest_app:export_results", args=["json"]))
+                                   .streaming_content))
+        self.assertTrue(rows[0]['is_anomaly'])
+        self.assertFalse(rows[1]['is_anomaly'])
+        csv_text = b"".join(self.client.get(reverse("speedtest_app:export_results", args=["csv"]))
+                            .streaming_content).decode()
+        self.assertTrue(csv_text.splitlines()[0].endswith("Anomaly"))
+        self.assertTrue(csv_text.splitlines()[1].endswith("True"))
+
+    @override_settings(SPEEDTEST_JOB_EXECUTOR='sync')
+    def test_failed_insert_leaves_baseline_unchanged(self):
+        # The baseline update is rolled back together with the result that failed to save
+        with mock.patch("speedtest.Speedtest", FakeSpeedtest), \
+                mock.patch("speedtest_app.measurement.SpeedTestLogger"), \
+                mock.patch("speedtest_app.signals.record_results", side_effect=RuntimeError("insert failed")):
+            with self.assertRaises(RuntimeError):
+                perform_speed_test()
+        self.assertEqual(SpeedTestBaseline.objects.filter(server_name="Fast").get().count, 30)
+        self.assertFalse(SpeedTestBaseline.objects.exclude(server_name="Fast").exists())
+
+    def test_update_baseline_matches_ewma(self):
+        baseline = SpeedTestBaseline(server_name="x")
+        with override_settings(SPEEDTEST_ANOMALY_ALPHA=0.5):
+            for value in (10, 20, 30):
+                update_baseline(baseline, SpeedTestResult(download_speed=value, upload_speed=0, ping=0))
+        # Plain average for the first two results, then mean += 0.5 * (30 - 15)
+        self.assertAlmostEqual(baseline.download_mean, 22.5)
+        self.assertAlmostEqual(baseline.download_var, 0.5 * (25 + 15 * 7.5))
+
+
+class ProbeSpoolTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = tmp.name
+
+    def test_offsets_survive_acknowledged_segments(self):
+        spool = probe.Spool(self.directory, max_bytes=10_000, segment_bytes=100)
+        for i in range(5):
+            spool.append({'n': i, 'pad': 'x' * 30})
+        self.assertGreater(len(spool._segments()), 1)
+        lines, end = spool.read_batch(3)
+        self.assertEqual([json.loads(line)['n'] for line in lines], [0, 1, 2])
+        # Reading again without acknowledging returns the same batch
+        self.assertEqual(spool.read_batch(3), (lines, end))
+        spool.acknowledge(end)
+        lines, end = spool.read_batch(10)
+        self.assertEqual([json.loads(line)['n'] for line in lines], [3, 4])
+        spool.acknowledge(end)
+        self.assertEqual((spool._segments(), spool.pending_bytes()), ([], 0))
+
+        # New segments continue after the acknowledged offset, also in a new Spool instance
+        spool = probe.Spool(self.directory, max_bytes=10_000, segment_bytes=100)
+        spool.append({'n': 5})
+        self.assertEqual(spool._segments()[0][0], end)
+        self.assertEqual([json.loads(line)['n'] for line in spool.read_batch(10)[0]], [5])
+
+    def test_disk_use_is_bounded(self):
+        # The oldest unsent results are dropped once the spool outgrows its limit
+        spool = probe.Spool(self.directory, max_bytes=300, segment_bytes=100)
+        for i in range(20):
+            spool.append({'n': i, 'pad': 'x' * 30})
+        sizes = [size for _, _, size in spool._segments()]
+        self.assertLessEqual(sum(sizes), 300)
+        numbers = [json.loads(line)['n'] for line in spool.read_batch(100)[0]]
+        self.assertEqual(numbers, list(range(20 - len(numbers), 20)))
+
+    def test_incomplete_line_is_repaired(self):
+        spool = probe.Spool(self.directory, max_bytes=10_000)
+        spool.append({'n': 0})
+        with open(spool._segments()[0][1], 'ab') as f:
+            f.write(b'{"n": 1')  # Crashed in the middle of a write
+        self.assertEqual(len(spool.read_batch(10)[0]), 1)
+        spool.append({'n': 2})
+        self.assertEqual([json.loads(line)['n'] for line in spool.read_batch(10)[0]], [0, 2])
+
+
+class ProbeAgentTests(DjangoTestCase):
+    # The central instance is this test database, reached through the test client
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.spool = probe.Spool(tmp.name, max_bytes=100_000)
+        self.measurements = iter(range(1, 100))
+        self.agent = probe.ProbeAgent(self.spool, 'site-1', central_url='http://central/', token='secret',
+                                      batch_size=2, measure=self.fake_measure)
+        self.uploads = []
+
+    def fake_measure(self):
+        n = next(self.measurements)
+        return {'download_speed': 10.0 * n, 'upload_speed': 1.0, 'ping': 5.0, 'server_name': 'S',
+                'server_location': 'S, PL', 'server_country': 'PL'}
+
+    def upload(self, url, lines, token='', timeout=30):
+        self.uploads.append((url, len(lines)))
+        with override_settings(SPEEDTEST_INGEST_TOKEN='secret'):
+            response = self.client.post(reverse("speedtest_app:bulk_results"), gzip.compress(b''.join(lines)),
+                                        content_type="application/x-ndjson", HTTP_CONTENT_ENCODING="gzip",
+                                        HTTP_AUTHORIZATION=f"Bearer {token}")
+        return response.json()
+
+    def test_results_are_spooled_while_offline_and_shipped_once(self):
+        with mock.patch.object(probe, "upload", side_effect=OSError("unreachable")):
+            for _ in range(3):
+                self.agent.measure_once()
+            self.assertEqual(self.agent.ship()['inserted'], 0)
+        self.assertEqual(len(self.spool.read_batch(10)[0]), 3)
+
+        with mock.patch.object(probe, "upload", self.upload):
+            totals = self.agent.ship()
+        self.assertEqual(totals, {'inserted': 3, 'duplicates': 0, 'rejected': 0})
+        self.assertEqual(self.uploads, [('http://central/results/bulk/', 2), ('http://central/results/bulk/', 1)])
+        self.assertEqual(self.spool.pending_bytes(), 0)
+        self.assertEqual(list(SpeedTestResult.objects.filter(probe_id='site-1').order_by('timestamp')
+                              .values_list('download_speed', flat=True)), [10.0, 20.0, 30.0])
+
+    def test_lost_response_is_not_stored_twice(self):
+        # The central instance stores the batch, but the probe never hears back and resends it
+        self.agent.measure_once()
+
+        def stored_then_lost(*args, **kwargs):
+            self.upload(*args, **kwargs)
+            raise OSError("connection reset")
+
+        with mock.patch.object(probe, "upload", stored_then_lost):
+            self.agent.ship()
+        with mock.patch.object(probe, "upload", self.upload):
+            self.assertEqual(self.agent.ship(), {'inserted': 0, 'duplicates': 1, 'rejected': 0})
+        self.assertEqual(SpeedTestResult.objects.filter(probe_id='site-1').count(), 1)
+
+    def test_batches_are_split_when_too_large(self):
+        for _ in range(2):
+            self.agent.measure_once()
+
+        def limited(url, lines, token='', timeout=30):
+            if len(lines) > 1:
+                raise urllib.error.HTTPError(url, 413, "Too large", {}, None)
+            return self.upload(url, lines, token)
+
+        with mock.patch.object(probe, "upload", limited):
+            self.assertEqual(self.agent.ship()['inserted'], 2)
+
+    def test_failed_measurement_is_skipped(self):
+        self.agent.measure = mock.Mock(side_effect=Exception("no network"))
+        self.assertIsNone(self.agent.measure_once())
+        self.assertEqual(self.spool.pending_bytes(), 0)
+
+    def test_run_probe_command_once(self):
+        # The probe runs the same measurement code as the web application
+        server_cache.invalidate()
+        self.addCleanup(server_cache.invalidate)
+        with tempfile.TemporaryDirectory() as spool_dir, \
+                mock.patch("speedtest.Speedtest", FakeSpeedtest), \
+                mock.patch.object(probe, "upload", self.upload):
+            out = io.StringIO()
+            call_command("run_probe", "--once", "--central-url", "http://central", "--token", "secret",
+                         "--probe-id", "site-2", "--spool-dir", spool_dir, stdout=out)
+        self.assertIn("Uploaded 1 results", out.getvalue())
+        self.assertEqual(SpeedTestResult.objects.get(probe_id='site-2').download_speed, 100.0)
+
+
+class ImportResultsCommandTests(DjangoTestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.json_file = os.path.join(self.dir, "speedtest_results.json")
+        self.csv_file = os.path.join(self.dir, "speedtest_results.csv")
+        self.records = [
+            {'timestamp': f'2024-01-01T10:{i:02d}:00', 'download_speed': 100 + i, 'upload_speed': 20,
+             'ping': 10, 'is_fast': True, 'summary': 'x'}
+            for i in range(5)
+        ]
+        logger = SpeedTestLogger()
+        logger.log_many_to_json(self.records, file_path=self.json_file)
+        logger.log_many_to_csv(self.records, file_path=self.csv_file)
+
+    def run_import(self, *args):
+        out = io.StringIO()
+        call_command('import_results', *args, stdout=out, stderr=io.StringIO())
+        return out.getvalue()
+
+    def test_imports_json_and_skips_csv_duplicates(self):
+        # The CSV log holds the same results as the JSON log, so nothing is imported twice
+        self.run_import(self.json_file, self.csv_file, '--batch-size', '2')
+        results = SpeedTestResult.objects.order_by('timestamp')
+        self.assertEqual([r.download_speed for r in results], [100, 101, 102, 103, 104])
+        self.assertEqual({r.probe_id for r in results}, {'legacy'})
+        self.assertEqual(SpeedTestRollup.objects.get(granularity='day').count, 5)
+        self.assertFalse(os.path.exists(self.csv_file + ".import-checkpoint"))
+
+    def test_default_paths_include_json_lines_log(self):
+        # Results logged since the switch to JSON Lines are only in speedtest_results.jsonl
+        newer = [dict(record, timestamp=f'2024-01-02T10:{i:02d}:00') for i, record in enumerate(self.records)]
+        SpeedTestLogger().log_many_to_jsonl(newer, file_path=os.path.join(self.dir, "speedtest_results.jsonl"))
+        with loadtest.working_directory(self.dir):
+            output = self.run_import()
+        self.assertIn("speedtest_results.jsonl: imported 5 results", output)
+        self.assertEqual(SpeedTestResult.objects.count(), 10)
+
+    def test_invalid_rows_are_reported_and_skipped(self):
+        with open(self.csv_file, "a", encoding="utf-8") as f:
+            f.write("2024-01-02T00:00:00,fast,20,10,True,x\n")
+        output = self.run_import(self.csv_file)
+        self.assertIn("imported 5 results", output)
+        self.assertIn("1 invalid records", output)
+
+    def test_resumes_from_checkpoint(self):
+        # An interrupted import continues after the last checkpointed batch
+        with mock.patch('speedtest_app.ingest.ingest_records', side_effect=[
+            {'inserted': 0, 'duplicates': 0, 'rejected': []}, KeyboardInterrupt,
+        ]):
+            with self.assertRaises(KeyboardInterrupt):
+                self.run_import(self.json_file, '--batch-size', '2')
+        with open(self.json_file + ".import-checkpoint", encoding="utf-8") as f:
+            self.assertEqual(json.load(f)['position'], 2)
+
+        output = self.run_import(self.json_file, '--batch-size', '2')
+        self.assertIn("resuming after 2 records", output)
+        self.assertEqual(SpeedTestResult.objects.count(), 3)
+
+
+class BenchmarkTests(TestCase):
+    def test_benchmark_command_writes_report(self):
+        output = os.path.join(tempfile.mkdtemp(), "bench.json")
+        call_command('benchmark', '--sizes', '10,20', '--scenarios', 'analyzer,log_jsonl_append',
+                     '--repeat', '1', '--output', output, stdout=io.StringIO())
+        with open(output, encoding="utf-8") as f:
+            report = json.load(f)
+        self.assertEqual([(r['scenario'], r['size']) for r in report['results']],
+                         [('analyzer', 10), ('analyzer', 20), ('log_jsonl_append', 10), ('log_jsonl_append', 20)])
+        self.assertGreater(report['results'][0]['ops_per_sec'], 0)
+        self.assertIn('python', report['environment'])
+
+    def test_find_regressions(self):
+        # Throughput drops and memory growth beyond the tolerance are flagged
+        baseline = {'results': [
+            {'scenario': 'a', 'size': 10, 'ops_per_sec': 100.0, 'peak_memory_bytes': 1000},
+            {'scenario': 'b', 'size': 10, 'ops_per_sec': 100.0, 'peak_memory_bytes': 1000},
+        ]}
+        results = [
+            {'scenario': 'a', 'size': 10, 'ops_per_sec': 85.0, 'peak_memory_bytes': 1500},
+            {'scenario': 'b', 'size': 10, 'ops_per_sec': 70.0, 'peak_memory_bytes': 1100},
+            {'scenario': 'c', 'size': 10, 'ops_per_sec': 1.0, 'peak_memory_bytes': 1},
+        ]
+        regressions = find_regressions(results, baseline, tolerance=0.2)
+        self.assertEqual([(r['scenario'], r['metric']) for r in regressions],
+                         [('a', 'peak_memory_bytes'), ('b', 'ops_per_sec')])
+
+    def test_find_latency_regressions(self):
+        # Load test results carry no memory figures; their p99 latency must not grow
+        baseline = {'results': [{'scenario': 'asgi:index', 'size': 10, 'ops_per_sec': 100.0, 'p99_ms': 50.0}]}
+        results = [{'scenario': 'asgi:index', 'size': 10, 'ops_per_sec': 100.0, 'p99_ms': 70.0}]
+        self.assertEqual([r['metric'] for r in find_regressions(results, baseline)], ['p99_ms'])
+        results[0]['p99_ms'] = 55.0
+        self.assertEqual(find_regressions(results, baseline), [])
+
+
+class LoadTestTests(TransactionTestCase):
+    # The servers run in threads with their own connections, so the data has to be committed
+    def test_parse_mix(self):
+        self.assertEqual(loadtest.parse_mix("index=3, check_speed=1,export_results=0"),
+                         {"index": 3.0, "check_speed": 1.0})
+        self.assertEqual(loadtest.parse_mix("index"), {"index": 1.0})
+        for value in ("", "index=0", "stats=1", "index=x", "index=-1"):
+            with self.assertRaises(ValueError):
+                loadtest.parse_mix(value)
+
+    def run_load_test(self, server):
+        SpeedTestResult.objects.create(download_speed=1, upload_speed=1, ping=1)
+        mix = {"index": 1, "export_results": 1}
+        # The shared-cache in-memory SQLite test database fails concurrent writers at once
+        # ("table is locked"); the loadtest command runs on a file database instead
+        writes = not (connection.vendor == "sqlite" and connection.is_in_memory_db())
+        if writes:
+            mix["check_speed"] = 1
+        with tempfile.TemporaryDirectory() as workdir, loadtest.working_directory(workdir), \
+                override_settings(SPEEDTEST_LOG_BUFFERED=False):
+            results = loadtest.run_load_test(server, mix, concurrency=4, duration=0.5, latency=0.01)
+        self.assertEqual([r["scenario"] for r in results], [f"{server}:{name}" for name in mix])
+        for result in results:
+            self.assertGreater(result["requests"], 0)
+            self.assertEqual(result["errors"], 0, result["statuses"])
+            self.assertLessEqual(result["p50_ms"], result["p99_ms"])
+        if writes:
+            self.assertEqual(set(results[2]["statuses"]), {"202"})
+            # The fake backend stored its results, and no job was left behind
+            self.assertGreater(SpeedTestResult.objects.filter(server_name="Bench").count(), 0)
+            self.assertFalse(SpeedTestJob.objects.filter(status__in=["queued", "running"]).exists())
+
+    def test_wsgi(self):
+        self.run_load_test("wsgi")
+
+    @skipUnless(importlib.util.find_spec("uvicorn"), "The ASGI server needs uvicorn")
+    def test_asgi(self):
+        self.run_load_test("asgi")
+
+
+@override_settings(SPEEDTEST_JOB_EXECUTOR='sync', SPEEDTEST_LOG_BUFFERED=False, SPEEDTEST_SERVER_CACHE_TTL=0)
+class MetricsTests(DjangoTestCase):
+    def setUp(self):
+        patcher = mock.patch("speedtest_app.measurement.SpeedTestLogger")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_histogram_and_counter_rendering(self):
+        registry = metrics.Registry()
+        histogram = registry.register(metrics.Histogram('x_seconds', 'Help.', (0.1, 1)))
+        counter = registry.register(metrics.Counter('x_requests', 'Help.'))
+        histogram.observe(0.05, phase='a')
+        histogram.observe(0.5, phase='a')
+        counter.inc(view='v "1"')
+        text = registry.render()
+        self.assertIn('# TYPE x_seconds histogram', text)
+        self.assertIn('x_seconds_bucket{phase="a",le="0.1"} 1', text)
+        self.assertIn('x_seconds_bucket{phase="a",le="1"} 2', text)
+        self.assertIn('x_seconds_bucket{phase="a",le="+Inf"} 2', text)
+        self.assertIn('x_seconds_count{phase="a"} 2', text)
+        self.assertIn('x_requests_total{view="v \\"1\\""} 1', text)
+
+    def test_check_speed_reports_phase_timings(self):
+        # Every phase of the measurement shows up in Server-Timing and in the phase histogram
+        before = metrics.phase_seconds.count(phase='download')
+        with mock.patch("speedtest.Speedtest", FakeSpeedtest):
+            response = self.client.post(reverse("speedtest_app:check_speed"))
+        self.assertTrue(response['Server-Timing'].startswith('submit;dur='))
+        self.assertEqual(metrics.phase_seconds.count(phase='download'), before + 1)
+
+        status = self.client.get(response.json()['status_url'])
+        phases = [entry.split(';')[0] for entry in status['Server-Timing'].split(', ')]
+        self.assertEqual(phases, ['config', 'best_server', 'download', 'upload', 'log', 'db'])
+        self.assertEqual(sorted(status.json()['timings']), sorted(phases))
+
+    def test_metrics_endpoint_counts_requests_and_errors(self):
+        view = 'speedtest_app:check_speed'
+        errors = metrics.http_request_errors.value(view=view)
+        with mock.patch("speedtest_app.views.submit_job", side_effect=Exception("boom")):
+            self.client.post(reverse(view))
+        self.client.get(reverse("speedtest_app:stats"))
+
+        response = self.client.get(reverse("speedtest_app:metrics"))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+        self.assertIn('speedtest_http_requests_total{status="500",view="speedtest_app:check_speed"}', text)
+        self.assertIn('speedtest_http_request_seconds_count{view="speedtest_app:stats"}', text)
+        self.assertEqual(metrics.http_request_errors.value(view=view), errors + 1)
+
+
+class FakeSpeedtest(benchmarks.FakeSpeedtest):
+    """
+    The benchmarks' stand-in for speedtest.Speedtest with two servers: counts config downloads
+    (one per instance) and latency probes, and servers named in unreachable do not answer.
+    """
+    servers = [
+        {'id': 1, 'name': 'Near', 'country': 'PL', 'url': 'http://near.test/speedtest/upload.php'},
+        {'id': 2, 'name': 'Far', 'country': 'DE', 'url': 'http://far.test/speedtest/upload.php'},
+    ]
+    download_bps = 100_000_000
+    upload_sizes = [250_000, 500_000]
+    response_bytes = 1_000_000
+    unreachable = set()
+    configs_fetched = 0
+    probed = []
+
+    def __init__(self):
+        super().__init__()
+        FakeSpeedtest.configs_fetched += 1
+
+    def latency(self, server):
+        return 1_800_000 if server['name'] in self.unreachable else 10.0 * server['id']
+
+    def get_best_server(self, servers=None):
+        FakeSpeedtest.probed.append([s['name'] for s in servers or self.servers])
+        return super().get_best_server(servers)
+
+
+class ImmediateThread:
+    # Runs the background refresh synchronously so that the tests are deterministic
+    def __init__(self, target, **kwargs):
+        self.target = target
+
+    def start(self):
+        self.target()
+
+
+@override_settings(SPEEDTEST_SERVER_CACHE_TTL=100, SPEEDTEST_SERVER_CACHE_REFRESH=0.5)
+class SpeedtestServerCacheTests(SimpleTestCase):
+    def setUp(self):
+        FakeSpeedtest.configs_fetched = 0
+        FakeSpeedtest.probed = []
+        FakeSpeedtest.unreachable = set()
+        self.cache = SpeedtestServerCache(factory=FakeSpeedtest)
+        self.now = 1000.0
+        patcher = mock.patch('speedtest_app.discovery.time.monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_cache_hit_probes_only_best_server(self):
+        # The second run reuses the config and probes only the cached best server
+        st, best = self.cache.prepare()
+        self.assertEqual(best['name'], 'Near')
+        st, best = self.cache.prepare()
+        self.assertEqual(best['name'], 'Near')
+        self.assertEqual(st.results.ping, 10.0)
+        self.assertEqual(FakeSpeedtest.configs_fetched, 1)
+        self.assertEqual(FakeSpeedtest.probed, [['Near', 'Far'], ['Near']])
+
+    def test_expired_entry_is_discovered_again(self):
+        # Past the TTL the config and server list are fetched again
+        self.cache.prepare()
+        self.now += 100
+        self.cache.prepare()
+        self.assertEqual(FakeSpeedtest.configs_fetched, 2)
+
+    @override_settings(SPEEDTEST_SERVER_CACHE_TTL=0)
+    def test_zero_ttl_disables_cache(self):
+        self.cache.prepare()
+        self.cache.prepare()
+        self.assertEqual(FakeSpeedtest.configs_fetched, 2)
+
+    @mock.patch('speedtest_app.discovery.threading.Thread', ImmediateThread)
+    def test_old_entry_is_refreshed_in_background(self):
+        # An entry past the refresh point is still served, while a refresh replaces it
+        self.cache.prepare()
+        self.now += 60
+        st, best = self.cache.prepare()
+        self.assertEqual(best['name'], 'Near')
+        self.assertEqual(FakeSpeedtest.configs_fetched, 2)
+        self.now += 45 # Older than the TTL for the first entry, but not for the refreshed one
+        self.cache.prepare()
+        self.assertEqual(FakeSpeedtest.configs_fetched, 2)
+
+    def test_unreachable_best_server_forces_discovery(self):
+        # When the cached best server stops answering, servers are discovered again
+        self.cache.prepare()
+        FakeSpeedtest.unreachable = {'Near'}
+        st, best = self.cache.prepare()
+        self.assertEqual(best['name'], 'Far')
+        self.assertEqual(FakeSpeedtest.configs_fetched, 2)
+
+    def test_failed_measurement_invalidates_cache(self):
+        # A download failure on the cached server drops the cache entry
+        with mock.patch('speedtest_app.measurement.server_cache', self.cache), \
+                mock.patch('speedtest_app.measurement.SpeedTestLogger'), \
+                mock.patch.object(FakeSpeedtest, 'download', side_effect=speedtest.SpeedtestException("boom")):
+            with self.assertRaises(speedtest.SpeedtestException):
+                perform_speed_test()
+        self.assertIsNone(self.cache._current())
+
+
+
+class ProgressHubTests(TestCase):
+    def test_events_reach_subscribers_from_other_threads(self):
+        # Events published on worker threads are delivered to the asyncio queue, after the history
+        hub = ProgressHub()
+        hub.publish("job", "ping", {'ping': 5})
+
+        async def consume():
+            queue = hub.subscribe("job")
+            thread = threading.Thread(target=hub.publish, args=("job", "result", {'success': True}))
+            thread.start()
+            events = [await asyncio.wait_for(queue.get(), 5) for _ in range(2)]
+            thread.join()
+            hub.unsubscribe("job", queue)
+            return events
+
+        events = asyncio.run(consume())
+        self.assertEqual([event for event, data in events], ["ping", "result"])
+        self.assertEqual(hub._subscribers, {})
+
+    def test_history_is_bounded(self):
+        hub = ProgressHub(history_size=2)
+        for job in ("a", "b", "c"):
+            hub.publish(job, "ping", {})
+        self.assertEqual(list(hub._history), ["b", "c"])
+
+    def test_throughput_sampler_counts_download_bytes(self):
+        # Download throughput comes from the bytes read through the wrapped opener
+        st = FakeSpeedtest()
+        opener = st._opener
+        samples = []
+        with ThroughputSampler(st, 'download', lambda phase, data: samples.append(data)) as sampler:
+            st.download(callback=sampler.callback)
+        self.assertIs(st._opener, opener) # The original opener is restored
+        self.assertEqual(sampler.bytes, 4_000_000)
+        self.assertEqual([s['progress'] for s in samples], [0.25, 0.5, 0.75, 1.0])
+
+    def test_throughput_sampler_counts_upload_sizes(self):
+        # Upload throughput comes from the sizes of the completed upload requests
+        st = FakeSpeedtest()
+        with ThroughputSampler(st, 'upload', lambda phase, data: None) as sampler:
+            st.upload(callback=sampler.callback)
+        self.assertEqual(sampler.bytes, 1_500_000)
+
+
+@override_settings(SPEEDTEST_JOB_EXECUTOR='sync', SPEEDTEST_LOG_BUFFERED=False)
+class SpeedTestEventsTests(DjangoTestCase):
+    def setUp(self):
+        server_cache.invalidate()
+        self.addCleanup(server_cache.invalidate)
+
+    async def test_events_stream_progress_and_result(self):
+        # The stream reports the job, ping, download and upload samples and the final result
+        with mock.patch("speedtest.Speedtest", FakeSpeedtest), \
+                mock.patch("speedtest_app.measurement.SpeedTestLogger"):
+            response = await self.async_client.get(reverse("speedtest_app:check_speed_events"))
+            self.assertEqual(response["Content-Type"], "text/event-stream")
+            body = b"".join([chunk async for chunk in response.streaming_content]).decode()
+
+        events = [block.split("\n")[0][len("event: "):] for block in body.strip().split("\n\n")]
+        self.assertEqual(events, ["job", "ping"] + ["download"] * 5 + ["upload"] * 5 + ["result"])
+        result = json.loads(body.strip().split("\n\n")[-1].split("data: ", 1)[1])
+        self.assertTrue(result["success"])
+        self.assertEqual(result["download_speed"], 100.0)
+
+    async def test_events_stream_reports_failure(self):
+        with mock.patch("speedtest.Speedtest", side_effect=Exception("Mocked speedtest error")):
+            response = await self.async_client.get(reverse("speedtest_app:check_speed_events"))
+            body = b"".join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertIn("event: failed", body)
+        self.assertIn("Mocked speedtest error", body)
@@ -6,5 +6,13 @@ app_name = 'speedtest_app'
 urlpatterns = [
     path('', views.index, name='index'),
     path('check-speed/', views.check_speed, name='check_speed'),
+    path('check-speed/events/', views.check_speed_events, name='check_speed_events'),
+    path('check-speed/<uuid:job_id>/', views.check_speed_status, name='check_speed_status'),
     path('export/<str:format>/', views.export_results, name='export_results'),
+    path('stats/', views.stats, name='stats'),
+    path('history/', views.history, name='history'),
+    path('percentiles/', views.percentiles, name='percentiles'),
+    path('results/since/<int:last_id>/', views.results_since, name='results_since'),
+    path('results/bulk/', views.bulk_results, name='bulk_results'),
+    path('metrics', views.metrics, name='metrics'),
 ]
\ No newline at end of file
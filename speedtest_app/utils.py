@@ -1,40 +1,460 @@
+import atexit
+import gzip
 import json
 import csv
+import logging
+import math
 import os
+import queue
+import shutil
+import threading
+import time
+from array import array
 from datetime import datetime
 
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; the batch analyzer falls back to the array module
+    np = None
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Thresholds of a fast connection: download >= 50 Mbps, upload >= 20 Mbps, ping <= 50 ms
+DEFAULT_MIN_DOWNLOAD = 50
+DEFAULT_MIN_UPLOAD = 20
+DEFAULT_MAX_PING = 50
+
+# Suffix of the manifest that lists the rotated segments of a log file
+MANIFEST_SUFFIX = ".manifest.json"
+
+SUMMARY_GOOD = "Інтернет-з'єднання хороше."
+SUMMARY_SLOW = "Інтернет-з'єднання повільне або нестабільне."
+
+
+class FileLock:
+    """
+    Exclusive advisory lock on a file, shared by all processes (and threads) on the host.
+    Usable as a context manager; blocks until the lock is acquired.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def acquire(self):
+        self._file = open(self.path, "a+b")
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+
+    def release(self):
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
 
 class SpeedTestLogger:
     """
     Logger class to save speed test results into JSON or CSV files.
     Supports appending new results to an existing log or creating a new one.
+    With json_lines=True, JSON results are appended as one line per result (JSON Lines)
+    instead of rewriting a single JSON array on every call.
+    Every write holds an advisory lock on "<file>.lock", so several processes can log
+    to the same files without interleaving or losing records.
+    With max_bytes and/or max_age (seconds), a log file that has reached either limit is
+    rotated before the next write: it becomes a gzip-compressed segment listed in
+    "<file>.manifest.json" (see rotate_log() and iter_log_range()).
     """
-    def log_to_json(self, data: dict, file_path="speedtest_results.json"):
+    def __init__(self, json_lines: bool = False, max_bytes=None, max_age=None):
+        self.json_lines = json_lines
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+    def _prepare(self, file_path):
+        # Rotates the log if it is due; called before every write, with the file lock held
+        if not self.max_bytes and not self.max_age:
+            return
+        manifest = read_manifest(file_path)
+        size = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+        started = manifest.get("active_started")
+        if size and ((self.max_bytes and size >= self.max_bytes)
+                     or (self.max_age and started is not None and time.time() - started >= self.max_age)):
+            manifest = rotate_log(file_path, manifest)
+        if manifest.get("active_started") is None:
+            # The age of the active file counts from its first write (or from now for an older log)
+            manifest["active_started"] = time.time()
+            _write_manifest(file_path, manifest)
+
+    def log_to_json(self, data: dict, file_path=None):
         # Appends result to a JSON file; creates the file if it doesn't exist.
-        if os.path.exists(file_path):
-            with open(file_path, "r+", encoding="utf-8") as f:
-                try:
-                    # Try loading existing data from the file
-                    existing = json.load(f)
-                except json.JSONDecodeError:
-                    # If file is empty or corrupted, initialize with an empty list
-                    existing = []
-                existing.append(data)
-                f.seek(0)
-                json.dump(existing, f, indent=2, ensure_ascii=False)
-        else:
-            # If the file does not exist, create it and write the first entry as a list
-            with open(file_path, "w", encoding="utf-8") as f:
-                json.dump([data], f, indent=2, ensure_ascii=False)
+        self.log_many_to_json([data], file_path=file_path)
+
+    def log_many_to_json(self, records: list, file_path=None):
+        # Appends several results with a single read-modify-write (or a single append for JSON Lines)
+        if self.json_lines:
+            self.log_many_to_jsonl(records, file_path=file_path or "speedtest_results.jsonl")
+            return
+
+        file_path = file_path or "speedtest_results.json"
+        with FileLock(file_path + ".lock"):
+            self._prepare(file_path)
+            if os.path.exists(file_path):
+                with open(file_path, "r+", encoding="utf-8") as f:
+                    try:
+                        # Try loading existing data from the file
+                        existing = json.load(f)
+                    except json.JSONDecodeError:
+                        # If file is empty or corrupted, initialize with an empty list
+                        existing = []
+                    existing.extend(records)
+                    f.seek(0)
+                    json.dump(existing, f, indent=2, ensure_ascii=False)
+                    f.truncate()
+            else:
+                # If the file does not exist, create it and write the first entries as a list
+                with open(file_path, "w", encoding="utf-8") as f:
+                    json.dump(list(records), f, indent=2, ensure_ascii=False)
+
+    def log_to_jsonl(self, data: dict, file_path="speedtest_results.jsonl"):
+        # Appends result as a single JSON line; the cost does not depend on the size of the file
+        self.log_many_to_jsonl([data], file_path=file_path)
+
+    def log_many_to_jsonl(self, records: list, file_path="speedtest_results.jsonl"):
+        lines = "".join(json.dumps(data, ensure_ascii=False) + "\n" for data in records)
+        with FileLock(file_path + ".lock"):
+            self._prepare(file_path)
+            with open(file_path, "a", encoding="utf-8") as f:
+                f.write(lines)
 
     def log_to_csv(self, data: dict, file_path="speedtest_results.csv"):
         # Appends result to a CSV file; writes headers only if file is empty or new
-        write_header = not os.path.isfile(file_path) or os.path.getsize(file_path) == 0
-        with open(file_path, mode='a', newline='', encoding="utf-8") as f:
-            writer = csv.DictWriter(f, fieldnames=data.keys())
-            if write_header:
-                writer.writeheader()
-            writer.writerow(data)
+        self.log_many_to_csv([data], file_path=file_path)
+
+    def log_many_to_csv(self, records: list, file_path="speedtest_results.csv"):
+        if not records:
+            return
+        with FileLock(file_path + ".lock"):
+            self._prepare(file_path)
+            write_header = not os.path.isfile(file_path) or os.path.getsize(file_path) == 0
+            with open(file_path, mode='a', newline='', encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=records[0].keys())
+                if write_header:
+                    writer.writeheader()
+                writer.writerows(records)
+
+
+class BufferedResultWriter:
+    """
+    Queues speed test results and appends them to the JSON and CSV logs on a background thread,
+    in batches of up to batch_size records or after flush_interval seconds, whichever comes first.
+    Callers never wait for file I/O. Pending records are written by flush() and close(),
+    and close() runs automatically at interpreter exit. Worker processes of multiprocessing
+    exit without running atexit handlers, so they have to call close() themselves.
+    """
+    _STOP = object()
+
+    def __init__(self, logger=None, json_path=None, csv_path="speedtest_results.csv",
+                 batch_size=100, flush_interval=1.0):
+        self.logger = logger or SpeedTestLogger()
+        self.json_path = json_path
+        self.csv_path = csv_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        atexit.register(self.close)
+
+    def submit(self, record: dict):
+        # Queues one result; returns immediately
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("BufferedResultWriter is closed")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='speedtest-log-writer', daemon=True)
+                self._thread.start()
+        self._queue.put(record)
+
+    def flush(self):
+        # Blocks until every submitted result has been written
+        self._queue.join()
+
+    def close(self):
+        # Writes the pending results and stops the background thread
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+        if thread is not None:
+            self._queue.put(self._STOP)
+            thread.join()
+        atexit.unregister(self.close)
+
+    def _run(self):
+        stop = False
+        while not stop:
+            item = self._queue.get()
+            batch = []
+            if item is self._STOP:
+                stop = True
+            else:
+                batch.append(item)
+
+            # Collects more records until the batch is full or the flush interval has passed
+            deadline = time.monotonic() + self.flush_interval
+            while not stop and len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stop = True
+                else:
+                    batch.append(item)
+
+            try:
+                if batch:
+                    self._write(batch)
+            except Exception:
+                logging.getLogger(__name__).exception("Failed to write %d speed test results", len(batch))
+            finally:
+                for _ in range(len(batch) + stop):
+                    self._queue.task_done()
+
+    def _write(self, batch):
+        self.logger.log_many_to_json(batch, file_path=self.json_path)
+        self.logger.log_many_to_csv(batch, file_path=self.csv_path)
+
+
+def _open_text(file_path, newline=None):
+    # Opens a log file, or a gzip-compressed segment of one, for reading
+    if file_path.endswith(".gz"):
+        return gzip.open(file_path, "rt", encoding="utf-8", newline=newline)
+    return open(file_path, "r", encoding="utf-8", newline=newline)
+
+
+def iter_jsonl(file_path, skip_invalid=True):
+    """
+    Streams records from a JSON Lines file one at a time, without loading the whole file.
+    Blank lines are ignored; lines that are not valid JSON (such as a line cut short
+    by a crash in the middle of an append) are skipped unless skip_invalid is False.
+    """
+    with _open_text(file_path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                if not skip_invalid:
+                    raise
+
+
+def iter_json_array(file_path, chunk_size=64 * 1024):
+    """
+    Streams the elements of a top-level JSON array file one at a time.
+    Only one chunk plus the element being decoded is kept in memory.
+    An empty file is treated as an empty array.
+    """
+    decoder = json.JSONDecoder()
+    with _open_text(file_path) as f:
+        buf = ""
+        pos = 0
+        eof = False
+        started = False
+        while True:
+            # Skips whitespace and element separators
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos == len(buf):
+                if eof:
+                    return
+                buf = f.read(chunk_size)
+                pos = 0
+                eof = not buf
+                continue
+
+            if not started:
+                if buf[pos] != "[":
+                    raise ValueError(f"{file_path} does not contain a JSON array")
+                started = True
+                pos += 1
+                continue
+            if buf[pos] == "]":
+                return
+
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                end = None
+            # An element that runs up to the end of the buffer may be incomplete, so read more first
+            if end is None or (end == len(buf) and not eof):
+                if eof:
+                    raise ValueError(f"{file_path} ends in the middle of a JSON value")
+                more = f.read(chunk_size)
+                eof = not more
+                buf = buf[pos:] + more
+                pos = 0
+                continue
+
+            yield obj
+            pos = end
+
+
+def iter_csv(file_path):
+    """
+    Streams the rows of a CSV log with a header line as dicts, one at a time.
+    Values are returned as strings, exactly as they appear in the file.
+    """
+    with _open_text(file_path, newline="") as f:
+        yield from csv.DictReader(f)
+
+
+def convert_json_to_jsonl(src_path="speedtest_results.json", dst_path="speedtest_results.jsonl") -> int:
+    """
+    One-time conversion of a JSON array log into a JSON Lines log.
+    Records are streamed, so the source file is never loaded as a whole.
+    Returns the number of converted records.
+    """
+    count = 0
+    with open(dst_path, "a", encoding="utf-8") as f:
+        for record in iter_json_array(src_path):
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def iter_log(file_path):
+    # Streams the records of a .json, .jsonl or .csv log, or of a .gz segment of one
+    name = file_path[:-3] if file_path.endswith(".gz") else file_path
+    readers = {".json": iter_json_array, ".jsonl": iter_jsonl, ".csv": iter_csv}
+    return readers[os.path.splitext(name)[1].lower()](file_path)
+
+
+def _log_timestamp(value):
+    # Log timestamps are compared as naive local times, as SpeedTestAnalyzer writes them
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    return value.astimezone().replace(tzinfo=None) if value.tzinfo else value
+
+
+def read_manifest(file_path) -> dict:
+    """
+    Returns the manifest of a log file: "segments", the rotated segments, oldest first, each with
+    its "file" name, "first" and "last" timestamp, "rows" and uncompressed "bytes", and
+    "active_started", when the current file was started (Unix time).
+    """
+    try:
+        with open(file_path + MANIFEST_SUFFIX, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"segments": []}
+
+
+def write_atomic(file_path, text):
+    # Writes a temporary file, syncs it to disk and renames it over file_path, so readers and
+    # a crash leave either the old or the new contents, never a half-written file
+    tmp_path = file_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, file_path)
+
+
+def _write_manifest(file_path, manifest):
+    write_atomic(file_path + MANIFEST_SUFFIX, json.dumps(manifest, indent=2))
+
+
+def rotate_log(file_path, manifest=None) -> dict:
+    """
+    Closes the current log file: compresses it into "<name>.<time><ext>.gz" next to it, records
+    the segment's timestamp range and row count in the manifest and removes the file, so the next
+    write starts a new one. The caller must hold the file lock. Returns the updated manifest.
+    """
+    manifest = manifest if manifest is not None else read_manifest(file_path)
+    rows = 0
+    first = last = None
+    for record in iter_log(file_path):
+        rows += 1
+        timestamp = _log_timestamp(record.get("timestamp")) if isinstance(record, dict) else None
+        if timestamp is not None:
+            first = timestamp if first is None else min(first, timestamp)
+            last = timestamp if last is None else max(last, timestamp)
+
+    base, extension = os.path.splitext(file_path)
+    segment_path = f"{base}.{datetime.now().strftime('%Y%m%dT%H%M%S%f')}{extension}.gz"
+    with open(file_path, "rb") as src, gzip.open(segment_path + ".tmp", "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.replace(segment_path + ".tmp", segment_path)
+
+    manifest.setdefault("segments", []).append({
+        "file": os.path.basename(segment_path),
+        "first": first.isoformat() if first else None,
+        "last": last.isoformat() if last else None,
+        "rows": rows,
+        "bytes": os.path.getsize(file_path),
+    })
+    manifest.pop("active_started", None)
+    _write_manifest(file_path, manifest)
+    os.remove(file_path)
+    return manifest
+
+
+def iter_log_range(file_path, since=None, until=None):
+    """
+    Streams the records of a rotated log, closed segments first, whose timestamp lies in
+    [since, until). Only the segments whose manifest range overlaps the requested one are
+    opened; the current file is always read. Without bounds every record is returned.
+    """
+    since, until = _log_timestamp(since), _log_timestamp(until)
+    directory = os.path.dirname(file_path)
+    paths = []
+    for segment in read_manifest(file_path).get("segments", []):
+        first, last = _log_timestamp(segment["first"]), _log_timestamp(segment["last"])
+        if since is not None or until is not None:
+            if first is None or (since is not None and last < since) or (until is not None and first >= until):
+                continue
+        paths.append(os.path.join(directory, segment["file"]))
+    if os.path.exists(file_path):
+        paths.append(file_path)
+
+    for path in paths:
+        for record in iter_log(path):
+            if since is None and until is None:
+                yield record
+                continue
+            timestamp = _log_timestamp(record.get("timestamp")) if isinstance(record, dict) else None
+            if timestamp is None or (since is not None and timestamp < since) or (until is not None and timestamp >= until):
+                continue
+            yield record
 
 
 class SpeedTestAnalyzer:
@@ -42,21 +462,26 @@ class SpeedTestAnalyzer:
     Core class for analyzing the speed test results.
     Provides evaluation methods.
     """
-    def __init__(self, download_speed: float, upload_speed: float, ping: float):
+    def __init__(self, download_speed: float, upload_speed: float, ping: float,
+                 min_download: float = DEFAULT_MIN_DOWNLOAD, min_upload: float = DEFAULT_MIN_UPLOAD,
+                 max_ping: float = DEFAULT_MAX_PING):
         self.download_speed = download_speed
         self.upload_speed = upload_speed
         self.ping = ping
+        self.min_download = min_download
+        self.min_upload = min_upload
+        self.max_ping = max_ping
 
     def is_fast_connection(self) -> bool:
-        # Determines whether the connection is considered fast based on thresholds:
-        # download >= 50 Mbps, upload >= 20 Mbps, ping <= 50 ms
-        return self.download_speed >= 50 and self.upload_speed >= 20 and self.ping <= 50
+        # Determines whether the connection is considered fast based on the configured thresholds
+        return (self.download_speed >= self.min_download and self.upload_speed >= self.min_upload
+                and self.ping <= self.max_ping)
 
     def summary(self) -> str:
         # Returns a textual assessment of the internet connection quality
         if self.is_fast_connection():
-            return "Інтернет-з'єднання хороше."
-        return "Інтернет-з'єднання повільне або нестабільне."
+            return SUMMARY_GOOD
+        return SUMMARY_SLOW
 
     def to_dict(self) -> dict:
         # Returns a dictionary with all test parameters, evaluation, and current timestamp
@@ -67,4 +492,96 @@ class SpeedTestAnalyzer:
             'ping': round(self.ping, 2),
             'is_fast': self.is_fast_connection(),
             'summary': self.summary()
-        }
\ No newline at end of file
+        }
+
+
+class SpeedTestBatchAnalyzer:
+    """
+    Analyzes many speed test results at once from column arrays of download, upload and ping.
+    Uses NumPy when it is installed and falls back to the array module otherwise.
+    Applies the same thresholds as SpeedTestAnalyzer.
+    """
+    # Summary codes; SUMMARIES maps each code to the text SpeedTestAnalyzer.summary() returns
+    CODE_SLOW = 0
+    CODE_GOOD = 1
+    SUMMARIES = (SUMMARY_SLOW, SUMMARY_GOOD)
+
+    def __init__(self, download_speeds, upload_speeds, pings,
+                 min_download: float = DEFAULT_MIN_DOWNLOAD, min_upload: float = DEFAULT_MIN_UPLOAD,
+                 max_ping: float = DEFAULT_MAX_PING):
+        if np is not None:
+            self.download_speeds = np.asarray(download_speeds, dtype=np.float64)
+            self.upload_speeds = np.asarray(upload_speeds, dtype=np.float64)
+            self.pings = np.asarray(pings, dtype=np.float64)
+        else:
+            self.download_speeds = array('d', download_speeds)
+            self.upload_speeds = array('d', upload_speeds)
+            self.pings = array('d', pings)
+        if not len(self.download_speeds) == len(self.upload_speeds) == len(self.pings):
+            raise ValueError("download, upload and ping columns must have the same length")
+        self.min_download = min_download
+        self.min_upload = min_upload
+        self.max_ping = max_ping
+
+    def __len__(self):
+        return len(self.download_speeds)
+
+    def is_fast_mask(self):
+        # Boolean mask (NumPy bool array, or array('b') of 0/1) of the fast results
+        if np is not None:
+            return ((self.download_speeds >= self.min_download) & (self.upload_speeds >= self.min_upload)
+                    & (self.pings <= self.max_ping))
+        return array('b', (
+            d >= self.min_download and u >= self.min_upload and p <= self.max_ping
+            for d, u, p in zip(self.download_speeds, self.upload_speeds, self.pings)
+        ))
+
+    def summary_codes(self):
+        # Summary code per result; see SUMMARIES for the matching texts
+        mask = self.is_fast_mask()
+        if np is not None:
+            return np.where(mask, self.CODE_GOOD, self.CODE_SLOW).astype(np.int8)
+        return array('b', (self.CODE_GOOD if fast else self.CODE_SLOW for fast in mask))
+
+    def statistics(self, percentiles=(50, 90, 95, 99)) -> dict:
+        # Count, fraction of fast results and mean/min/max/percentiles per metric
+        count = len(self)
+        mask = self.is_fast_mask()
+        fast = int(mask.sum()) if np is not None else sum(mask)
+        stats = {
+            'count': count,
+            'fraction_fast': (fast / count) if count else None,
+        }
+        for name, column in (('download_speed', self.download_speeds),
+                             ('upload_speed', self.upload_speeds),
+                             ('ping', self.pings)):
+            stats[name] = _column_statistics(column, percentiles)
+        return stats
+
+
+def _column_statistics(column, percentiles) -> dict:
+    if not len(column):
+        return {'mean': None, 'min': None, 'max': None, **{f'p{q}': None for q in percentiles}}
+    if np is not None:
+        values = np.percentile(column, percentiles)
+        return {
+            'mean': float(column.mean()),
+            'min': float(column.min()),
+            'max': float(column.max()),
+            **{f'p{q}': float(v) for q, v in zip(percentiles, values)},
+        }
+    ordered = sorted(column)
+    return {
+        'mean': math.fsum(ordered) / len(ordered),
+        'min': ordered[0],
+        'max': ordered[-1],
+        **{f'p{q}': _percentile(ordered, q) for q in percentiles},
+    }
+
+
+def _percentile(ordered, q):
+    # Linear interpolation between the closest ranks, as numpy.percentile does by default
+    rank = (len(ordered) - 1) * q / 100
+    low = math.floor(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
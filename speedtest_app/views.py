@@ -1,74 +1,89 @@
-from django.shortcuts import render
+import asyncio
+import json
+import zlib
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import RequestDataTooBig
+from django.db import IntegrityError, connection
+from django.db.models import Max
+from django.core.handlers.asgi import ASGIRequest
+from django.shortcuts import aget_object_or_404
+from django.template.loader import render_to_string
+from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
-import speedtest
 import logging
-from .utils import SpeedTestAnalyzer, SpeedTestLogger
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.crypto import constant_time_compare
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import http_date
+from datetime import datetime
+from itertools import islice
 import csv
-from .models import SpeedTestResult
+from .columnar import FIELDS as COLUMNAR_FIELDS, awrite_snapshot, write_snapshot
+from .downsampling import ALGORITHMS
+from .ingest import ingest_records
+from .defaults import BULK_MAX_BYTES, BULK_MAX_UPLOAD_BYTES
+from .jobs import fail_stale_jobs, is_stale, submit_job
+from .progress import progress_hub
+from .metrics import PhaseTimer, registry, server_timing
+from .models import SpeedTestResult, SpeedTestJob, SpeedTestRollup
+from .notify import result_notifier
+from .page_cache import aget_index_page
+from .percentiles import GROUP_BY, parse_window, percentiles as compute_percentiles
+from .rollups import bucket_start, summarize_buckets
 
 logger = logging.getLogger(__name__)
 
 
-def index(request):
+async def _render_index():
+    # The page does not depend on the request, so one rendering is shared by all visitors.
+    # Returns the content and the timestamp of the newest result, the page's last modification.
+    latest_results = [result async for result in SpeedTestResult.objects.all()[:5]]
+    content = render_to_string('speedtest_app/index.html', {
+        'latest_results': latest_results,
+        'latest_id': (await SpeedTestResult.objects.aaggregate(latest_id=Max('id')))['latest_id'] or 0,
+        'live_progress': getattr(settings, 'SPEEDTEST_LIVE_PROGRESS', False),
+        'long_poll': getattr(settings, 'SPEEDTEST_LONG_POLL', False),
+        'results_poll_interval': getattr(settings, 'SPEEDTEST_RESULTS_POLL_INTERVAL', 30),
+    })
+    return content, latest_results[0].timestamp if latest_results else None
+
+
+async def index(request):
     """
     Renders the homepage, displaying the 5 most recent internet speed test results from the database.
+    The rendered page is cached until a new result is saved; it carries an ETag and, as
+    Last-Modified, the timestamp of the newest result, so polling browsers get a 304 Not Modified
+    while nothing has changed.
     """
-    latest_results = SpeedTestResult.objects.all()[:5]
-    return render(request, 'speedtest_app/index.html', {'latest_results': latest_results})
+    page = await aget_index_page(_render_index)
+    last_modified = int(page['last_modified'].timestamp())
+    response = get_conditional_response(request, etag=page['etag'], last_modified=last_modified)
+    if response is None:
+        response = HttpResponse(page['content'])
+    response['ETag'] = page['etag']
+    response['Last-Modified'] = http_date(last_modified)
+    # Browsers keep the page but revalidate it on every load
+    patch_cache_control(response, no_cache=True)
+    return response
 
 
 @csrf_exempt
-def check_speed(request):
+async def check_speed(request):
     """
-    Performs an internet speed test, analyzes the results, stores them in the database,
-    and returns a JSON response containing the measured values and analysis summary.
+    Queues an internet speed test as a background job and immediately returns its id
+    together with the URL that reports the job status and, once finished, the results.
+    If a test is already in progress, the caller joins it ("shared": true) instead.
     """
-    if request.method == 'GET':
+    if request.method in ('GET', 'POST'):
+        timer = PhaseTimer(observe=False)
         try:
-            st = speedtest.Speedtest()
-
-            # Identifies the most optimal server based on latency
-            server = st.get_best_server()
-
-            # Formats the server's name and country for display and storage
-            server_full_location = f"{server['name']}, {server['country']}"
-
-            # Runs download and upload speed tests, converting from bits/sec to Mbps
-            download_speed = st.download() / 1_000_000
-            upload_speed = st.upload() / 1_000_000
-            ping = st.results.ping
-
-            # Analyzes results using a custom utility class
-            analyzer = SpeedTestAnalyzer(download_speed, upload_speed, ping)
-            analysis = analyzer.to_dict()
-
-            # Creates a logger instance and saves the results to JSON and CSV files
-            logger_instance = SpeedTestLogger()
-            logger_instance.log_to_json(analysis)
-            logger_instance.log_to_csv(analysis)
-
-            # Records the speed test results in the database
-            SpeedTestResult.objects.create(
-                download_speed=download_speed,
-                upload_speed=upload_speed,
-                ping=ping,
-                server_name=server['name'],
-                server_location=server_full_location,
-                server_country=server['country']
-            )
-
-            # Responds to the client with key metrics and a summary of the analysis
-            return JsonResponse({
-                'success': True,
-                'download_speed': analysis['download_speed'],
-                'upload_speed': analysis['upload_speed'],
-                'ping': analysis['ping'],
-                'is_fast': analysis['is_fast'],
-                'summary': analysis['summary'],
-                'server_location': server_full_location
-            })
-
+            with timer.phase('submit'):
+                # The measurement itself runs on the job executor, never on the event loop
+                job, created = await sync_to_async(submit_job)()
         except Exception as e:
             # Logs the error message for debugging purposes and returns a failure response
             logger.error(f"Speed test error: {str(e)}")
@@ -76,41 +91,538 @@ def check_speed(request):
                 'success': False,
                 'error': str(e)
             }, status=500)
+
+        response = JsonResponse({
+            'success': True,
+            'job_id': str(job.pk),
+            'status': job.status,
+            'shared': not created,
+            'status_url': reverse('speedtest_app:check_speed_status', args=[job.pk])
+        }, status=202)
+        return _add_server_timing(response, job, timer.timings)
     else:
         return JsonResponse({'success': False, 'error': 'Method not allowed'}, status=405)
 
 
-def export_results(request, format):
+def _add_server_timing(response, job, timings=None):
+    # Reports the phase timings of a finished job (and of the request itself) in a Server-Timing header
+    timings = dict(timings or {})
+    if job.status == SpeedTestJob.STATUS_DONE and job.result:
+        timings.update(job.result.get('timings', {}))
+    if timings:
+        response['Server-Timing'] = server_timing(timings)
+    return response
+
+
+def _sse(event, data):
+    # Formats one Server-Sent Events message
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False)}\n\n"
+
+
+async def _progress_events(job, queue):
+    try:
+        yield _sse('job', {'job_id': str(job.pk), 'status': job.status})
+        if job.status == SpeedTestJob.STATUS_DONE:
+            # A recent result shared within SPEEDTEST_MIN_INTERVAL
+            yield _sse('result', {'success': True, **job.result})
+            return
+
+        keepalive = getattr(settings, 'SPEEDTEST_SSE_KEEPALIVE', 5)
+        while True:
+            try:
+                event, data = await asyncio.wait_for(queue.get(), timeout=keepalive)
+            except asyncio.TimeoutError:
+                # Jobs run by another process publish no events here, so fall back to the job row
+                current = await SpeedTestJob.objects.aget(pk=job.pk)
+                if current.status == SpeedTestJob.STATUS_DONE:
+                    yield _sse('result', {'success': True, **current.result})
+                    return
+                if current.status == SpeedTestJob.STATUS_FAILED:
+                    yield _sse('failed', {'success': False, 'error': current.error})
+                    return
+                yield ": keep-alive\n\n"
+                continue
+
+            yield _sse(event, data)
+            if event in ('result', 'failed'):
+                return
+    finally:
+        progress_hub.unsubscribe(job.pk, queue)
+
+
+async def check_speed_events(request):
+    """
+    Starts (or joins) a speed test and streams its progress as Server-Sent Events:
+    "job", then "ping", the "download" and "upload" throughput samples, and finally
+    "result" (the same payload as check_speed_status) or "failed".
+    Meant to be served by the ASGI application, where an open stream holds no thread.
+    """
+    try:
+        job, created = await sync_to_async(submit_job)()
+    except Exception as e:
+        logger.error(f"Speed test error: {str(e)}")
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
+    queue = progress_hub.subscribe(job.pk)
+    response = StreamingHttpResponse(_progress_events(job, queue), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Keeps reverse proxies such as nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+async def check_speed_status(request, job_id):
+    """
+    Reports the state of a speed test job (queued, running, done or failed).
+    Finished jobs carry the same measured values and analysis summary as a direct test;
+    jobs that stayed active longer than SPEEDTEST_JOB_STALE_AFTER are reported as failed.
+    """
+    job = await aget_object_or_404(SpeedTestJob, pk=job_id)
+    if is_stale(job):
+        await sync_to_async(fail_stale_jobs)()
+        await job.arefresh_from_db()
+    data = {'job_id': str(job.pk), 'status': job.status}
+
+    if job.status == SpeedTestJob.STATUS_DONE:
+        data.update(success=True, **job.result)
+    elif job.status == SpeedTestJob.STATUS_FAILED:
+        data.update(success=False, error=job.error)
+    else:
+        data.update(success=True)
+    return _add_server_timing(JsonResponse(data), job)
+
+
+EXPORT_FIELDS = ['id', 'download_speed', 'upload_speed', 'ping', 'timestamp',
+                 'server_location', 'server_name', 'server_country', 'probe_id', 'is_anomaly']
+EXPORT_CHUNK_SIZE = 2000
+
+
+class Echo:
+    """
+    File-like object whose write() returns the value instead of storing it,
+    so that csv.writer can produce rows for a streaming response.
+    """
+    def write(self, value):
+        return value
+
+
+def _parse_datetime_param(value):
+    # Accepts either a full ISO 8601 datetime or a plain date; naive values use the current time zone
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"Invalid date: {value}")
+        parsed = datetime.combine(day, datetime.min.time())
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def filter_results(params):
+    """
+    Applies the optional ?since=&until=&server= filters to the speed test results.
+    Raises ValueError for malformed dates.
     """
-    Exports up to the 100 most recent speed test results in either JSON or CSV format.
+    results = SpeedTestResult.objects.all()
+    if params.get('since'):
+        results = results.filter(timestamp__gte=_parse_datetime_param(params['since']))
+    if params.get('until'):
+        results = results.filter(timestamp__lt=_parse_datetime_param(params['until']))
+    if params.get('server'):
+        results = results.filter(server_name=params['server'])
+    return results
+
+
+def _next_chunk(rows):
+    return list(islice(rows, EXPORT_CHUNK_SIZE))
+
+
+async def _aiter_rows(queryset):
     """
-    results = SpeedTestResult.objects.all().order_by('-timestamp')[:100]
+    Async iterator over the rows of a values_list() queryset, fetched EXPORT_CHUNK_SIZE at a time
+    in the ORM's sync thread. QuerySet.aiterator() cannot be used: for values_list() querysets
+    it runs the query on the event loop and fails with SynchronousOnlyOperation.
+    """
+    rows = queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    while True:
+        chunk = await sync_to_async(_next_chunk)(rows)
+        for row in chunk:
+            yield row
+        if len(chunk) < EXPORT_CHUNK_SIZE:
+            return
+
+
+def _json_row(encoder, index, row):
+    return (',' if index else '') + encoder.encode(dict(zip(EXPORT_FIELDS, row)))
+
+
+def _stream_json(rows):
+    # Emits a JSON array one row at a time so the whole export never sits in memory
+    encoder = DjangoJSONEncoder()
+    yield '['
+    for i, row in enumerate(rows):
+        yield _json_row(encoder, i, row)
+    yield ']'
+
+
+async def _astream_json(rows):
+    encoder = DjangoJSONEncoder()
+    yield '['
+    i = 0
+    async for row in rows:
+        yield _json_row(encoder, i, row)
+        i += 1
+    yield ']'
 
-    if format == 'json':
-        # Converts the queryset to a list of dictionaries and returns it as a JSON response
-        data = list(results.values())
-        return JsonResponse(data, safe=False)
 
-    elif format == 'csv':
-        # Prepares a CSV file for download with appropriate headers
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="speedtest_results.csv"'
+CSV_HEADER = ['Timestamp', 'Download (Mbps)', 'Upload (Mbps)', 'Ping (ms)', 'Server Name', 'Location', 'Country',
+              'Anomaly']
+CSV_FIELDS = ['timestamp', 'download_speed', 'upload_speed', 'ping', 'server_name', 'server_location',
+              'server_country', 'is_anomaly']
 
-        writer = csv.writer(response)
-        writer.writerow(['Timestamp', 'Download (Mbps)', 'Upload (Mbps)', 'Ping (ms)', 'Server Name', 'Location', 'Country'])
 
-        # Writes each result row into the CSV file
-        for r in results:
-            writer.writerow([
-                r.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-                round(r.download_speed, 2),
-                round(r.upload_speed, 2),
-                round(r.ping, 2),
-                r.server_name,
-                r.server_location,
-                r.server_country
-            ])
-        return response
+def _csv_row(row):
+    timestamp, download_speed, upload_speed, ping, server_name, server_location, server_country, is_anomaly = row
+    return [
+        timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+        round(download_speed, 2),
+        round(upload_speed, 2),
+        round(ping, 2),
+        server_name,
+        server_location,
+        server_country,
+        is_anomaly
+    ]
+
+
+def _stream_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+    for row in rows:
+        yield writer.writerow(_csv_row(row))
+
+
+async def _astream_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+    async for row in rows:
+        yield writer.writerow(_csv_row(row))
+
+
+# Export format -> (sync stream, async stream, exported fields, content type, attachment file name)
+EXPORT_FORMATS = {
+    'json': (_stream_json, _astream_json, EXPORT_FIELDS, 'application/json', None),
+    'csv': (_stream_csv, _astream_csv, CSV_FIELDS, 'text/csv', 'speedtest_results.csv'),
+    'columnar': (write_snapshot, awrite_snapshot, COLUMNAR_FIELDS, 'application/octet-stream',
+                 'speedtest_results.stcol'),
+}
+
+
+async def export_results(request, format):
+    """
+    Streams all speed test results, newest first, in either JSON or CSV format, or as a
+    columnar binary snapshot, oldest first (see columnar.py and open_snapshot() for reading it).
+    Supports optional ?since=&until=&server= filters. Rows are read from the database
+    in chunks, so memory use stays flat regardless of the number of exported results.
+    Served through ASGI, the rows are read with the async ORM, so a long export or
+    a slow client holds no worker thread.
+    """
+    if format not in EXPORT_FORMATS:
+        # Returns an error if the requested format is unsupported
+        return HttpResponse("Invalid format", status=400)
+
+    try:
+        results = filter_results(request.GET).order_by('-timestamp')
+    except ValueError as e:
+        return HttpResponse(str(e), status=400)
+
+    stream, astream, fields, content_type, filename = EXPORT_FORMATS[format]
+    if format == 'columnar':
+        results = results.order_by('timestamp', 'id')
+    rows = results.values_list(*fields)
+    if isinstance(request, ASGIRequest):
+        content = astream(_aiter_rows(rows))
+    else:
+        # WSGI servers drain the response in a thread and would buffer an async stream whole
+        content = stream(rows.iterator(chunk_size=EXPORT_CHUNK_SIZE))
+    response = StreamingHttpResponse(content, content_type=content_type)
+    if filename:
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
 
-    # Returns an error if the requested format is unsupported
-    return HttpResponse("Invalid format", status=400)
\ No newline at end of file
+def stats(request):
+    """
+    Returns hourly or daily download/upload/ping statistics (count, min, max, mean, stddev).
+    Reads only the precomputed rollups, so the cost depends on the number of buckets,
+    not on the number of stored results. Supports ?granularity=hour|day&since=&until=&server=.
+    """
+    granularity = request.GET.get('granularity', SpeedTestRollup.GRANULARITY_HOUR)
+    if granularity not in dict(SpeedTestRollup.GRANULARITY_CHOICES):
+        return JsonResponse({'success': False, 'error': 'Invalid granularity'}, status=400)
+
+    rollups = SpeedTestRollup.objects.filter(granularity=granularity)
+    try:
+        if request.GET.get('since'):
+            since = bucket_start(_parse_datetime_param(request.GET['since']), granularity)
+            rollups = rollups.filter(bucket_start__gte=since)
+        if request.GET.get('until'):
+            rollups = rollups.filter(bucket_start__lt=_parse_datetime_param(request.GET['until']))
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    if request.GET.get('server'):
+        rollups = rollups.filter(server_name=request.GET['server'])
+
+    return JsonResponse({
+        'success': True,
+        'granularity': granularity,
+        'buckets': list(summarize_buckets(rollups))
+    })
+
+
+HISTORY_METRICS = ('download_speed', 'upload_speed', 'ping')
+
+
+def history(request):
+    """
+    Returns the history of one metric (?metric=download_speed|upload_speed|ping) as at most
+    ?points=N [timestamp, value] pairs for charting, downsampled on the server with
+    ?algorithm=lttb (Largest-Triangle-Three-Buckets, the default) or minmax.
+    Supports optional ?since=&until=&server= filters. Rows are streamed from the database
+    in timestamp order, so memory use depends on N, not on the size of the range.
+    """
+    metric = request.GET.get('metric', 'download_speed')
+    if metric not in HISTORY_METRICS:
+        return JsonResponse({'success': False, 'error': 'Invalid metric'}, status=400)
+    algorithm = request.GET.get('algorithm', 'lttb')
+    if algorithm not in ALGORITHMS:
+        return JsonResponse({'success': False, 'error': 'Invalid algorithm'}, status=400)
+    max_points = getattr(settings, 'SPEEDTEST_HISTORY_MAX_POINTS', 5000)
+    try:
+        points = int(request.GET.get('points', getattr(settings, 'SPEEDTEST_HISTORY_POINTS', 500)))
+    except ValueError:
+        points = 0
+    if not 3 <= points <= max_points:
+        return JsonResponse({'success': False, 'error': f'points must be between 3 and {max_points}'}, status=400)
+
+    try:
+        results = filter_results(request.GET)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    # Both passes of the downsampling have to see the same rows, so results saved meanwhile are left out
+    last_id = results.aggregate(last_id=Max('id'))['last_id'] or 0
+    results = results.filter(id__lte=last_id).order_by('timestamp', 'id')
+    total = results.count()
+
+    def rows():
+        return results.values_list('timestamp', metric).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+    return JsonResponse({
+        'success': True,
+        'metric': metric,
+        'algorithm': algorithm,
+        'total': total,
+        'points': [[timestamp, value] for timestamp, value in ALGORITHMS[algorithm](rows, total, points)],
+    })
+
+
+def percentiles(request):
+    """
+    Returns the p50/p90/p95/p99 of one metric (?metric=download_speed|upload_speed|ping) per
+    server or country (?group_by=server_name|server_country) over the last ?window= (e.g. 24h,
+    7d or 2w; default SPEEDTEST_PERCENTILES_WINDOW). Computed by the database in one grouped
+    query: exactly with percentile_cont on PostgreSQL, as P² estimates on SQLite.
+    """
+    metric = request.GET.get('metric', 'download_speed')
+    if metric not in HISTORY_METRICS:
+        return JsonResponse({'success': False, 'error': 'Invalid metric'}, status=400)
+    group_by = request.GET.get('group_by', 'server_name')
+    if group_by not in GROUP_BY:
+        return JsonResponse({'success': False, 'error': 'Invalid group_by'}, status=400)
+    window = request.GET.get('window') or getattr(settings, 'SPEEDTEST_PERCENTILES_WINDOW', '7d')
+    try:
+        since = timezone.now() - parse_window(window)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    results = SpeedTestResult.objects.filter(timestamp__gte=since)
+    return JsonResponse({
+        'success': True,
+        'metric': metric,
+        'group_by': group_by,
+        'window': window,
+        'exact': connection.vendor == 'postgresql',
+        'groups': compute_percentiles(results, metric, group_by),
+    })
+
+
+SINCE_FIELDS = ['id', 'timestamp', 'download_speed', 'upload_speed', 'ping', 'server_name', 'server_country',
+                'is_anomaly']
+
+
+async def _results_since(last_id, limit):
+    rows = SpeedTestResult.objects.filter(id__gt=last_id).order_by('id').values_list(*SINCE_FIELDS)[:limit]
+    return [list(row) async for row in rows]
+
+
+def _results_since_response(rows, last_id):
+    response = JsonResponse({
+        'last_id': rows[-1][0] if rows else last_id,
+        'fields': SINCE_FIELDS,
+        'results': rows,
+    })
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+async def results_since(request, last_id):
+    """
+    Returns the results with an id greater than last_id, in the order they were stored, as compact JSON:
+    {"last_id": N, "fields": [...], "results": [[...], ...]} with at most ?limit= rows.
+    With ?wait=N an empty answer is held back until a new result is stored or N seconds
+    (at most SPEEDTEST_LONG_POLL_MAX_WAIT) have passed, so idle clients can long-poll.
+    Only requests served through ASGI wait, where a waiting request holds no thread;
+    under WSGI the answer is always immediate.
+    """
+    max_limit = getattr(settings, 'SPEEDTEST_RESULTS_SINCE_MAX_ROWS', 500)
+    try:
+        limit = int(request.GET.get('limit', max_limit))
+        wait = float(request.GET.get('wait', 0))
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'limit and wait must be numbers'}, status=400)
+    if not 1 <= limit <= max_limit:
+        return JsonResponse({'success': False, 'error': f'limit must be between 1 and {max_limit}'}, status=400)
+    if not wait >= 0:
+        return JsonResponse({'success': False, 'error': 'wait must not be negative'}, status=400)
+    if not isinstance(request, ASGIRequest):
+        # A waiting WSGI request would hold a worker thread
+        wait = 0
+    wait = min(wait, getattr(settings, 'SPEEDTEST_LONG_POLL_MAX_WAIT', 30))
+    if not wait:
+        return _results_since_response(await _results_since(last_id, limit), last_id)
+
+    # Subscribed before the first query, so a result stored in between still wakes us up
+    event = result_notifier.subscribe()
+    try:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + wait
+        rows = await _results_since(last_id, limit)
+        while not rows and loop.time() < deadline:
+            try:
+                await asyncio.wait_for(event.wait(), deadline - loop.time())
+            except asyncio.TimeoutError:
+                break
+            event.clear()
+            rows = await _results_since(last_id, limit)
+    finally:
+        result_notifier.unsubscribe(event)
+
+    return _results_since_response(rows, last_id)
+
+
+JSON_LINES_CONTENT_TYPES = ('application/x-ndjson', 'application/jsonl', 'application/x-jsonlines')
+
+
+def _read_upload(request):
+    """
+    Reads the request body under SPEEDTEST_BULK_MAX_UPLOAD_BYTES rather than the site-wide
+    DATA_UPLOAD_MAX_MEMORY_SIZE, so only this endpoint accepts large uploads.
+    Raises RequestDataTooBig beyond the limit.
+    """
+    limit = getattr(settings, 'SPEEDTEST_BULK_MAX_UPLOAD_BYTES', BULK_MAX_UPLOAD_BYTES)
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        length = 0
+    if length > limit:
+        raise RequestDataTooBig(f"Upload is larger than {limit} bytes")
+    body = request.read(limit + 1)
+    if len(body) > limit:
+        raise RequestDataTooBig(f"Upload is larger than {limit} bytes")
+    return body
+
+
+def _request_body(request):
+    """
+    Returns the request body, decompressed when it was sent with "Content-Encoding: gzip".
+    Raises RequestDataTooBig when the upload exceeds SPEEDTEST_BULK_MAX_UPLOAD_BYTES or the
+    decompressed body exceeds SPEEDTEST_BULK_MAX_BYTES, and ValueError for a corrupt stream.
+    """
+    upload = _read_upload(request)
+    if request.headers.get('Content-Encoding', 'identity').lower() == 'identity':
+        return upload
+    limit = getattr(settings, 'SPEEDTEST_BULK_MAX_BYTES', BULK_MAX_BYTES)
+    decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+    try:
+        # Decompresses at most one byte past the limit, so a tiny "zip bomb" cannot exhaust the memory
+        body = decompressor.decompress(upload, limit + 1)
+    except zlib.error as e:
+        raise ValueError(f"Corrupt gzip data ({e})")
+    if len(body) > limit:
+        raise RequestDataTooBig(f"Decompressed body is larger than {limit} bytes")
+    if not decompressor.eof:
+        raise ValueError("Truncated gzip data")
+    return body
+
+
+def _read_bulk_records(request):
+    # A JSON array (or {"results": [...]}) of measurements, or one measurement per line for JSON Lines
+    body = _request_body(request)
+    if request.content_type in JSON_LINES_CONTENT_TYPES:
+        return [line for line in body.decode('utf-8').splitlines() if line.strip()]
+    data = json.loads(body)
+    if isinstance(data, dict):
+        data = data.get('results')
+    if not isinstance(data, list):
+        raise ValueError("Expected a JSON array of results")
+    return data
+
+
+@csrf_exempt
+def bulk_results(request):
+    """
+    Records a batch of measurements reported by remote probes, as JSON or JSON Lines.
+    The body may be gzip-compressed ("Content-Encoding: gzip"), as run_probe sends it.
+    Rows are validated in one pass, deduplicated by (probe_id, timestamp) and inserted
+    in a single transaction; the response lists the rejected rows with their errors.
+    Requires "Authorization: Bearer <SPEEDTEST_INGEST_TOKEN>"; without a configured token
+    the endpoint is disabled.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Method not allowed'}, status=405)
+
+    token = getattr(settings, 'SPEEDTEST_INGEST_TOKEN', '')
+    if not token:
+        return JsonResponse({'success': False, 'error': 'Bulk ingestion is disabled'}, status=403)
+    if not constant_time_compare(request.headers.get('Authorization', ''), f"Bearer {token}"):
+        return JsonResponse({'success': False, 'error': 'Unauthorized'}, status=401)
+
+    if request.headers.get('Content-Encoding', 'identity').lower() not in ('identity', 'gzip'):
+        return JsonResponse({'success': False, 'error': 'Unsupported Content-Encoding'}, status=415)
+    try:
+        records = _read_bulk_records(request)
+    except RequestDataTooBig as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=413)
+    except (ValueError, UnicodeDecodeError) as e:
+        return JsonResponse({'success': False, 'error': f"Invalid request body: {e}"}, status=400)
+
+    max_rows = getattr(settings, 'SPEEDTEST_BULK_MAX_ROWS', 50_000)
+    if len(records) > max_rows:
+        return JsonResponse({'success': False, 'error': f"At most {max_rows} rows per request"}, status=413)
+
+    try:
+        summary = ingest_records(records, batch_size=getattr(settings, 'SPEEDTEST_BULK_BATCH_SIZE', 1000))
+    except IntegrityError:
+        # Another request stored some of the same measurements concurrently; a retry skips them
+        return JsonResponse({'success': False, 'error': 'Conflicting concurrent upload, please retry'}, status=409)
+    return JsonResponse({'success': True, **summary})
+
+
+def metrics(request):
+    """
+    Publishes the phase timings of speed tests, job outcomes and per-view request counts,
+    errors and latencies of this process in the Prometheus text exposition format.
+    """
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
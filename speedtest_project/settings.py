@@ -5,6 +5,8 @@ Django settings for speedtest_project project.
 
 from pathlib import Path
 
+from speedtest_app import defaults
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -39,6 +41,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "speedtest_app.metrics.MetricsMiddleware",
 ]
 
 ROOT_URLCONF = "speedtest_project.urls"
@@ -115,3 +118,130 @@ STATIC_URL = "static/"
 
 # Default primary key field type
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+# Background speed test jobs: "thread" or "process" pool ("sync" runs jobs inline, for tests)
+SPEEDTEST_JOB_EXECUTOR = "thread"
+SPEEDTEST_JOB_WORKERS = 2
+
+
+# Append results to speedtest_results.jsonl (one JSON object per line) instead of
+# rewriting the speedtest_results.json array; see "manage.py convert_json_log"
+SPEEDTEST_JSON_LINES = defaults.JSON_LINES
+
+# Additionally create a BRIN index on SpeedTestResult.timestamp (PostgreSQL only,
+# applied by migration 0004); useful once the table holds millions of rows
+SPEEDTEST_TIMESTAMP_BRIN_INDEX = False
+
+# Turn the results table into monthly partitions on timestamp (PostgreSQL only, applied by
+# migration 0008). Run "manage.py create_partitions" regularly (e.g. daily from cron) to keep
+# SPEEDTEST_PARTITIONS_AHEAD months of partitions ready; "manage.py prune_results" drops
+# the months older than SPEEDTEST_RETENTION_MONTHS (None keeps everything).
+SPEEDTEST_PARTITIONED = False
+SPEEDTEST_PARTITIONS_AHEAD = 3
+SPEEDTEST_RETENTION_MONTHS = None
+
+# Thresholds of a "fast" connection, passed to SpeedTestAnalyzer
+SPEEDTEST_FAST_THRESHOLDS = {
+    "min_download": 50,  # Mbps
+    "min_upload": 20,  # Mbps
+    "max_ping": 50,  # ms
+}
+
+# Seconds the speedtest.net config, server list and best server are reused (0 disables
+# the cache), and the fraction of that age after which they are refreshed in the background
+SPEEDTEST_SERVER_CACHE_TTL = 3600
+SPEEDTEST_SERVER_CACHE_REFRESH = 0.8
+
+# Concurrent speed test requests join the test in progress instead of starting another
+# one; a finished result is also reused for SPEEDTEST_MIN_INTERVAL seconds (0 disables).
+# Queued/running jobs older than SPEEDTEST_JOB_STALE_AFTER seconds are no longer joined.
+SPEEDTEST_MIN_INTERVAL = 0
+SPEEDTEST_JOB_STALE_AFTER = 300
+
+# Stream live speed test progress to the page over Server-Sent Events. Enable only when
+# the site is served through speedtest_project.asgi (e.g. Uvicorn): under WSGI every open
+# stream would tie up a worker for the whole test. Keep-alive comments are sent every
+# SPEEDTEST_SSE_KEEPALIVE seconds while waiting for progress.
+SPEEDTEST_LIVE_PROGRESS = False
+SPEEDTEST_SSE_KEEPALIVE = 5
+
+# Bulk ingestion of results from remote probes (POST /results/bulk/). The endpoint is
+# disabled until a token is set; probes then send "Authorization: Bearer <token>".
+SPEEDTEST_INGEST_TOKEN = ""
+SPEEDTEST_BULK_MAX_ROWS = 50_000
+SPEEDTEST_BULK_BATCH_SIZE = 1000
+# Bulk uploads can be larger than Django's 2.5 MB DATA_UPLOAD_MAX_MEMORY_SIZE, which
+# still applies to every other view
+SPEEDTEST_BULK_MAX_UPLOAD_BYTES = defaults.BULK_MAX_UPLOAD_BYTES
+# Limit of a gzip-compressed upload (Content-Encoding: gzip) once decompressed
+SPEEDTEST_BULK_MAX_BYTES = defaults.BULK_MAX_BYTES
+
+# Result log files are written by a background thread in batches of up to
+# SPEEDTEST_LOG_BATCH_SIZE records, at least every SPEEDTEST_LOG_FLUSH_INTERVAL seconds.
+# Jobs of the "process" executor always write them directly
+SPEEDTEST_LOG_BUFFERED = defaults.LOG_BUFFERED
+SPEEDTEST_LOG_BATCH_SIZE = 100
+SPEEDTEST_LOG_FLUSH_INTERVAL = 1.0
+# The result logs are rotated once they reach SPEEDTEST_LOG_MAX_BYTES bytes or are older than
+# SPEEDTEST_LOG_MAX_AGE seconds (None disables either limit); closed segments are gzip-compressed
+# and listed with their time range in "<log>.manifest.json"
+SPEEDTEST_LOG_MAX_BYTES = None
+SPEEDTEST_LOG_MAX_AGE = None
+
+# The rendered index page is cached until a new result is stored. The default local-memory
+# cache is per process: when results are saved by other processes (the "process" job executor,
+# several web workers, probes), point SPEEDTEST_PAGE_CACHE at a shared cache such as
+# django.core.cache.backends.filebased.FileBasedCache so that they all see the invalidation.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+}
+SPEEDTEST_PAGE_CACHE = "default"
+SPEEDTEST_PAGE_CACHE_TIMEOUT = 24 * 3600
+
+# Default and maximum number of points returned by /history/ for charting
+SPEEDTEST_HISTORY_POINTS = 500
+SPEEDTEST_HISTORY_MAX_POINTS = 5000
+
+# Time window of /percentiles/ when the request does not give one (e.g. 24h, 7d or 2w)
+SPEEDTEST_PERCENTILES_WINDOW = '7d'
+
+# /results/since/<id>/ returns at most this many rows per request and holds an empty
+# long-poll (?wait=N) for at most SPEEDTEST_LONG_POLL_MAX_WAIT seconds. On PostgreSQL
+# every process LISTENs for the NOTIFY sent with each new result, so results stored by
+# job workers or other web workers wake the waiting requests too.
+SPEEDTEST_RESULTS_SINCE_MAX_ROWS = 500
+SPEEDTEST_LONG_POLL_MAX_WAIT = 30
+# Let the home page long-poll for new results. Enable only when the site is served through
+# speedtest_project.asgi: under WSGI every open page would tie up a worker (requests that
+# are not served through ASGI never wait). Without it the page polls every
+# SPEEDTEST_RESULTS_POLL_INTERVAL seconds.
+SPEEDTEST_LONG_POLL = False
+SPEEDTEST_RESULTS_POLL_INTERVAL = 30
+SPEEDTEST_RESULTS_LISTEN = True
+
+# Every result is compared with an exponentially weighted baseline (smoothing factor
+# SPEEDTEST_ANOMALY_ALPHA) of its server and flagged as an anomaly when download or upload
+# fall, or ping rises, by more than SPEEDTEST_ANOMALY_THRESHOLD standard deviations and by
+# at least SPEEDTEST_ANOMALY_MIN_CHANGE of the mean. New servers are not judged before they
+# have SPEEDTEST_ANOMALY_MIN_SAMPLES results.
+SPEEDTEST_ANOMALY_ALPHA = 0.1
+SPEEDTEST_ANOMALY_THRESHOLD = 3.0
+SPEEDTEST_ANOMALY_MIN_CHANGE = 0.2
+SPEEDTEST_ANOMALY_MIN_SAMPLES = 10
+
+# Headless probe agent (manage.py run_probe). Measurements run every SPEEDTEST_PROBE_INTERVAL
+# seconds plus a random delay of up to SPEEDTEST_PROBE_JITTER seconds, are spooled to
+# SPEEDTEST_PROBE_SPOOL_DIR (at most SPEEDTEST_PROBE_SPOOL_MAX_BYTES; the oldest unsent results
+# are dropped beyond that) and uploaded in gzip-compressed batches of SPEEDTEST_PROBE_BATCH_SIZE
+# to the /results/bulk/ endpoint of SPEEDTEST_PROBE_CENTRAL_URL with SPEEDTEST_PROBE_TOKEN.
+# The probe id defaults to the host name.
+SPEEDTEST_PROBE_ID = ""
+SPEEDTEST_PROBE_CENTRAL_URL = ""
+SPEEDTEST_PROBE_TOKEN = ""
+SPEEDTEST_PROBE_INTERVAL = 3600
+SPEEDTEST_PROBE_JITTER = 300
+SPEEDTEST_PROBE_SPOOL_DIR = BASE_DIR / "probe_spool"
+SPEEDTEST_PROBE_SPOOL_MAX_BYTES = 16 * 1024 * 1024
+SPEEDTEST_PROBE_BATCH_SIZE = 500